@@ -0,0 +1,147 @@
+import re
+
+from utils import dicts
+from utils import map_actions as ma
+from utils import regular_expressions as rege
+
+
+def compile_for_search(pattern: str):
+    """
+    Compila uma expressão regular usada apenas para verificar se ela ocorre em uma string (re.search).
+    O prefixo .* é removido: não altera o resultado da verificação e impede a busca rápida pelo prefixo literal
+
+    @param pattern: expressão regular
+    @return: expressão compilada
+    """
+    if pattern.startswith('.*') and pattern[2:3] not in {'?', '+', '*', '{'}:
+        pattern = pattern[2:]
+    return re.compile(pattern)
+
+
+def compile_any(patterns: list):
+    """
+    Compila uma lista de expressões regulares em uma alternação única, que ocorre em uma string
+    se e somente se alguma das expressões ocorrer
+
+    @param patterns: lista de expressões regulares
+    @return: expressão compilada
+    """
+    return compile_for_search('|'.join(['(?:%s)' % compile_for_search(p).pattern for p in patterns]))
+
+
+def compile_all(patterns: dict):
+    """
+    Compila um dicionário de expressões regulares, mantendo os nomes
+
+    @param patterns: dicionário de nome para expressão regular
+    @return: dicionário de nome para expressão compilada
+    """
+    return {k: compile_for_search(v) for k, v in patterns.items()}
+
+
+# Detecta URLs da versão nova dos sites SciELO
+NEW_URL_FORMAT = compile_any([rege.REGEX_NEW_SCL_JOURNAL_ARTICLE_ABSTRACT,
+                              rege.REGEX_NEW_SCL_JOURNAL_ARTICLE,
+                              rege.REGEX_NEW_SCL_JOURNAL_FEED,
+                              rege.REGEX_NEW_SCL_JOURNAL_GRID,
+                              rege.REGEX_NEW_SCL_JOURNAL_TOC,
+                              rege.REGEX_NEW_SCL_JOURNAL,
+                              rege.REGEX_NEW_SCL_JOURNALS_ALFAPHETIC,
+                              rege.REGEX_NEW_SCL_JOURNALS_THEMATIC,
+                              rege.REGEX_NEW_SCL_RAW])
+
+# Tipos de Hit de URLs da versão nova dos sites SciELO, na ordem de avaliação
+NEW_URL_HIT_TYPES = [(ma.HIT_TYPE_ARTICLE, compile_any([rege.REGEX_NEW_SCL_JOURNAL_ARTICLE,
+                                                        rege.REGEX_NEW_SCL_RAW])),
+                     (ma.HIT_TYPE_JOURNAL, compile_any([rege.REGEX_NEW_SCL_JOURNAL_FEED,
+                                                        rege.REGEX_NEW_SCL_JOURNAL_GRID,
+                                                        rege.REGEX_NEW_SCL_JOURNAL_TOC,
+                                                        rege.REGEX_NEW_SCL_JOURNAL])),
+                     (ma.HIT_TYPE_PLATFORM, compile_any([rege.REGEX_NEW_SCL_JOURNALS_ALFAPHETIC,
+                                                         rege.REGEX_NEW_SCL_JOURNALS_THEMATIC]))]
+
+# Expressões usadas na obtenção do tipo de conteúdo de URLs da versão nova dos sites SciELO
+NEW_URL_CONTENT = compile_all({'abstract': rege.REGEX_NEW_SCL_JOURNAL_ARTICLE_ABSTRACT,
+                               'article': rege.REGEX_NEW_SCL_JOURNAL_ARTICLE,
+                               'raw': rege.REGEX_NEW_SCL_RAW,
+                               'feed': rege.REGEX_NEW_SCL_JOURNAL_FEED,
+                               'grid': rege.REGEX_NEW_SCL_JOURNAL_GRID,
+                               'toc': rege.REGEX_NEW_SCL_JOURNAL_TOC,
+                               'journal': rege.REGEX_NEW_SCL_JOURNAL,
+                               'alphabetic': rege.REGEX_NEW_SCL_JOURNALS_ALFAPHETIC,
+                               'thematic': rege.REGEX_NEW_SCL_JOURNALS_THEMATIC})
+
+# Usada para extrair grupos, por isso é compilada sem alterações
+NEW_URL_RAW_DETAIL = re.compile(rege.REGEX_NEW_SCL_RAW_DETAIL)
+
+# Tipos de Hit de URLs do site SciELO Public Health, na ordem de avaliação
+SSP_HIT_TYPES = [(ma.HIT_TYPE_ARTICLE, compile_any([rege.REGEX_SSP_JOURNAL_ARTICLE_HTML,
+                                                    rege.REGEX_SSP_JOURNAL_ARTICLE_PDF,
+                                                    rege.REGEX_SSP_JOURNAL_ARTICLE_MEDIA_ASSETS])),
+                 (ma.HIT_TYPE_JOURNAL, compile_any([rege.REGEX_SSP_JOURNAL_ABOUT,
+                                                    rege.REGEX_SSP_JOURNAL_GRID,
+                                                    rege.REGEX_SSP_JOURNAL_FEED])),
+                 (ma.HIT_TYPE_ISSUE, compile_any([rege.REGEX_SSP_JOURNAL_ISSUE,
+                                                  rege.REGEX_SSP_JOURNAL_FEED_ISSUE])),
+                 (ma.HIT_TYPE_PLATFORM, compile_any([rege.REGEX_SSP_PLATFORM_ABOUT,
+                                                     rege.REGEX_SSP_JOURNALS_THEMATIC,
+                                                     rege.REGEX_SSP_JOURNALS_ALPHABETIC,
+                                                     rege.REGEX_SSP_PLATFORM]))]
+
+# Expressões usadas na obtenção do tipo de conteúdo de URLs do site SciELO Public Health
+SSP_CONTENT = compile_all({'article_html': rege.REGEX_SSP_JOURNAL_ARTICLE_HTML,
+                           'article_pdf': rege.REGEX_SSP_JOURNAL_ARTICLE_PDF,
+                           'media_assets': rege.REGEX_SSP_JOURNAL_ARTICLE_MEDIA_ASSETS,
+                           'issue': rege.REGEX_SSP_JOURNAL_ISSUE,
+                           'feed_issue': rege.REGEX_SSP_JOURNAL_FEED_ISSUE,
+                           'feed': rege.REGEX_SSP_JOURNAL_FEED,
+                           'grid': rege.REGEX_SSP_JOURNAL_GRID,
+                           'about': rege.REGEX_SSP_JOURNAL_ABOUT,
+                           'journal': rege.REGEX_SSP_JOURNAL,
+                           'alphabetic': rege.REGEX_SSP_JOURNALS_ALPHABETIC,
+                           'thematic': rege.REGEX_SSP_JOURNALS_THEMATIC,
+                           'platform_about': rege.REGEX_SSP_PLATFORM_ABOUT})
+
+# Detectam nome e caminho de arquivo pdf
+PDF_FILE = compile_for_search(rege.REGEX_PDF)
+PDF_PATH = compile_for_search(rege.REGEX_ARTICLE_PDF_PATH)
+
+ISSUE_PID = re.compile(rege.REGEX_ISSUE_PID)
+JOURNAL_PID = re.compile(rege.REGEX_JOURNAL_PID)
+
+# Expressões de URLs clássicas, formatadas com o domínio da coleção
+CLASSIC_URL_PATTERNS = {'sclphp': ma.ACTION_SCLBR_SCLPHP,
+                        'article_plus': ma.ACTION_SCLBR_ARTICLE_PLUS,
+                        'pdf': ma.ACTION_SCLBR_PDF,
+                        'readcube_epdf': ma.ACTION_SCLBR_READCUBE_EPDF,
+                        'sclorg_php': ma.ACTION_SCLBR_SCLORG_PHP,
+                        'rss': ma.ACTION_SCLBR_RSS,
+                        'revistas': ma.ACTION_SCLBR_REVISTAS,
+                        'google_metrics': ma.ACTION_SCLBR_GOOGLE_METRICS_H5_M5,
+                        'img': ma.ACTION_SCLBR_IMG,
+                        'statjournal': ma.ACTION_SCLBR_STATJOURNAL,
+                        'avaliacao': ma.ACTION_SCLBR_AVALIACAO,
+                        'equipe': ma.ACTION_SCLBR_EQUIPE}
+
+# Expressões de URLs clássicas por coleção, compiladas uma única vez
+_classic_url_content = {}
+
+
+def get_classic_url_content(collection: str):
+    """
+    Obtém as expressões de URLs clássicas de uma coleção, compiladas para cada domínio da coleção.
+    Todas as expressões de um domínio começam pelo próprio domínio. Logo, apenas o primeiro domínio que ocorre
+    na URL precisa ser avaliado
+
+    @param collection: acrônimo da coleção
+    @return: um par (expressão que detecta os domínios, lista de dicionários de expressões, um por domínio)
+    """
+    if collection not in _classic_url_content:
+        possible_domains = dicts.collection_to_domain.get(collection, [])
+
+        domains_content = [compile_all({k: v.format(scl_domain) for k, v in CLASSIC_URL_PATTERNS.items()}) for scl_domain in possible_domains]
+        domains_any = compile_any(possible_domains) if possible_domains else None
+
+        _classic_url_content[collection] = (domains_any, [(compile_for_search(d), c) for d, c in zip(possible_domains, domains_content)])
+
+    return _classic_url_content[collection]
@@ -0,0 +1,289 @@
+import struct
+import sys
+import zlib
+
+from array import array
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Formato colunar compacto para tabelas de strings.
+# O arquivo é composto por um cabeçalho (MAGIC + nomes das colunas) e por uma sequência de blocos.
+# Cada bloco armazena até block_size linhas e é comprimido de forma independente.
+# Cada coluna é codificada por dicionário: o bloco traz apenas os valores ainda não vistos no arquivo
+# e, para cada linha, o índice do valor no dicionário da coluna.
+# Um arquivo pode conter segmentos concatenados (cabeçalho seguido de blocos), gravados em modo de acréscimo por
+# sucessivos ColumnarWriter. Ao encontrar um novo cabeçalho, o leitor reinicia os dicionários das colunas.
+
+MAGIC = b'SCC1'
+
+BLOCK_CODEC_NONE = 0
+BLOCK_CODEC_ZLIB = 1
+BLOCK_CODEC_ZSTD = 2
+
+DEFAULT_BLOCK_SIZE = 65536
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Quantidade máxima de valores no dicionário de uma coluna. Ao ser excedida, o dicionário é reiniciado
+MAX_DICTIONARY_SIZE = 1 << 20
+
+_STRUCT_BLOCK_HEADER = struct.Struct('<BI')
+_STRUCT_UINT32 = struct.Struct('<I')
+_STRUCT_UINT16 = struct.Struct('<H')
+
+_IS_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def _get_index_typecode(dictionary_size):
+    if dictionary_size <= 0xFF:
+        return 'B'
+    if dictionary_size <= 0xFFFF:
+        return 'H'
+    return 'I'
+
+
+def _to_bytes(values: array):
+    if _IS_BIG_ENDIAN and values.itemsize > 1:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if _IS_BIG_ENDIAN and values.itemsize > 1:
+        values.byteswap()
+    return values
+
+
+class ColumnarWriter:
+    """
+    Escreve linhas (tuplas de strings) em formato colunar, comprimido e codificado por dicionário
+    """
+    def __init__(self, fileobj, columns, block_size=DEFAULT_BLOCK_SIZE, codec=BLOCK_CODEC_ZLIB):
+        if codec == BLOCK_CODEC_ZSTD and zstandard is None:
+            raise ImportError('Compressão zstd exige o pacote zstandard')
+
+        self.fileobj = fileobj
+        self.columns = list(columns)
+        self.block_size = block_size
+        self.codec = codec
+
+        self._dictionaries = [{} for _ in self.columns]
+        self._rows = []
+        self._zstd_compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL) if codec == BLOCK_CODEC_ZSTD else None
+
+        self._write_header()
+
+    def _write_header(self):
+        self.fileobj.write(MAGIC)
+        self.fileobj.write(_STRUCT_UINT16.pack(len(self.columns)))
+        for c in self.columns:
+            encoded_name = c.encode('utf-8')
+            self.fileobj.write(_STRUCT_UINT16.pack(len(encoded_name)))
+            self.fileobj.write(encoded_name)
+
+    def write_rows(self, rows):
+        """
+        Adiciona linhas ao bloco corrente. O bloco é gravado assim que atinge block_size linhas
+
+        @param rows: lista de tuplas de strings, na ordem de self.columns
+        """
+        self._rows.extend(rows)
+        while len(self._rows) >= self.block_size:
+            self._write_block(self._rows[:self.block_size])
+            del self._rows[:self.block_size]
+
+    def _encode_column(self, col_index, values):
+        dictionary = self._dictionaries[col_index]
+
+        reset = 0
+        if len(dictionary) > MAX_DICTIONARY_SIZE:
+            dictionary.clear()
+            reset = 1
+
+        new_values = []
+        indexes = []
+        for v in values:
+            i = dictionary.get(v)
+            if i is None:
+                i = len(dictionary)
+                dictionary[v] = i
+                new_values.append(v)
+            indexes.append(i)
+
+        encoded_new_values = [v.encode('utf-8', errors='ignore') for v in new_values]
+        typecode = _get_index_typecode(len(dictionary))
+
+        return b''.join([bytes([reset]),
+                         _STRUCT_UINT32.pack(len(encoded_new_values)),
+                         _to_bytes(array('I', [len(v) for v in encoded_new_values])),
+                         b''.join(encoded_new_values),
+                         typecode.encode('ascii'),
+                         _to_bytes(array(typecode, indexes))])
+
+    def _write_block(self, rows):
+        payload = [_STRUCT_UINT32.pack(len(rows))]
+        for col_index, values in enumerate(zip(*rows)):
+            payload.append(self._encode_column(col_index, values))
+        payload = b''.join(payload)
+
+        if self.codec == BLOCK_CODEC_ZLIB:
+            payload = zlib.compress(payload, ZLIB_LEVEL)
+        elif self.codec == BLOCK_CODEC_ZSTD:
+            payload = self._zstd_compressor.compress(payload)
+
+        self.fileobj.write(_STRUCT_BLOCK_HEADER.pack(self.codec, len(payload)))
+        self.fileobj.write(payload)
+
+    def close(self):
+        if self._rows:
+            self._write_block(self._rows)
+            self._rows = []
+        self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _PrefixedReader:
+    """
+    Lê, antes do conteúdo de um arquivo, bytes que já foram consumidos dele
+    """
+    def __init__(self, prefix, fileobj):
+        self.prefix = prefix
+        self.fileobj = fileobj
+
+    def read(self, size):
+        data = self.prefix[:size]
+        self.prefix = self.prefix[size:]
+        if len(data) < size:
+            data += self.fileobj.read(size - len(data))
+        return data
+
+
+class ColumnarReader:
+    """
+    Lê, bloco a bloco, linhas (tuplas de strings) gravadas por ColumnarWriter
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.columns = self._read_header()
+        self._dictionaries = [[] for _ in self.columns]
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+    def _read_exactly(self, size):
+        data = self.fileobj.read(size)
+        if len(data) != size:
+            raise ValueError('Arquivo colunar truncado')
+        return data
+
+    def _read_header(self):
+        if self.fileobj.read(len(MAGIC)) != MAGIC:
+            raise ValueError('Arquivo não está em formato colunar')
+
+        n_columns, = _STRUCT_UINT16.unpack(self._read_exactly(_STRUCT_UINT16.size))
+        columns = []
+        for _ in range(n_columns):
+            name_size, = _STRUCT_UINT16.unpack(self._read_exactly(_STRUCT_UINT16.size))
+            columns.append(self._read_exactly(name_size).decode('utf-8'))
+        return columns
+
+    def _decode_column(self, col_index, payload, offset, n_rows):
+        dictionary = self._dictionaries[col_index]
+
+        if payload[offset]:
+            dictionary.clear()
+        offset += 1
+
+        n_new_values, = _STRUCT_UINT32.unpack_from(payload, offset)
+        offset += _STRUCT_UINT32.size
+
+        sizes = _from_bytes('I', payload[offset:offset + 4 * n_new_values])
+        offset += 4 * n_new_values
+
+        for s in sizes:
+            dictionary.append(payload[offset:offset + s].decode('utf-8', errors='ignore'))
+            offset += s
+
+        typecode = chr(payload[offset])
+        offset += 1
+
+        index_size = array(typecode).itemsize * n_rows
+        indexes = _from_bytes(typecode, payload[offset:offset + index_size])
+        offset += index_size
+
+        return [dictionary[i] for i in indexes], offset
+
+    def _read_block(self):
+        header = self.fileobj.read(_STRUCT_BLOCK_HEADER.size)
+        if not header:
+            return
+
+        # Início de um novo segmento, acrescentado ao arquivo por outro ColumnarWriter
+        while header[:1] == MAGIC[:1]:
+            self.fileobj = _PrefixedReader(header, self.fileobj)
+            if self._read_header() != self.columns:
+                raise ValueError('Segmentos do arquivo colunar possuem colunas distintas')
+            self.fileobj = self.fileobj.fileobj
+            self._dictionaries = [[] for _ in self.columns]
+
+            header = self.fileobj.read(_STRUCT_BLOCK_HEADER.size)
+            if not header:
+                return
+
+        if len(header) != _STRUCT_BLOCK_HEADER.size:
+            raise ValueError('Arquivo colunar truncado')
+
+        codec, payload_size = _STRUCT_BLOCK_HEADER.unpack(header)
+        payload = self._read_exactly(payload_size)
+
+        if codec == BLOCK_CODEC_ZLIB:
+            payload = zlib.decompress(payload)
+        elif codec == BLOCK_CODEC_ZSTD:
+            if self._zstd_decompressor is None:
+                raise ImportError('Descompressão zstd exige o pacote zstandard')
+            payload = self._zstd_decompressor.decompress(payload)
+
+        n_rows, = _STRUCT_UINT32.unpack_from(payload, 0)
+        offset = _STRUCT_UINT32.size
+
+        columns_values = []
+        for col_index in range(len(self.columns)):
+            values, offset = self._decode_column(col_index, payload, offset, n_rows)
+            columns_values.append(values)
+
+        return list(zip(*columns_values))
+
+    def iter_blocks(self):
+        """
+        Obtém as linhas do arquivo, bloco a bloco
+
+        @return: gerador de listas de tuplas de strings
+        """
+        while True:
+            rows = self._read_block()
+            if rows is None:
+                break
+            yield rows
+
+    def __iter__(self):
+        for rows in self.iter_blocks():
+            yield from rows
+
+    def close(self):
+        self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
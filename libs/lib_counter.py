@@ -12,16 +12,14 @@ def _extract_user_agent(browser_name: str, browser_version: str):
     return '/'.join([browser_name, browser_version])
 
 
-def _extract_slice(date: datetime):
+def extract_slice(date: datetime):
     """
     Extrai uma fatia no formato YYYY-MM-DD|H
 
     :param date: um elemento datetime
     :return: uma str no formato YYYY-MM-DD|H
     """
-    str_date = '-'.join([str(x) for x in [date.year, date.month, date.day]])
-    str_hour_slice = str(date.hour)
-    return '|'.join([str_date, str_hour_slice])
+    return '%d-%d-%d|%d' % (date.year, date.month, date.day, date.hour)
 
 
 def generate_session_id(ip: str, browser_name: str, browser_version: str, date: datetime):
@@ -34,7 +32,19 @@ def generate_session_id(ip: str, browser_name: str, browser_version: str, date:
     :param date: data e hora
     :return: uma str que representa um ID de sessão
     """
-    date_slice = _extract_slice(date)
+    return generate_session_id_from_slice(ip, browser_name, browser_version, extract_slice(date))
+
+
+def generate_session_id_from_slice(ip: str, browser_name: str, browser_version: str, date_slice: str):
+    """
+    Gera um ID de sessão a partir de uma fatia de data e hora previamente extraída
+
+    :param ip: endereço IP
+    :param browser_name: nome do navegador
+    :param browser_version: versão do navegador
+    :param date_slice: uma str no formato YYYY-MM-DD|H, obtida por extract_slice
+    :return: uma str que representa um ID de sessão
+    """
     user_agent = _extract_user_agent(browser_name, browser_version)
     return '|'.join([ip, user_agent, date_slice])
 
@@ -50,7 +60,7 @@ def is_double_click(group, past_hit, current_hit):
     :param current_hit: ação atual
     :return: True se for duplo-clique, False caso contrário
     """
-    time_delta = current_hit.server_time - past_hit.server_time
+    time_delta = current_hit.server_timestamp - past_hit.server_timestamp
 
     if group == 'article':
         if (past_hit.pid,
@@ -61,7 +71,7 @@ def is_double_click(group, past_hit, current_hit):
                                current_hit.content_type,
                                current_hit.lang):
 
-            if time_delta.total_seconds() <= 30:
+            if time_delta <= 30:
                 return True
 
     if group == 'issue' or group == 'journal':
@@ -70,14 +80,14 @@ def is_double_click(group, past_hit, current_hit):
             past_hit.content_type) == (current_hit.issn,
                                        current_hit.pid,
                                        current_hit.content_type):
-            if time_delta.total_seconds() <= 30:
+            if time_delta <= 30:
                 return True
 
     if group == 'platform' or group == 'others':
         if (past_hit.content_type,
             past_hit.action_name) == (current_hit.content_type,
                                       current_hit.action_name):
-            if time_delta.total_seconds() <= 30:
+            if time_delta <= 30:
                 return True
 
     return False
@@ -1,8 +1,11 @@
 import datetime
 import logging
+import os
+import tempfile
 
 from libs.lib_status import DATE_STATUS_LOADED
-from sqlalchemy import create_engine, and_, or_
+from sqlalchemy import create_engine, and_, or_, text, true, exists, select, Column, MetaData, Table, UniqueConstraint
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.exc import OperationalError, IntegrityError
 from sqlalchemy.sql import func
 from sqlalchemy.orm import sessionmaker
@@ -275,6 +278,488 @@ def get_last_id(db_session, table_class):
     return db_session.query(func.max(table_class.id)).scalar()
 
 
+def mount_issn_map(session, last_id=0, issn_map=None):
+    """
+    Cria mapa de ISSN chave para ISSN valor, com base na banco de dados COUNTER
+    :param session: Sessão de conexão com banco de dados COUNTER
+    :param last_id: considera apenas periódicos com ID maior que last_id
+    :param issn_map: mapa a ser completado. Caso seja None, um novo mapa é criado
+    :return: Um dicionário que mapeia ISSN-Valor a ISSN-Chave da tabela counter_journal
+    """
+    if issn_map is None:
+        issn_map = {}
+
+    new_issn_map = {}
+    for j_id, pid_issn, online_issn, print_issn in session.query(Journal.id, Journal.pid_issn, Journal.online_issn, Journal.print_issn).filter(Journal.id > last_id):
+        issns = [i for i in [pid_issn,
+                 online_issn,
+                 print_issn] if i != '']
+        for i in issns:
+            if i not in new_issn_map:
+                new_issn_map[i] = j_id
+            else:
+                if new_issn_map[i] != j_id:
+                    logging.error('Base de periódicos está inconsistente (%s -> %s,  %s -> %s)'
+                                  % (i, j_id, i, new_issn_map[i]))
+
+    issn_map.update(new_issn_map)
+    return issn_map
+
+
+def mount_localization_map(session, last_id=0, localization_map=None):
+    """
+    Cria mapa de (latitude, longitude) para ID de localização na base de dados
+    :param session: Sessão de conexão com banco de dados COUNTER
+    :param last_id: considera apenas localizações com ID maior que last_id
+    :param localization_map: mapa a ser completado. Caso seja None, um novo mapa é criado
+    :return: Um dicionário que mapeia (latitude, longitude) a ID de localização
+    """
+    if localization_map is None:
+        localization_map = {}
+
+    for m_id, latitude, longitude in session.query(Localization.id, Localization.latitude, Localization.longitude).filter(Localization.id > last_id):
+        localization_map[(latitude, longitude)] = m_id
+    return localization_map
+
+
+def mount_format_map(session, last_id=0, format_map=None):
+    """
+    Cria mapa de nome de formato para ID de formato na base de dados
+    :param session: Sessão de conexão com banco de dados COUNTER
+    :param last_id: considera apenas formatos com ID maior que last_id
+    :param format_map: mapa a ser completado. Caso seja None, um novo mapa é criado
+    :return: Um dicionário que mapeia nome de formato a ID de formato
+    """
+    if format_map is None:
+        format_map = {}
+
+    for format_code, format_name in session.query(ArticleFormat.id, ArticleFormat.format).filter(ArticleFormat.id > last_id):
+        format_map[format_name] = format_code
+
+    return format_map
+
+
+def mount_pid_map(session, last_id=0, pid_map=None):
+    """
+    Cria mapa de PID e COLLECTION ACRONYM a ID na base de dados
+    :param session: Sessão de conexão com banco de dados COUNTER
+    :param last_id: considera apenas artigos com ID maior que last_id
+    :param pid_map: mapa a ser completado. Caso seja None, um novo mapa é criado
+    :return: Um dicionário que mapeia PID e COLLECTION a ID
+    """
+    if pid_map is None:
+        pid_map = {}
+
+    for article_id, article_pid, article_collection in session.query(Article.id, Article.pid, Article.collection).filter(Article.id > last_id):
+        pid_map[(article_pid, article_collection)] = article_id
+
+    return pid_map
+
+
+def mount_language_map(session, last_id=0, language_map=None):
+    """
+    Cria mapa de nome de idioma para ID de idioma na base de dados
+    :param session: Sessão de conexão com banco de dados COUNTER
+    :param last_id: considera apenas idiomas com ID maior que last_id
+    :param language_map: mapa a ser completado. Caso seja None, um novo mapa é criado
+    :return: Um dicionário que mapeia nome de idioma a ID de idioma
+    """
+    if language_map is None:
+        language_map = {}
+
+    for language_id, language_name in session.query(ArticleLanguage.id, ArticleLanguage.language).filter(ArticleLanguage.id > last_id):
+        language_map[language_name] = language_id
+
+    return language_map
+
+
+def get_journals_ids(db_session, issns):
+    """
+    Obtém, em uma única consulta, os IDs dos periódicos associados a uma lista de ISSNs.
+    ISSNs impresso e eletrônico vazios são desconsiderados
+
+    :param db_session: sessão de conexão com banco de dados
+    :param issns: lista de ISSNs
+    :return: um dicionário que mapeia ISSN a ID de periódico
+    """
+    issns = set(issns)
+    journals_ids = {}
+
+    for j in db_session.query(Journal).filter(or_(Journal.pid_issn.in_(issns),
+                                                  Journal.online_issn.in_(issns),
+                                                  Journal.print_issn.in_(issns))):
+        for i in [j.pid_issn, j.online_issn, j.print_issn]:
+            if i in issns and i not in journals_ids and (i != '' or i == j.pid_issn):
+                journals_ids[i] = j.id
+
+    return journals_ids
+
+
+def get_articles_ids(db_session, pids, collection):
+    """
+    Obtém, em uma única consulta, os IDs dos artigos de uma coleção associados a uma lista de PIDs
+
+    :param db_session: sessão de conexão com banco de dados
+    :param pids: lista de PIDs
+    :param collection: acrônimo da coleção
+    :return: um dicionário que mapeia PID a ID de artigo
+    """
+    return {pid: article_id for article_id, pid in db_session.query(Article.id, Article.pid).filter(
+        and_(Article.collection == collection,
+             Article.pid.in_(set(pids))))}
+
+
+def get_localizations_ids(db_session, localizations):
+    """
+    Obtém, em uma única consulta, os IDs de uma lista de pares (latitude, longitude)
+
+    :param db_session: sessão de conexão com banco de dados
+    :param localizations: lista de pares (latitude, longitude)
+    :return: um dicionário que mapeia (latitude, longitude) a ID de localização
+    """
+    conditions = [and_(Localization.latitude == latitude, Localization.longitude == longitude) for latitude, longitude in localizations]
+    if not conditions:
+        return {}
+
+    return {(m.latitude, m.longitude): m.id for m in db_session.query(Localization).filter(or_(*conditions))}
+
+
+def get_formats_ids(db_session, formats):
+    """
+    Obtém, em uma única consulta, os IDs de uma lista de formatos
+
+    :param db_session: sessão de conexão com banco de dados
+    :param formats: lista de nomes de formato
+    :return: um dicionário que mapeia formato a ID
+    """
+    return {f: f_id for f_id, f in db_session.query(ArticleFormat.id, ArticleFormat.format).filter(ArticleFormat.format.in_(set(formats)))}
+
+
+def get_languages_ids(db_session, languages):
+    """
+    Obtém, em uma única consulta, os IDs de uma lista de idiomas
+
+    :param db_session: sessão de conexão com banco de dados
+    :param languages: lista de nomes abreviados de idioma
+    :return: um dicionário que mapeia idioma a ID
+    """
+    return {l: l_id for l_id, l in db_session.query(ArticleLanguage.id, ArticleLanguage.language).filter(ArticleLanguage.language.in_(set(languages)))}
+
+
+def get_or_create_many(db_session, table_class, dimension_map, values, get_ids, make_row, batch_size=1000, lookup_first=False):
+    """
+    Completa um mapa de dimensão com os IDs dos valores ausentes, inserindo os que não existem na base de dados.
+    Para cada lote de batch_size valores ausentes do mapa, são feitos um único INSERT IGNORE e uma única consulta
+    aos IDs dos valores do lote, sem depender de RETURNING ou de lastrowid. Assim, o número de comandos não depende
+    do número de valores novos
+
+    :param db_session: sessão de conexão com banco de dados
+    :param table_class: uma classe que representa a tabela da dimensão
+    :param dimension_map: dicionário que mapeia valor a ID na base de dados
+    :param values: valores necessários
+    :param get_ids: função (db_session, valores) que obtém um dicionário valor -> ID
+    :param make_row: função que converte um valor em um dicionário coluna -> valor
+    :param batch_size: número máximo de valores por comando
+    :param lookup_first: consulta os valores antes de inseri-los. Necessário quando a restrição de unicidade da tabela
+    não corresponde ao valor procurado (por exemplo, um ISSN pode ser o ISSN impresso ou eletrônico de um periódico)
+    :return: lista dos valores ausentes do mapa para os quais houve inserção
+    """
+    missing_values = [v for v in dict.fromkeys(values) if v not in dimension_map]
+    inserted_values = []
+
+    for i in range(0, len(missing_values), batch_size):
+        batch = missing_values[i:i + batch_size]
+
+        if lookup_first:
+            existing_ids = get_ids(db_session, batch)
+            dimension_map.update(existing_ids)
+            batch = [v for v in batch if v not in existing_ids]
+
+        if batch:
+            insert_ignore(db_session, table_class, [make_row(v) for v in batch])
+            dimension_map.update(get_ids(db_session, batch))
+            inserted_values.extend(batch)
+
+    return inserted_values
+
+
+def get_or_create_journals(db_session, issn_map, issns, collection, batch_size=1000, issn_as_online_issn=False):
+    """
+    Completa o mapa de periódicos com os ISSNs informados, inserindo os periódicos (e respectivas coleções) ausentes
+
+    :param db_session: sessão de conexão com banco de dados
+    :param issn_map: dicionário que mapeia ISSN a ID de periódico
+    :param issns: ISSNs necessários
+    :param collection: acrônimo da coleção dos novos periódicos
+    :param batch_size: número máximo de valores por comando
+    :param issn_as_online_issn: grava o ISSN também como ISSN eletrônico dos novos periódicos
+    :return: lista de ISSNs dos periódicos inseridos
+    """
+    new_issns = get_or_create_many(db_session,
+                                   Journal,
+                                   issn_map,
+                                   issns,
+                                   get_journals_ids,
+                                   lambda i: {'pid_issn': i, 'print_issn': '', 'online_issn': i if issn_as_online_issn else ''},
+                                   batch_size,
+                                   lookup_first=True)
+
+    for i in range(0, len(new_issns), batch_size):
+        insert_ignore(db_session, JournalCollection, [{'idjournal_jc': issn_map[issn],
+                                                       'collection': collection,
+                                                       'title': ''} for issn in new_issns[i:i + batch_size]])
+
+    return new_issns
+
+
+def get_or_create_localizations(db_session, localization_map, localizations, batch_size=1000):
+    """
+    Completa o mapa de localizações com os pares (latitude, longitude) informados, inserindo os ausentes
+
+    :param db_session: sessão de conexão com banco de dados
+    :param localization_map: dicionário que mapeia (latitude, longitude) a ID de localização
+    :param localizations: pares (latitude, longitude) necessários
+    :param batch_size: número máximo de valores por comando
+    :return: lista de localizações inseridas
+    """
+    return get_or_create_many(db_session,
+                              Localization,
+                              localization_map,
+                              localizations,
+                              get_localizations_ids,
+                              lambda l: {'latitude': l[0], 'longitude': l[1]},
+                              batch_size)
+
+
+def get_or_create_formats(db_session, format_map, formats, batch_size=1000):
+    """
+    Completa o mapa de formatos com os formatos informados, inserindo os ausentes
+
+    :param db_session: sessão de conexão com banco de dados
+    :param format_map: dicionário que mapeia formato a ID
+    :param formats: formatos necessários
+    :param batch_size: número máximo de valores por comando
+    :return: lista de formatos inseridos
+    """
+    return get_or_create_many(db_session, ArticleFormat, format_map, formats, get_formats_ids, lambda f: {'format': f}, batch_size)
+
+
+def get_or_create_languages(db_session, language_map, languages, batch_size=1000):
+    """
+    Completa o mapa de idiomas com os idiomas informados, inserindo os ausentes
+
+    :param db_session: sessão de conexão com banco de dados
+    :param language_map: dicionário que mapeia idioma a ID
+    :param languages: idiomas necessários
+    :param batch_size: número máximo de valores por comando
+    :return: lista de idiomas inseridos
+    """
+    return get_or_create_many(db_session, ArticleLanguage, language_map, languages, get_languages_ids, lambda l: {'language': l}, batch_size)
+
+
+def get_or_create_articles(db_session, pid_map, pid_to_attrs, collection, issn_map, batch_size=1000):
+    """
+    Completa o mapa de artigos com os PIDs informados, inserindo os artigos ausentes.
+    Os periódicos dos artigos devem constar em issn_map
+
+    :param db_session: sessão de conexão com banco de dados
+    :param pid_map: dicionário que mapeia (PID, coleção) a ID de artigo
+    :param pid_to_attrs: dicionário que mapeia PID a (ISSN, ano de publicação) do artigo
+    :param collection: acrônimo da coleção
+    :param issn_map: dicionário que mapeia ISSN a ID de periódico
+    :param batch_size: número máximo de valores por comando
+    :return: lista de pares (PID, coleção) inseridos
+    """
+    return get_or_create_many(db_session,
+                              Article,
+                              pid_map,
+                              [(pid, collection) for pid in pid_to_attrs],
+                              lambda s, pids_cols: {(pid, collection): a_id for pid, a_id in get_articles_ids(s, [p for p, c in pids_cols], collection).items()},
+                              lambda pc: {'collection': collection,
+                                          'idjournal_a': issn_map[pid_to_attrs[pc[0]][0]],
+                                          'pid': pc[0],
+                                          'yop': pid_to_attrs[pc[0]][1]},
+                              batch_size)
+
+
+def _get_insert_statement(db_session, table_class):
+    dialect_name = db_session.get_bind().dialect.name
+
+    if dialect_name == 'mysql':
+        return mysql.insert(table_class.__table__)
+    if dialect_name == 'sqlite':
+        return sqlite.insert(table_class.__table__)
+
+    raise ValueError('Inserção em lote não suportada para o banco de dados %s' % dialect_name)
+
+
+def insert_ignore(db_session, table_class, rows):
+    """
+    Insere registros em lote, em um único comando, ignorando os que violam restrições de unicidade
+
+    :param db_session: sessão de conexão com banco de dados
+    :param table_class: uma classe que representa a tabela
+    :param rows: lista de dicionários coluna -> valor
+    """
+    if not rows:
+        return
+
+    statement = _get_insert_statement(db_session, table_class)
+
+    if db_session.get_bind().dialect.name == 'mysql':
+        statement = statement.prefix_with('IGNORE')
+    else:
+        statement = statement.on_conflict_do_nothing()
+
+    db_session.execute(statement, rows)
+
+
+def upsert_metrics(db_session, table_class, rows, metrics_columns):
+    """
+    Insere registros de métricas em lote, em um único comando. Caso um registro já exista (restrição de unicidade),
+    os valores das colunas de métricas são somados aos existentes (INSERT ... ON DUPLICATE KEY UPDATE)
+
+    :param db_session: sessão de conexão com banco de dados
+    :param table_class: uma classe que representa a tabela
+    :param rows: lista de dicionários coluna -> valor
+    :param metrics_columns: nomes das colunas de métricas
+    """
+    if not rows:
+        return
+
+    table = table_class.__table__
+    statement = _get_insert_statement(db_session, table_class)
+
+    if db_session.get_bind().dialect.name == 'mysql':
+        statement = statement.on_duplicate_key_update({c: table.c[c] + statement.inserted[c] for c in metrics_columns})
+    else:
+        unique_columns = [u for u in table.constraints if isinstance(u, UniqueConstraint)][0].columns
+        statement = statement.on_conflict_do_update(index_elements=list(unique_columns),
+                                                    set_={c: table.c[c] + statement.excluded[c] for c in metrics_columns})
+
+    db_session.execute(statement, rows)
+
+
+def _get_table(table_class):
+    return getattr(table_class, '__table__', table_class)
+
+
+def insert_rows(db_session, table_class, columns, rows):
+    """
+    Insere registros em um único comando INSERT com múltiplas linhas (VALUES), sem objetos do ORM.
+    Colunas ausentes, como o ID, recebem o valor padrão do banco de dados (auto-incremento)
+
+    :param db_session: sessão de conexão com banco de dados
+    :param table_class: uma classe que representa a tabela ou um objeto Table
+    :param columns: nomes das colunas, na ordem dos valores de rows
+    :param rows: lista de tuplas de valores
+    """
+    if not rows:
+        return
+
+    db_session.execute(_get_table(table_class).insert().values([dict(zip(columns, r)) for r in rows]))
+
+
+def _to_tsv_value(value):
+    return '\\N' if value is None else str(value)
+
+
+def load_data_local_infile(db_session, table_class, columns, rows):
+    """
+    Grava registros em um arquivo TSV temporário e os carrega com LOAD DATA LOCAL INFILE (apenas MySQL).
+    Colunas ausentes, como o ID, recebem o valor padrão do banco de dados (auto-incremento).
+    A conexão deve permitir o envio de arquivos locais (opção local_infile)
+
+    :param db_session: sessão de conexão com banco de dados
+    :param table_class: uma classe que representa a tabela ou um objeto Table
+    :param columns: nomes das colunas, na ordem dos valores de rows
+    :param rows: iterável de tuplas de valores
+    """
+    dialect_name = db_session.get_bind().dialect.name
+    if dialect_name != 'mysql':
+        raise ValueError('LOAD DATA LOCAL INFILE não suportado para o banco de dados %s' % dialect_name)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False) as f:
+        for r in rows:
+            f.write('\t'.join([_to_tsv_value(v) for v in r]) + '\n')
+
+    try:
+        db_session.execute(text("LOAD DATA LOCAL INFILE :path INTO TABLE %s "
+                                "FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' (%s)" % (_get_table(table_class).name, ', '.join(columns))),
+                           {'path': f.name})
+    finally:
+        os.remove(f.name)
+
+
+def create_staging_table(db_session, table_class, columns):
+    """
+    Cria, na conexão da sessão, uma tabela temporária (staging) com as colunas informadas da tabela de destino, sem
+    restrições. Uma tabela temporária é visível apenas à própria conexão e não encerra a transação corrente.
+    Uma tabela de mesmo nome remanescente na conexão é removida antes
+
+    :param db_session: sessão de conexão com banco de dados
+    :param table_class: uma classe que representa a tabela de destino
+    :param columns: nomes das colunas
+    :return: um objeto Table que representa a tabela temporária
+    """
+    table = table_class.__table__
+    staging_table = Table('staging_' + table.name,
+                          MetaData(),
+                          *[Column(c, table.c[c].type) for c in columns],
+                          prefixes=['TEMPORARY'])
+
+    drop_staging_table(db_session, staging_table)
+    staging_table.create(db_session.connection())
+
+    return staging_table
+
+
+def drop_staging_table(db_session, staging_table):
+    """
+    Remove uma tabela temporária, caso exista, sem encerrar a transação corrente
+
+    :param db_session: sessão de conexão com banco de dados
+    :param staging_table: um objeto Table que representa a tabela temporária
+    """
+    if db_session.get_bind().dialect.name == 'mysql':
+        db_session.execute(text('DROP TEMPORARY TABLE IF EXISTS %s' % staging_table.name))
+    else:
+        db_session.execute(text('DROP TABLE IF EXISTS temp.%s' % staging_table.name))
+
+
+def merge_staging_table(db_session, table_class, staging_table, metrics_columns, unit_condition):
+    """
+    Substitui, na tabela de destino, os registros de uma unidade de carga (por exemplo, uma coleção em um dia) pelos
+    registros de uma tabela temporária. Primeiro, são removidos os registros da unidade cujas chaves (restrição de
+    unicidade) não constam na tabela temporária. Em seguida, os registros da tabela temporária são inseridos em um
+    único comando INSERT ... SELECT, e os que já existem têm os valores das colunas de métricas substituídos
+    (ON DUPLICATE KEY UPDATE). Assim, repetir uma carga, com os mesmos dados ou com dados recalculados, deixa na
+    tabela de destino exatamente os registros da última carga. Os comandos não encerram a transação corrente
+
+    :param db_session: sessão de conexão com banco de dados
+    :param table_class: uma classe que representa a tabela de destino
+    :param staging_table: um objeto Table que representa a tabela temporária
+    :param metrics_columns: nomes das colunas de métricas
+    :param unit_condition: condição que seleciona, na tabela de destino, os registros da unidade de carga
+    """
+    table = table_class.__table__
+    unique_columns = [u for u in table.constraints if isinstance(u, UniqueConstraint)][0].columns
+
+    in_staging = exists().where(and_(*[staging_table.c[c.name] == c for c in unique_columns]))
+    db_session.execute(table.delete().where(and_(unit_condition, ~in_staging)))
+
+    columns = [c.name for c in staging_table.c]
+    statement = _get_insert_statement(db_session, table_class).from_select(columns, select(staging_table).where(true()))
+
+    if db_session.get_bind().dialect.name == 'mysql':
+        statement = statement.on_duplicate_key_update({c: statement.inserted[c] for c in metrics_columns})
+    else:
+        statement = statement.on_conflict_do_update(index_elements=list(unique_columns),
+                                                    set_={c: statement.excluded[c] for c in metrics_columns})
+
+    db_session.execute(statement)
+
+
 def get_date_status(db_session, collection, date):
     try:
         existing_date = db_session.query(DateStatus).filter(and_(DateStatus.collection == collection,
@@ -358,16 +843,106 @@ def update_date_status(db_session, collection, date, status):
         logging.error('Error while trying to update date status')
 
 
-def extract_pretable(database_uri, date, idsite):
+def claim_date_status(db_session, collection, date, current_status, new_status):
+    """
+    Altera o status de uma data apenas se o status atual for igual a current_status.
+    A verificação e a alteração ocorrem em um único UPDATE, de modo que dois processos não reivindicam a mesma data
+
+    @param db_session: sessão de conexão com banco de dados
+    @param collection: acrônimo da coleção
+    @param date: data a ser alterada
+    @param current_status: status esperado da data
+    @param new_status: novo status da data
+    @return: True caso o status tenha sido alterado, False caso contrário
+    """
+    try:
+        updated_rows = db_session.query(DateStatus).filter(and_(DateStatus.collection == collection,
+                                                                DateStatus.date == date,
+                                                                DateStatus.status == current_status)).update({DateStatus.status: new_status},
+                                                                                                             synchronize_session=False)
+        db_session.commit()
+
+        if updated_rows == 1:
+            logging.info('Changing status of control_date_status.date=%s from %s to %s' % (date, current_status, new_status))
+            return True
+    except OperationalError:
+        db_session.rollback()
+        logging.error('Error while trying to claim date status')
+
+    return False
+
+
+def release_date_statuses(db_session, collection, current_status, new_status):
+    """
+    Altera para new_status o status de todas as datas da coleção cujo status atual é current_status.
+    Permite liberar datas reivindicadas por um processo interrompido
+
+    @param db_session: sessão de conexão com banco de dados
+    @param collection: acrônimo da coleção
+    @param current_status: status das datas a serem liberadas
+    @param new_status: novo status das datas
+    @return: número de datas alteradas
+    """
+    try:
+        updated_rows = db_session.query(DateStatus).filter(and_(DateStatus.collection == collection,
+                                                                DateStatus.status == current_status)).update({DateStatus.status: new_status},
+                                                                                                             synchronize_session=False)
+        db_session.commit()
+
+        if updated_rows:
+            logging.info('Changing status of %d date(s) of control_date_status from %s to %s' % (updated_rows, current_status, new_status))
+        return updated_rows
+    except OperationalError:
+        db_session.rollback()
+        logging.error('Error while trying to release date statuses')
+
+    return 0
+
+
+def _get_pretable_raw_query(date, idsite):
+    """
+    Monta a consulta SQL de extração de pré-tabela para um dia
+
+    @param date: data a ser extraída
+    @param idsite: identificador do site no Matomo
+    @return: uma str com a consulta SQL
+    """
     currente_date = date
     next_date = date + datetime.timedelta(days=1)
 
-    raw_query = 'SELECT server_time as serverTime, config_browser_name as browserName, config_browser_version as browserVersion, inet_ntoa(conv(hex(location_ip), 16, 10)) as ip, location_latitude as latitude, location_longitude as longitude, name as actionName from matomo_log_link_visit_action LEFT JOIN matomo_log_visit on matomo_log_visit.idvisit = matomo_log_link_visit_action.idvisit LEFT JOIN matomo_log_action on matomo_log_action.idaction = matomo_log_link_visit_action.idaction_url WHERE matomo_log_link_visit_action.idsite = {0} AND server_time >= "{1}" AND server_time < "{2}" ORDER BY ip;'.format(idsite, currente_date, next_date)
+    return 'SELECT server_time as serverTime, config_browser_name as browserName, config_browser_version as browserVersion, inet_ntoa(conv(hex(location_ip), 16, 10)) as ip, location_latitude as latitude, location_longitude as longitude, name as actionName from matomo_log_link_visit_action LEFT JOIN matomo_log_visit on matomo_log_visit.idvisit = matomo_log_link_visit_action.idvisit LEFT JOIN matomo_log_action on matomo_log_action.idaction = matomo_log_link_visit_action.idaction_url WHERE matomo_log_link_visit_action.idsite = {0} AND server_time >= "{1}" AND server_time < "{2}" ORDER BY ip;'.format(idsite, currente_date, next_date)
+
 
-    engine = create_engine(database_uri, pool_recycle=1800)
+def extract_pretable(database_uri, date, idsite, engine=None):
+    raw_query = _get_pretable_raw_query(date, idsite)
+
+    if not engine:
+        engine = create_engine(database_uri, pool_recycle=1800)
     return engine.execute(raw_query)
 
 
+def extract_pretable_stream(database_uri, date, idsite, fetch_size, engine=None):
+    """
+    Obtém os dados de pré-tabela por meio de um cursor do lado do servidor (não bufferizado).
+    Os registros são entregues em blocos de fetch_size linhas, de modo que o cliente não mantém o resultado inteiro em memória
+
+    @param database_uri: string de conexão à base do Matomo
+    @param date: data a ser extraída
+    @param idsite: identificador do site no Matomo
+    @param fetch_size: número de registros obtidos por vez do servidor
+    @param engine: um Engine SQLAlchemy já existente (opcional), cujo pool de conexões será compartilhado
+    @return: um gerador de listas de registros
+    """
+    raw_query = _get_pretable_raw_query(date, idsite)
+
+    if not engine:
+        engine = create_engine(database_uri, pool_recycle=1800)
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(raw_query)
+        for rows in result.partitions(fetch_size):
+            yield rows
+
+
 def get_dates_able_to_extract(db_session, collection, number_of_days):
     dates = []
 
@@ -0,0 +1,106 @@
+import logging
+import os
+import pickle
+
+from libs import lib_database
+from models.declarative import Journal, Article, Localization, ArticleFormat, ArticleLanguage
+
+
+# Dimensões mantidas em cache: tabela e função que monta (ou completa) o respectivo mapa de IDs
+DIMENSIONS = {
+    'issn': (Journal, lib_database.mount_issn_map),
+    'pid': (Article, lib_database.mount_pid_map),
+    'localization': (Localization, lib_database.mount_localization_map),
+    'format': (ArticleFormat, lib_database.mount_format_map),
+    'language': (ArticleLanguage, lib_database.mount_language_map),
+}
+
+
+class DimensionCache:
+    """
+    Mapas de periódicos, artigos, localizações, formatos e idiomas a seus IDs na base de dados, persistidos em disco.
+    Para cada dimensão é mantido o maior ID já lido, de modo que uma atualização consulta apenas os registros inseridos
+    desde a última leitura. Os mapas são completados no próprio objeto, e referências a eles permanecem válidas
+    """
+    def __init__(self, path: str):
+        """
+        @param path: caminho do arquivo de cache. Caso seja vazio, o cache é mantido apenas em memória
+        """
+        self.path = path
+        self.maps = {d: {} for d in DIMENSIONS}
+        self.last_ids = {d: 0 for d in DIMENSIONS}
+
+        # Identificação da base de dados (servidor, porta e nome) a que os mapas se referem
+        self.database = None
+
+    def load(self):
+        """
+        Carrega os mapas gravados em disco, caso existam
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'rb') as f:
+                database, maps, last_ids = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            logging.warning('Cache de dimensões %s está corrompido e será reconstruído' % self.path)
+            return
+
+        self.database = database
+
+        for d in DIMENSIONS:
+            if d in maps and d in last_ids:
+                self.maps[d].update(maps[d])
+                self.last_ids[d] = last_ids[d]
+
+    def refresh(self, db_session, dimensions=None):
+        """
+        Completa os mapas com os registros cujo ID é maior que o último ID lido.
+        Caso o maior ID da tabela seja menor que o último lido, a tabela foi recriada e o mapa é reconstruído
+
+        @param db_session: sessão com banco de dados
+        @param dimensions: dimensões a serem atualizadas. Caso seja None, todas são atualizadas
+        @return: dicionário dimensão -> mapa
+        """
+        url = db_session.get_bind().url
+        database = (url.host, url.port, url.database)
+
+        if database != self.database:
+            if self.database is not None:
+                logging.warning('Cache de dimensões se refere a outra base de dados e será reconstruído')
+            for d in DIMENSIONS:
+                self.maps[d].clear()
+                self.last_ids[d] = 0
+            self.database = database
+
+        for d in dimensions or DIMENSIONS:
+            table_class, mount_map = DIMENSIONS[d]
+            max_id = lib_database.get_last_id(db_session, table_class) or 0
+
+            if max_id < self.last_ids[d]:
+                logging.warning('Cache de dimensões está inconsistente com a tabela %s e será reconstruído' % table_class.__tablename__)
+                self.maps[d].clear()
+                self.last_ids[d] = 0
+
+            if max_id > self.last_ids[d]:
+                mount_map(db_session, self.last_ids[d], self.maps[d])
+                self.last_ids[d] = max_id
+
+        return self.maps
+
+    def save(self):
+        """
+        Grava os mapas em disco, de forma atômica
+        """
+        if not self.path:
+            return
+
+        dir_path = os.path.dirname(self.path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+
+        tmp_path = self.path + '.tmp.%d' % os.getpid()
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.database, self.maps, self.last_ids), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
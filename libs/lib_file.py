@@ -0,0 +1,89 @@
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_NONE = ''
+COMPRESSION_GZIP = 'gz'
+COMPRESSION_ZSTD = 'zst'
+
+# Mapeia extensão de arquivo ao respectivo método de compressão
+extension_to_compression = {
+    '.gz': COMPRESSION_GZIP,
+    '.zst': COMPRESSION_ZSTD,
+}
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def get_compression_from_path(path: str):
+    """
+    Obtém o método de compressão de um arquivo a partir de sua extensão
+
+    @param path: caminho do arquivo
+    @return: COMPRESSION_GZIP, COMPRESSION_ZSTD ou COMPRESSION_NONE
+    """
+    for extension, compression in extension_to_compression.items():
+        if path.endswith(extension):
+            return compression
+    return COMPRESSION_NONE
+
+
+def get_compression_extension(compression: str):
+    """
+    Obtém a extensão de arquivo associada a um método de compressão
+
+    @param compression: método de compressão
+    @return: extensão (com ponto) ou string vazia
+    """
+    return '.' + compression if compression else ''
+
+
+def check_compression(compression: str):
+    """
+    Verifica se um método de compressão pode ser utilizado no ambiente atual
+
+    @param compression: método de compressão
+    """
+    if compression not in {COMPRESSION_NONE, COMPRESSION_GZIP, COMPRESSION_ZSTD}:
+        raise ValueError('Método de compressão desconhecido: %s' % compression)
+
+    if compression == COMPRESSION_ZSTD and zstandard is None:
+        raise ImportError('Compressão zstd exige o pacote zstandard')
+
+
+def open_file(path: str, mode='rt', compression=None, buffer_size=-1, errors=None):
+    """
+    Abre um arquivo, comprimido ou não, de forma transparente
+
+    @param path: caminho do arquivo
+    @param mode: modo de abertura (rt, wt, rb, wb, at, ab)
+    @param compression: método de compressão. Caso seja None, é detectado pela extensão do arquivo
+    @param buffer_size: tamanho, em bytes, do buffer de leitura ou escrita (apenas para arquivos não comprimidos)
+    @param errors: tratamento de erros de codificação (apenas para modo texto)
+    @return: um objeto do tipo arquivo
+    """
+    if compression is None:
+        compression = get_compression_from_path(path)
+
+    check_compression(compression)
+    is_text_mode = 't' in mode
+
+    if compression == COMPRESSION_GZIP:
+        if is_text_mode:
+            return gzip.open(path, mode, compresslevel=GZIP_LEVEL, errors=errors)
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+
+    if compression == COMPRESSION_ZSTD:
+        cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL) if 'r' not in mode else None
+        if is_text_mode:
+            return zstandard.open(path, mode, cctx=cctx, errors=errors)
+        return zstandard.open(path, mode, cctx=cctx)
+
+    if is_text_mode:
+        return open(path, mode.replace('t', ''), buffering=buffer_size, errors=errors)
+    return open(path, mode, buffering=buffer_size)
@@ -1,12 +1,52 @@
 import logging
 import re
 
+from datetime import datetime
 from urllib import parse
+from libs import lib_classifier as lc
 from utils import values, dicts
 from utils import map_actions as ma
 from utils import regular_expressions as rege
 
 
+def parse_server_time(server_time: str):
+    """
+    Converte uma data e hora no formato YYYY-MM-DD HH:MM:SS em datetime.
+    Strings nesse formato são convertidas por fatiamento, mais rápido que datetime.strptime.
+    As demais são repassadas a datetime.strptime, que as aceita ou levanta ValueError
+
+    @param server_time: data e hora
+    @return: um objeto datetime
+    """
+    if len(server_time) == 19 and server_time[4] == '-' and server_time[7] == '-' and server_time[10] == ' ' and server_time[13] == ':' and server_time[16] == ':':
+        digits = server_time[0:4] + server_time[5:7] + server_time[8:10] + server_time[11:13] + server_time[14:16] + server_time[17:19]
+        if digits.isdecimal() and digits.isascii():
+            try:
+                return datetime(int(server_time[0:4]),
+                                int(server_time[5:7]),
+                                int(server_time[8:10]),
+                                int(server_time[11:13]),
+                                int(server_time[14:16]),
+                                int(server_time[17:19]))
+            except ValueError:
+                pass
+
+    return datetime.strptime(server_time, '%Y-%m-%d %H:%M:%S')
+
+
+def get_server_timestamp(server_time: datetime):
+    """
+    Obtém a quantidade de segundos de uma data e hora desde 0001-01-01, usada para comparar horários de Hits
+
+    @param server_time: um objeto datetime
+    @return: número de segundos (int, ou float caso haja microssegundos)
+    """
+    seconds = server_time.toordinal() * 86400 + server_time.hour * 3600 + server_time.minute * 60 + server_time.second
+    if server_time.microsecond:
+        return seconds + server_time.microsecond / 1000000
+    return seconds
+
+
 def article_pid_to_issue_code(pid: str):
     """
     Obtém o código de fascículo de um artigo, a partir de PID
@@ -18,6 +58,15 @@ def article_pid_to_issue_code(pid: str):
             return pid[1:18]
 
 
+def is_journal_issn_in_pid(pid: str):
+    """
+    Verifica se o ISSN do periódico pode ser obtido diretamente do PID de um artigo
+
+    @param pid: o PID de um artigo
+    """
+    return pid.startswith('S') and len(pid) == 23 and '-' in pid
+
+
 def article_pid_to_journal_issn(pid: str, pid_to_issn=None):
     """
     Obtém o ISSN do periódico em que o artigo foi publicado, a partir de seu PID
@@ -25,9 +74,8 @@ def article_pid_to_journal_issn(pid: str, pid_to_issn=None):
     @param pid_to_issn: dicionário que mapeia PID a ISSN
     @param pid: o PID de um artigo
     """
-    if pid.startswith('S'):
-        if len(pid) == 23 and '-' in pid:
-            return pid[1:10]
+    if is_journal_issn_in_pid(pid):
+        return pid[1:10]
 
     return sorted(pid_to_issn.get(pid, {''}))[0]
 
@@ -119,22 +167,9 @@ def get_attrs_from_ssm_path(ssm_path: str):
 
 
 def get_hit_type_new_url(action: str):
-    for pattern in [rege.REGEX_NEW_SCL_JOURNAL_ARTICLE,
-                    rege.REGEX_NEW_SCL_RAW]:
-        if re.search(pattern, action):
-            return ma.HIT_TYPE_ARTICLE
-
-    for pattern in [rege.REGEX_NEW_SCL_JOURNAL_FEED,
-                    rege.REGEX_NEW_SCL_JOURNAL_GRID,
-                    rege.REGEX_NEW_SCL_JOURNAL_TOC,
-                    rege.REGEX_NEW_SCL_JOURNAL]:
-        if re.search(pattern, action):
-            return ma.HIT_TYPE_JOURNAL
-
-    for pattern in [rege.REGEX_NEW_SCL_JOURNALS_ALFAPHETIC,
-                    rege.REGEX_NEW_SCL_JOURNALS_THEMATIC]:
-        if re.search(pattern, action):
-            return ma.HIT_TYPE_PLATFORM
+    for hit_type, pattern in lc.NEW_URL_HIT_TYPES:
+        if pattern.search(action):
+            return hit_type
 
     return ma.HIT_TYPE_OTHERS
 
@@ -367,22 +402,21 @@ def get_issn(hit, acronym2pid: dict):
 
 def get_content_type_new_url(hit):
     action_lowered = hit.action_name.lower()
-    if re.search(rege.REGEX_NEW_SCL_JOURNAL_ARTICLE_ABSTRACT, action_lowered):
+    if lc.NEW_URL_CONTENT['abstract'].search(action_lowered):
         return ma.HIT_CONTENT_NEW_SCL_ARTICLE_ABSTRACT
 
-    if re.search(rege.REGEX_NEW_SCL_JOURNAL_ARTICLE, action_lowered):
+    if lc.NEW_URL_CONTENT['article'].search(action_lowered):
         if hit.format == 'html':
-            if 'fragment' in hit.__dict__.keys():
-                if hit.fragment == 'modaltutors':
-                    return ma.HIT_CONTENT_NEW_SCL_ARTICLE_AUTHORS
-                if hit.fragment == 'modaltablesfigures':
-                    return ma.HIT_CONTENT_NEW_SCL_ARTICLE_TABLES_AND_FIGURES
-                if hit.fragment == 'modaldownloads':
-                    return ma.HIT_CONTENT_NEW_SCL_ARTICLE_REQUEST_PDF
-                if hit.fragment == 'modalarticles':
-                    return ma.HIT_CONTENT_NEW_SCL_ARTICLE_HOW_TO_CITE
-                if hit.fragment == 'modalversionstranslations':
-                    return ma.HIT_CONTENT_NEW_SCL_ARTICLE_TRANSLATE
+            if hit.fragment == 'modaltutors':
+                return ma.HIT_CONTENT_NEW_SCL_ARTICLE_AUTHORS
+            if hit.fragment == 'modaltablesfigures':
+                return ma.HIT_CONTENT_NEW_SCL_ARTICLE_TABLES_AND_FIGURES
+            if hit.fragment == 'modaldownloads':
+                return ma.HIT_CONTENT_NEW_SCL_ARTICLE_REQUEST_PDF
+            if hit.fragment == 'modalarticles':
+                return ma.HIT_CONTENT_NEW_SCL_ARTICLE_HOW_TO_CITE
+            if hit.fragment == 'modalversionstranslations':
+                return ma.HIT_CONTENT_NEW_SCL_ARTICLE_TRANSLATE
             return ma.HIT_CONTENT_NEW_SCL_ARTICLE_HTML
 
         if hit.format == 'xml':
@@ -391,39 +425,47 @@ def get_content_type_new_url(hit):
         if hit.format == 'pdf':
             return ma.HIT_CONTENT_NEW_SCL_ARTICLE_PDF
 
-    if re.search(rege.REGEX_NEW_SCL_RAW, action_lowered):
-        match = re.search(rege.REGEX_NEW_SCL_RAW_DETAIL, action_lowered)
+    if lc.NEW_URL_CONTENT['raw'].search(action_lowered):
+        match = lc.NEW_URL_RAW_DETAIL.search(action_lowered)
         if match and len(match.groups()) == 3:
             if '.pdf' in match.group(3):
                 return ma.HIT_CONTENT_NEW_SCL_ARTICLE_PDF
 
-    if re.search(rege.REGEX_NEW_SCL_JOURNAL_FEED, action_lowered):
+    if lc.NEW_URL_CONTENT['feed'].search(action_lowered):
         return ma.HIT_CONTENT_NEW_SCL_JOURNAL_FEED
 
-    if re.search(rege.REGEX_NEW_SCL_JOURNAL_GRID, action_lowered):
+    if lc.NEW_URL_CONTENT['grid'].search(action_lowered):
         return ma.HIT_CONTENT_NEW_SCL_JOURNAL_GRID
 
-    if re.search(rege.REGEX_NEW_SCL_JOURNAL_TOC, action_lowered):
+    if lc.NEW_URL_CONTENT['toc'].search(action_lowered):
         return ma.HIT_CONTENT_NEW_SCL_JOURNAL_TOC
 
-    if re.search(rege.REGEX_NEW_SCL_JOURNAL, action_lowered):
+    if lc.NEW_URL_CONTENT['journal'].search(action_lowered):
         return ma.HIT_CONTENT_NEW_SCL_JOURNAL
 
-    if re.search(rege.REGEX_NEW_SCL_JOURNALS_ALFAPHETIC, action_lowered):
+    if lc.NEW_URL_CONTENT['alphabetic'].search(action_lowered):
         return ma.HIT_CONTENT_NEW_SCL_JOURNALS_ALPHABETIC
 
-    if re.search(rege.REGEX_NEW_SCL_JOURNALS_THEMATIC, action_lowered):
+    if lc.NEW_URL_CONTENT['thematic'].search(action_lowered):
         return ma.HIT_CONTENT_NEW_SCL_JOURNALS_THEMATIC
 
     return ma.HIT_CONTENT_OTHERS
 
 
 def get_content_type(hit):
-    possible_domains = dicts.collection_to_domain.get(hit.collection, [])
+    domains_any, domains_content = lc.get_classic_url_content(hit.collection)
+
+    # Nenhum domínio da coleção ocorre na URL
+    if not domains_any or not domains_any.search(hit.action_name):
+        return ma.HIT_CONTENT_OTHERS
+
+    for domain, content in domains_content:
+        # Expressões de um domínio que não ocorre na URL não precisam ser avaliadas
+        if not domain.search(hit.action_name):
+            continue
 
-    for scl_domain in possible_domains:
         # É domínio/scielo.php
-        if re.search(ma.ACTION_SCLBR_SCLPHP.format(scl_domain), hit.action_name):
+        if content['sclphp'].search(hit.action_name):
             # Caso possua parâmero script
             if hit.script:
                 return dicts.script_to_hit_content.get(hit.script, ma.HIT_CONTENT_OTHERS)
@@ -438,19 +480,19 @@ def get_content_type(hit):
             return ma.HIT_CONTENT_PLATFORM_MAIN_PAGE
 
         # É domínio/article_plus.php? + pid={}
-        if re.search(ma.ACTION_SCLBR_ARTICLE_PLUS.format(scl_domain), hit.action_name):
+        if content['article_plus'].search(hit.action_name):
             return ma.HIT_CONTENT_ARTICLE_PLUS
 
         # É domínio/pdf/ + arquivo.pdf
-        if re.search(ma.ACTION_SCLBR_PDF.format(scl_domain), hit.action_name):
+        if content['pdf'].search(hit.action_name):
             return ma.HIT_CONTENT_ARTICLE_PDF
 
         # É domínio/pdf/readcube/epdf.php? + pid={}
-        if re.search(ma.ACTION_SCLBR_READCUBE_EPDF.format(scl_domain), hit.action_name):
+        if content['readcube_epdf'].search(hit.action_name):
             return ma.HIT_CONTENT_ARTICLE_EXTERNAL_PDF
 
         # É domínio/scieloorg/php/{} + pid={}
-        if re.search(ma.ACTION_SCLBR_SCLORG_PHP.format(scl_domain), hit.action_name):
+        if content['sclorg_php'].search(hit.action_name):
             if 'articlexml' in hit.action_name:
                 return ma.HIT_CONTENT_ARTICLE_ARTICLE_XML
             if 'citedscielo' in hit.action_name:
@@ -463,14 +505,14 @@ def get_content_type(hit):
                 return ma.HIT_CONTENT_ARTICLE_TRANSLATE
 
         # É domínio/rss? + pid={}
-        if re.search(ma.ACTION_SCLBR_RSS.format(scl_domain), hit.action_name):
-            if re.search(rege.REGEX_ISSUE_PID, hit.pid):
+        if content['rss'].search(hit.action_name):
+            if lc.ISSUE_PID.search(hit.pid):
                 return ma.HIT_CONTENT_ISSUE_RSS
-            if re.search(rege.REGEX_JOURNAL_PID, hit.pid):
+            if lc.JOURNAL_PID.search(hit.pid):
                 return ma.HIT_CONTENT_JOURNAL_RSS
 
         # É domínio/revistas/ + página ou arquivo
-        if re.search(ma.ACTION_SCLBR_REVISTAS.format(scl_domain), hit.action_name):
+        if content['revistas'].search(hit.action_name):
             if 'aboutj.htm' in hit.action_name:
                 return ma.HIT_CONTENT_JOURNAL_ABOUT
             if 'edboard.htm' in hit.action_name:
@@ -482,31 +524,30 @@ def get_content_type(hit):
             return ma.HIT_CONTENT_JOURNAL_REVISTAS
 
         # É domínio/google_metrics/get_h5_m5.php? + issn={}
-        if re.search(ma.ACTION_SCLBR_GOOGLE_METRICS_H5_M5.format(scl_domain), hit.action_name):
+        if content['google_metrics'].search(hit.action_name):
             return ma.HIT_CONTENT_JOURNAL_GOOGLE_METRICS
 
         # É domínio/img/{fbpe ou revistas} + acrônimo
-        if re.search(ma.ACTION_SCLBR_IMG.format(scl_domain), hit.action_name):
+        if content['img'].search(hit.action_name):
             if 'fbpe' in hit.action_name:
                 return ma.HIT_CONTENT_JOURNAL_IMG_FBPE
             if 'revistas' in hit.action_name:
                 return ma.HIT_CONTENT_JOURNAL_IMG_REVISTAS
 
         # É domínio/statjournal.php? + issn={}
-        if re.search(ma.ACTION_SCLBR_STATJOURNAL.format(scl_domain), hit.action_name):
+        if content['statjournal'].search(hit.action_name):
             return ma.HIT_CONTENT_JOURNAL_STAT
 
         # É domínio/avaliacao
-        if re.search(ma.ACTION_SCLBR_AVALIACAO.format(scl_domain), hit.action_name):
+        if content['avaliacao'].search(hit.action_name):
             return ma.HIT_CONTENT_PLATFORM_EVALUATION
 
         # É domínio/equipe
-        if re.search(ma.ACTION_SCLBR_EQUIPE.format(scl_domain), hit.action_name):
+        if content['equipe'].search(hit.action_name):
             return ma.HIT_CONTENT_PLATFORM_TEAM
 
         # É domínio (scielo.br, scielo.org.ar, ...)
-        if re.search(scl_domain, hit.action_name):
-            return ma.HIT_CONTENT_PLATFORM_HOME
+        return ma.HIT_CONTENT_PLATFORM_HOME
 
     return ma.HIT_CONTENT_OTHERS
 
@@ -543,9 +584,7 @@ def get_format(hit):
     """
     if hit.content_type:
         if hit.content_type in {ma.HIT_CONTENT_ARTICLE_PDF,
-                                ma.HIT_CONTENT_ARTICLE_EXTERNAL_PDF} or re.search(rege.REGEX_PDF,
-                                                                                  hit.action_name) or re.search(rege.REGEX_ARTICLE_PDF_PATH,
-                                                                                                                hit.action_name):
+                                ma.HIT_CONTENT_ARTICLE_EXTERNAL_PDF} or lc.PDF_FILE.search(hit.action_name) or lc.PDF_PATH.search(hit.action_name):
             hit_format = values.FORMAT_PDF
         else:
             hit_format = values.FORMAT_HTML
@@ -556,19 +595,7 @@ def get_format(hit):
 
 
 def is_new_url_format(action: str):
-    for pattern in [rege.REGEX_NEW_SCL_JOURNAL_ARTICLE_ABSTRACT,
-                    rege.REGEX_NEW_SCL_JOURNAL_ARTICLE,
-                    rege.REGEX_NEW_SCL_JOURNAL_FEED,
-                    rege.REGEX_NEW_SCL_JOURNAL_GRID,
-                    rege.REGEX_NEW_SCL_JOURNAL_TOC,
-                    rege.REGEX_NEW_SCL_JOURNAL,
-                    rege.REGEX_NEW_SCL_JOURNALS_ALFAPHETIC,
-                    rege.REGEX_NEW_SCL_JOURNALS_THEMATIC,
-                    rege.REGEX_NEW_SCL_RAW]:
-        if re.search(pattern, action):
-            return True
-
-    return False
+    return lc.NEW_URL_FORMAT.search(action) is not None
 
 
 def get_content_type_preprints(hit):
@@ -623,72 +650,50 @@ def get_year_of_publication_preprints(hit, pid2yop: dict):
 
 
 def get_hit_type_ssp(action: str):
-    for pattern in [rege.REGEX_SSP_JOURNAL_ARTICLE_HTML,
-                    rege.REGEX_SSP_JOURNAL_ARTICLE_PDF,
-                    rege.REGEX_SSP_JOURNAL_ARTICLE_MEDIA_ASSETS]:
-        if re.search(pattern, action):
-            return ma.HIT_TYPE_ARTICLE
-
-    for pattern in [rege.REGEX_SSP_JOURNAL_ABOUT,
-                    rege.REGEX_SSP_JOURNAL_GRID,
-                    rege.REGEX_SSP_JOURNAL_FEED]:
-        if re.search(pattern, action):
-            return ma.HIT_TYPE_JOURNAL
-
-    for pattern in [rege.REGEX_SSP_JOURNAL_ISSUE,
-                    rege.REGEX_SSP_JOURNAL_FEED_ISSUE]:
-        if re.search(pattern, action):
-            return ma.HIT_TYPE_ISSUE
-
-    for pattern in [rege.REGEX_SSP_PLATFORM_ABOUT,
-                    rege.REGEX_SSP_JOURNALS_THEMATIC,
-                    rege.REGEX_SSP_JOURNALS_ALPHABETIC]:
-        if re.search(pattern, action):
-            return ma.HIT_TYPE_PLATFORM
-
-    if re.search(rege.REGEX_SSP_PLATFORM, action):
-        return ma.HIT_TYPE_PLATFORM
+    for hit_type, pattern in lc.SSP_HIT_TYPES:
+        if pattern.search(action):
+            return hit_type
 
     return ma.HIT_TYPE_OTHERS
 
 
 def get_content_type_ssp_url(hit):
     action_lowered = hit.action_name.lower()
-    if re.search(rege.REGEX_SSP_JOURNAL_ARTICLE_HTML, action_lowered):
+    if lc.SSP_CONTENT['article_html'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_ARTICLE_HTML
 
-    if re.search(rege.REGEX_SSP_JOURNAL_ARTICLE_PDF, action_lowered):
+    if lc.SSP_CONTENT['article_pdf'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_ARTICLE_PDF
 
-    if re.search(rege.REGEX_SSP_JOURNAL_ARTICLE_MEDIA_ASSETS, action_lowered):
+    if lc.SSP_CONTENT['media_assets'].search(action_lowered):
         if action_lowered.endswith('.pdf'):
             return ma.HIT_CONTENT_SSP_ARTICLE_PDF
 
-    if re.search(rege.REGEX_SSP_JOURNAL_ISSUE, action_lowered):
+    if lc.SSP_CONTENT['issue'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_ISSUE
 
-    if re.search(rege.REGEX_SSP_JOURNAL_FEED_ISSUE, action_lowered):
+    if lc.SSP_CONTENT['feed_issue'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_ISSUE_RSS
 
-    if re.search(rege.REGEX_SSP_JOURNAL_FEED, action_lowered):
+    if lc.SSP_CONTENT['feed'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_JOURNAL_RSS
 
-    if re.search(rege.REGEX_SSP_JOURNAL_GRID, action_lowered):
+    if lc.SSP_CONTENT['grid'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_JOURNAL_ISSUES
 
-    if re.search(rege.REGEX_SSP_JOURNAL_ABOUT, action_lowered):
+    if lc.SSP_CONTENT['about'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_JOURNAL_ABOUT
 
-    if re.search(rege.REGEX_SSP_JOURNAL, action_lowered):
+    if lc.SSP_CONTENT['journal'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_JOURNAL_MAIN_PAGE
 
-    if re.search(rege.REGEX_SSP_JOURNALS_ALPHABETIC, action_lowered):
+    if lc.SSP_CONTENT['alphabetic'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_PLATFORM_LIST_JOURNALS_ALPHABETIC
 
-    if re.search(rege.REGEX_SSP_JOURNALS_THEMATIC, action_lowered):
+    if lc.SSP_CONTENT['thematic'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_PLATFORM_LIST_JOURNALS_THEMATIC
 
-    if re.search(rege.REGEX_SSP_PLATFORM_ABOUT, action_lowered):
+    if lc.SSP_CONTENT['platform_about'].search(action_lowered):
         return ma.HIT_CONTENT_SSP_PLATFORM_ABOUT
 
     return ma.HIT_CONTENT_OTHERS
@@ -0,0 +1,109 @@
+import csv
+
+from libs import lib_columnar, lib_file
+
+
+PRETABLE_HEADER = ['serverTime',
+                   'browserName',
+                   'browserVersion',
+                   'ip',
+                   'latitude',
+                   'longitude',
+                   'actionName']
+
+PRETABLE_FORMAT_TSV = 'tsv'
+PRETABLE_FORMAT_TSV_GZIP = 'tsv.gz'
+PRETABLE_FORMAT_TSV_ZSTD = 'tsv.zst'
+PRETABLE_FORMAT_COLUMNAR = 'col'
+
+# Mapeia formato de pré-tabela à extensão de arquivo
+format_to_extension = {
+    PRETABLE_FORMAT_TSV: '.tsv',
+    PRETABLE_FORMAT_TSV_GZIP: '.tsv.gz',
+    PRETABLE_FORMAT_TSV_ZSTD: '.tsv.zst',
+    PRETABLE_FORMAT_COLUMNAR: '.col',
+}
+
+PRETABLE_FORMATS = tuple(format_to_extension.keys())
+
+
+def get_pretable_extension(pretable_format: str):
+    """
+    Obtém a extensão de arquivo associada a um formato de pré-tabela
+
+    @param pretable_format: formato de pré-tabela
+    @return: extensão do arquivo, com ponto
+    """
+    if pretable_format not in format_to_extension:
+        raise ValueError('Formato de pré-tabela desconhecido: %s' % pretable_format)
+    return format_to_extension[pretable_format]
+
+
+def get_pretable_format(path: str):
+    """
+    Detecta o formato de uma pré-tabela a partir do nome do arquivo
+
+    @param path: caminho do arquivo
+    @return: o formato da pré-tabela ou uma string vazia, caso o arquivo não seja uma pré-tabela
+    """
+    for pretable_format, extension in format_to_extension.items():
+        if path.endswith(extension):
+            return pretable_format
+    return ''
+
+
+def is_pretable(path: str):
+    return get_pretable_format(path) != ''
+
+
+class PretableWriter:
+    """
+    Grava pré-tabela em um dos formatos de PRETABLE_FORMATS.
+    As linhas são tuplas de strings na ordem de PRETABLE_HEADER
+    """
+    def __init__(self, path, pretable_format=PRETABLE_FORMAT_TSV, buffer_size=-1):
+        self.pretable_format = pretable_format
+
+        if pretable_format == PRETABLE_FORMAT_COLUMNAR:
+            self._columnar_writer = lib_columnar.ColumnarWriter(open(path, 'wb', buffering=buffer_size), PRETABLE_HEADER)
+            self._file = None
+        else:
+            get_pretable_extension(pretable_format)
+            self._columnar_writer = None
+            self._file = lib_file.open_file(path, 'wt', buffer_size=buffer_size)
+            self._file.write('\t'.join(PRETABLE_HEADER) + '\n')
+
+    def write_rows(self, rows):
+        if self._columnar_writer:
+            self._columnar_writer.write_rows(rows)
+        else:
+            self._file.write(''.join(['\t'.join(r) + '\n' for r in rows]))
+
+    def close(self):
+        if self._columnar_writer:
+            self._columnar_writer.close()
+        else:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_pretable(path: str):
+    """
+    Lê uma pré-tabela em qualquer um dos formatos de PRETABLE_FORMATS, detectado pelo nome do arquivo
+
+    @param path: caminho da pré-tabela
+    @return: gerador de dicionários cujas chaves são os campos de PRETABLE_HEADER
+    """
+    if get_pretable_format(path) == PRETABLE_FORMAT_COLUMNAR:
+        with lib_columnar.ColumnarReader(open(path, 'rb')) as columnar_reader:
+            header = columnar_reader.columns
+            for row in columnar_reader:
+                yield dict(zip(header, row))
+    else:
+        with lib_file.open_file(path, 'rt', errors='ignore') as data:
+            yield from csv.DictReader(data, delimiter='\t')
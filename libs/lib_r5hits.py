@@ -0,0 +1,150 @@
+from libs import lib_columnar, lib_file
+
+
+R5_HITS_HEADER = ['pid',
+                  'format',
+                  'lang',
+                  'latitude',
+                  'longitude',
+                  'yop',
+                  'issn',
+                  'session_id',
+                  'server_time',
+                  'action_name']
+
+R5_HITS_FORMAT_CSV = 'csv'
+R5_HITS_FORMAT_CSV_GZIP = 'csv.gz'
+R5_HITS_FORMAT_CSV_ZSTD = 'csv.zst'
+R5_HITS_FORMAT_COLUMNAR = 'col'
+
+# Mapeia formato de arquivo r5-hits à extensão de arquivo
+format_to_extension = {
+    R5_HITS_FORMAT_CSV: '.csv',
+    R5_HITS_FORMAT_CSV_GZIP: '.csv.gz',
+    R5_HITS_FORMAT_CSV_ZSTD: '.csv.zst',
+    R5_HITS_FORMAT_COLUMNAR: '.col',
+}
+
+R5_HITS_FORMATS = tuple(format_to_extension.keys())
+
+# Número de campos do ID de sessão (IP, user agent, dia e hora), que também é separado por |
+SESSION_ID_FIELDS = 4
+
+
+def get_r5_hits_extension(hits_format: str):
+    """
+    Obtém a extensão de arquivo associada a um formato de arquivo r5-hits
+
+    @param hits_format: formato de arquivo r5-hits
+    @return: extensão do arquivo, com ponto
+    """
+    if hits_format not in format_to_extension:
+        raise ValueError('Formato de arquivo r5-hits desconhecido: %s' % hits_format)
+    return format_to_extension[hits_format]
+
+
+def get_r5_hits_format(path: str):
+    """
+    Detecta o formato de um arquivo r5-hits a partir do nome do arquivo
+
+    @param path: caminho do arquivo
+    @return: o formato do arquivo ou uma string vazia, caso o arquivo não seja um r5-hits
+    """
+    for hits_format, extension in format_to_extension.items():
+        if path.endswith(extension):
+            return hits_format
+    return ''
+
+
+def format_server_time(year_month_day: str, server_time):
+    """
+    Codifica a data e hora de um Hit no formato YYYY-MM-DD-HH-MM-SS dos arquivos r5-hits
+
+    @param year_month_day: dia do Hit, no formato YYYY-MM-DD
+    @param server_time: um objeto datetime
+    @return: uma str
+    """
+    return '%s-%02d-%02d-%02d' % (year_month_day, server_time.hour, server_time.minute, server_time.second)
+
+
+class R5HitsWriter:
+    """
+    Acrescenta hits a um arquivo r5-hits em um dos formatos de R5_HITS_FORMATS.
+    As linhas são tuplas de strings na ordem de R5_HITS_HEADER. Nos formatos CSV, os campos são separados por |.
+    No formato colunar, cada escritor acrescenta um novo segmento ao arquivo
+    """
+    def __init__(self, path, hits_format=R5_HITS_FORMAT_CSV, buffer_size=-1):
+        self.hits_format = hits_format
+
+        if hits_format == R5_HITS_FORMAT_COLUMNAR:
+            self._columnar_writer = lib_columnar.ColumnarWriter(open(path, 'ab', buffering=buffer_size), R5_HITS_HEADER)
+            self._file = None
+        else:
+            get_r5_hits_extension(hits_format)
+            self._columnar_writer = None
+            self._file = lib_file.open_file(path, 'at', buffer_size=buffer_size)
+
+        # Cache das datas e horas já codificadas, indexado pelo timestamp do Hit
+        self._server_times = {}
+
+    def get_server_time(self, hit):
+        """
+        Obtém a data e hora codificada de um Hit, calculando-a uma única vez por timestamp
+
+        @param hit: um objeto Hit
+        @return: uma str no formato YYYY-MM-DD-HH-MM-SS
+        """
+        server_time = self._server_times.get(hit.server_timestamp)
+        if server_time is None:
+            server_time = format_server_time(hit.year_month_day, hit.server_time)
+            self._server_times[hit.server_timestamp] = server_time
+        return server_time
+
+    def write_rows(self, rows):
+        if self._columnar_writer:
+            self._columnar_writer.write_rows(rows)
+        else:
+            self._file.write(''.join(['|'.join(r) + '\n' for r in rows]))
+
+    def close(self):
+        if self._columnar_writer:
+            self._columnar_writer.close()
+        else:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _split_csv_line(line: str):
+    """
+    Separa uma linha CSV de r5-hits em campos. O ID de sessão contém separadores |, e a ação, por ser a última
+    coluna, pode contê-los
+
+    @param line: linha sem quebra de linha
+    @return: tupla de str na ordem de R5_HITS_HEADER
+    """
+    fields = line.split('|', 7)
+    session_and_rest = fields.pop().split('|', SESSION_ID_FIELDS + 1)
+    fields.append('|'.join(session_and_rest[:SESSION_ID_FIELDS]))
+    fields.extend(session_and_rest[SESSION_ID_FIELDS:])
+    return tuple(fields)
+
+
+def read_r5_hits(path: str):
+    """
+    Lê um arquivo r5-hits em qualquer um dos formatos de R5_HITS_FORMATS, detectado pelo nome do arquivo
+
+    @param path: caminho do arquivo
+    @return: gerador de tuplas de str na ordem de R5_HITS_HEADER
+    """
+    if get_r5_hits_format(path) == R5_HITS_FORMAT_COLUMNAR:
+        with lib_columnar.ColumnarReader(open(path, 'rb')) as columnar_reader:
+            yield from columnar_reader
+    else:
+        with lib_file.open_file(path, 'rt', errors='ignore') as data:
+            for line in data:
+                yield _split_csv_line(line.rstrip('\n'))
@@ -1,6 +1,12 @@
 from utils import dicts
 
 
+# Motores de cálculo das métricas COUNTER
+COUNTER_ENGINE_OBJECT = 'object'
+COUNTER_ENGINE_VECTOR = 'vector'
+COUNTER_ENGINES = (COUNTER_ENGINE_OBJECT, COUNTER_ENGINE_VECTOR)
+
+
 class CounterStat:
     """
     Modelo de dados utilizado para representar as métricas COUNTER R5
@@ -12,90 +18,65 @@ class CounterStat:
                         'platform': {},
                         'others': {}}
 
-    def _get_hits_by_session_and_content_type(self, hits: list):
-        """
-        Obtém um mapa de sessão -> content_type -> [hits]
-
-        :param hits: lista de hits
-        :return: um mapa de sessão para content_type e lista de hits
-        """
-        session_to_content_type_and_hits = {}
-
-        for hit in hits:
-            if hit.session_id not in session_to_content_type_and_hits:
-                session_to_content_type_and_hits[hit.session_id] = {}
-
-            if hit.content_type not in session_to_content_type_and_hits[hit.session_id]:
-                session_to_content_type_and_hits[hit.session_id][hit.content_type] = []
-
-            session_to_content_type_and_hits[hit.session_id][hit.content_type].append(hit)
-
-        return session_to_content_type_and_hits
-
-    def _get_total(self, hits: list, hit_type, content_type_list):
-        """
-        Obtém o número total de acessos nos moldes COUNTER R5.
-
-        :param hits: lista de hits
-        :param hit_type: tipo de hit a ser considerado (article, issue, journal, platform)
-        :content_type_list: lista que contém content_types a serem considerados
-        :return: número total e acessos
-        """
-        return sum([1 for x in hits if x.hit_type == hit_type and x.content_type in content_type_list])
-
-    def _get_unique(self, hits: list, hit_type, content_type_list):
+    def add_hits(self, group: str, key, hits):
         """
-        Obtém o número de acessos únicos nos moldes COUNTER R5.
+        Acumula, em uma única passagem, as métricas COUNTER dos hits de uma sessão e chave.
+        Um acesso é único quando é o primeiro da sessão com o respectivo content_type em um dia
 
-        :param hits: lista de hits
-        :param hit_type: tipo de hit a ser considerado (article, issue, journal, platform)
-        :content_type_list: lista que contém content_types a serem considerados
-        :return: número de acessos únicos
+        @param group: grupo de Hits (article | issue | journal | platform)
+        @param key: código da chave de agregação do grupo
+        @param hits: hits de uma mesma sessão e chave, sem cliques duplos
         """
-        unique_requests = 0
-        valid_hits = [h for h in hits if h.hit_type == hit_type and h.content_type in content_type_list]
-
-        session_to_content_type_and_hits = self._get_hits_by_session_and_content_type(valid_hits)
-        for session, content_type in session_to_content_type_and_hits.items():
-            unique_requests += len(content_type)
+        if not hits:
+            return
 
-        return unique_requests
-
-    def _calculate(self, datefied_hits: dict, key, target: dict, group: str):
         group_hit_type = dicts.group_to_hit_type[group]
         group_item_requests = dicts.group_to_item_requests[group]
         group_item_investigations = dicts.group_to_item_investigations[group]
 
-        for ymd in datefied_hits:
-            if key not in target:
-                target[key] = {}
-
-            if ymd not in target[key]:
-                target[key][ymd] = dicts.counter_item_metrics.copy()
-
-            target[key][ymd]['total_item_requests'] += self._get_total(
-                datefied_hits[ymd],
-                group_hit_type,
-                group_item_requests)
-
-            target[key][ymd]['total_item_investigations'] += self._get_total(
-                datefied_hits[ymd],
-                group_hit_type,
-                group_item_investigations)
+        if key not in self.metrics[group]:
+            self.metrics[group][key] = {}
+        key_metrics = self.metrics[group][key]
 
-            target[key][ymd]['unique_item_requests'] += self._get_unique(
-                datefied_hits[ymd],
-                group_hit_type,
-                group_item_requests)
+        # Pares (dia, content_type) já contados como acesso único nesta sessão
+        seen_content_types = set()
 
-            target[key][ymd]['unique_item_investigations'] += self._get_unique(
-                datefied_hits[ymd],
-                group_hit_type,
-                group_item_investigations)
+        for hit in hits:
+            if hit.hit_type != group_hit_type:
+                continue
+
+            is_request = hit.content_type in group_item_requests
+            is_investigation = hit.content_type in group_item_investigations
+            if not is_request and not is_investigation:
+                continue
+
+            ymd = hit.year_month_day
+            if ymd not in key_metrics:
+                key_metrics[ymd] = dicts.counter_item_metrics.copy()
+            ymd_metrics = key_metrics[ymd]
+
+            is_unique = (ymd, hit.content_type) not in seen_content_types
+            if is_unique:
+                seen_content_types.add((ymd, hit.content_type))
+
+            if is_request:
+                ymd_metrics['total_item_requests'] += 1
+                if is_unique:
+                    ymd_metrics['unique_item_requests'] += 1
+
+            if is_investigation:
+                ymd_metrics['total_item_investigations'] += 1
+                if is_unique:
+                    ymd_metrics['unique_item_investigations'] += 1
+
+    def decode_keys(self, key_encoders: dict):
+        """
+        Substitui os códigos das chaves de métricas pelas chaves originais
 
-            # Remove valores nulos
-            if sum(target[key][ymd].values()) == 0:
-                del target[key][ymd]
+        @param key_encoders: dicionário grupo -> Encoder das chaves de métricas
+        """
+        for group, key_metrics in self.metrics.items():
+            self.metrics[group] = {key_encoders[group].decode(k): v for k, v in key_metrics.items()}
 
     def calculate_metrics(self, data_content):
         """
@@ -106,27 +87,4 @@ class CounterStat:
         for group in data_content.keys():
             for session_id, key_hits in data_content[group].items():
                 for key, hits in key_hits.items():
-                    datefied_hits = self.get_datefied_hits(hits)
-                    self._calculate(datefied_hits, key, self.metrics[group], group)
-
-    def get_datefied_hits(self, hits):
-        """
-        Obtém os hits organizados por data (ANO -> MESES -> DIAS)
-
-        :param hits: lista de objetos Hit
-        :return: dicionário de hits do tipo YYYY -> {M1, M2, ... -> {D1, D2, ... -> [Hit1, Hit2, ...]}}
-        """
-        date_to_hits = {}
-
-        for hit in hits:
-            year = hit.server_time.year
-            month = hit.server_time.month
-            day = hit.server_time.day
-
-            year_month_day = '-'.join([str(year), str(month).zfill(2), str(day).zfill(2)])
-
-            if year_month_day not in date_to_hits:
-                date_to_hits[year_month_day] = []
-            date_to_hits[year_month_day].append(hit)
-
-        return date_to_hits
+                    self.add_hits(group, key, hits)
@@ -170,6 +170,66 @@ class SushiJournalMetric(Base):
     unique_item_investigations = Column(Integer, nullable=False)
 
 
+class IssueMetric(Base):
+    __tablename__ = 'counter_issue_metric'
+    __table_args__ = (UniqueConstraint('year_month_day', 'collection', 'idjournal_cim', 'issue', 'idlocalization_cim', name='uni_col_date_all_cim'),)
+    __table_args__ += (Index('idx_col_date_all_cim', 'collection', 'year_month_day', 'idjournal_cim', 'issue', 'idlocalization_cim'),)
+
+    id = Column(INTEGER(unsigned=True), primary_key=True, autoincrement=True)
+
+    collection = Column(VARCHAR(3), nullable=False)
+
+    idjournal_cim = Column(INTEGER(unsigned=True), ForeignKey('counter_journal.id', name='idjournal_cim'))
+    issue = Column(VARCHAR(128), nullable=False)
+    idlocalization_cim = Column(INTEGER(unsigned=True), ForeignKey('counter_localization.id', name='idlocalization_cim'))
+
+    year_month_day = Column(Date, nullable=False)
+
+    total_item_requests = Column(Integer, nullable=False)
+    total_item_investigations = Column(Integer, nullable=False)
+    unique_item_requests = Column(Integer, nullable=False)
+    unique_item_investigations = Column(Integer, nullable=False)
+
+
+class JournalPageMetric(Base):
+    __tablename__ = 'counter_journal_page_metric'
+    __table_args__ = (UniqueConstraint('year_month_day', 'collection', 'idjournal_cjpm', 'idlocalization_cjpm', name='uni_col_date_all_cjpm'),)
+    __table_args__ += (Index('idx_col_date_all_cjpm', 'collection', 'year_month_day', 'idjournal_cjpm', 'idlocalization_cjpm'),)
+
+    id = Column(INTEGER(unsigned=True), primary_key=True, autoincrement=True)
+
+    collection = Column(VARCHAR(3), nullable=False)
+
+    idjournal_cjpm = Column(INTEGER(unsigned=True), ForeignKey('counter_journal.id', name='idjournal_cjpm'))
+    idlocalization_cjpm = Column(INTEGER(unsigned=True), ForeignKey('counter_localization.id', name='idlocalization_cjpm'))
+
+    year_month_day = Column(Date, nullable=False)
+
+    total_item_requests = Column(Integer, nullable=False)
+    total_item_investigations = Column(Integer, nullable=False)
+    unique_item_requests = Column(Integer, nullable=False)
+    unique_item_investigations = Column(Integer, nullable=False)
+
+
+class PlatformMetric(Base):
+    __tablename__ = 'counter_platform_metric'
+    __table_args__ = (UniqueConstraint('year_month_day', 'collection', 'idlocalization_cpm', name='uni_col_date_loc_cpm'),)
+    __table_args__ += (Index('idx_col_date_loc_cpm', 'collection', 'year_month_day', 'idlocalization_cpm'),)
+
+    id = Column(INTEGER(unsigned=True), primary_key=True, autoincrement=True)
+
+    collection = Column(VARCHAR(3), nullable=False)
+
+    idlocalization_cpm = Column(INTEGER(unsigned=True), ForeignKey('counter_localization.id', name='idlocalization_cpm'))
+
+    year_month_day = Column(Date, nullable=False)
+
+    total_item_requests = Column(Integer, nullable=False)
+    total_item_investigations = Column(Integer, nullable=False)
+    unique_item_requests = Column(Integer, nullable=False)
+    unique_item_investigations = Column(Integer, nullable=False)
+
+
 class SushiArticleMetric(Base):
     __tablename__ = 'sushi_article_metric'
     __table_args__ = (UniqueConstraint('year_month_day', 'idarticle_sam', name='uni_date_art_sam'),)
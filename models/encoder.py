@@ -0,0 +1,38 @@
+class Encoder:
+    """
+    Codifica valores (sessões, chaves de métricas) em inteiros sequenciais e compactos.
+    Mantém a lista reversa para obter o valor original de um código no momento da exportação
+    """
+    def __init__(self):
+        self.value_to_code = {}
+        self.code_to_value = []
+
+    def encode(self, value):
+        """
+        Obtém o código de um valor, atribuindo um novo código a valores ainda não vistos
+
+        @param value: valor hasheável
+        @return: código inteiro
+        """
+        code = self.value_to_code.get(value)
+        if code is None:
+            code = len(self.code_to_value)
+            self.value_to_code[value] = code
+            self.code_to_value.append(value)
+        return code
+
+    def decode(self, code: int):
+        """
+        Obtém o valor original de um código
+
+        @param code: código inteiro
+        @return: o valor associado ao código
+        """
+        return self.code_to_value[code]
+
+    def reset(self):
+        self.value_to_code = {}
+        self.code_to_value = []
+
+    def __len__(self):
+        return len(self.code_to_value)
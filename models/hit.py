@@ -1,35 +1,87 @@
 import logging
+import sys
 
+from collections import OrderedDict
 from datetime import datetime
 from socket import inet_ntoa
 from utils import map_actions as at
 from utils import values
 from libs import lib_hit, lib_counter
+from models.counter import COUNTER_ENGINE_OBJECT, COUNTER_ENGINE_VECTOR
+from models.encoder import Encoder
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
 
 
 class Hit:
     """
-    Classe que representa o acesso a uma página (ação)
+    Classe que representa o acesso a uma página (ação).
+    Usa __slots__, pois todos os Hits rastreáveis permanecem em memória até a próxima execução das rotinas COUNTER
     """
+    __slots__ = ('ip',
+                 'latitude',
+                 'longitude',
+                 'server_time',
+                 'server_timestamp',
+                 'year_month_day',
+                 'date_slice',
+                 'browser_name',
+                 'browser_version',
+                 'action_name',
+                 'valid',
+                 'session_id',
+                 'collection',
+                 'pid',
+                 'acronym',
+                 'format',
+                 'lang',
+                 'script',
+                 'issn',
+                 'fragment',
+                 'content_type',
+                 'hit_type',
+                 'yop')
+
+    # Atributos textuais com poucos valores distintos, compartilhados entre Hits por meio de sys.intern
+    INTERNED_ATTRS = ('collection',
+                      'pid',
+                      'acronym',
+                      'format',
+                      'lang',
+                      'issn',
+                      'yop')
+
     def __init__(self, **kargs):
         # Endereço IP
-        self.ip = kargs.get('ip', '')
+        self.ip = _intern(kargs.get('ip', ''))
 
         # Localização associada ao IP
-        self.latitude = kargs.get('latitude', '')
-        self.longitude = kargs.get('longitude', '')
+        self.latitude = _intern(kargs.get('latitude', ''))
+        self.longitude = _intern(kargs.get('longitude', ''))
 
         # Data e horário do acesso
         if isinstance(kargs.get('serverTime', ''), datetime):
             self.server_time = kargs.get('serverTime')
         else:
-            self.server_time = datetime.strptime(kargs.get('serverTime', ''), '%Y-%m-%d %H:%M:%S')
+            self.server_time = lib_hit.parse_server_time(kargs.get('serverTime', ''))
+
+        # Chaves derivadas da data e horário do acesso, obtidas uma única vez
+        # Segundos desde 0001-01-01, usados na comparação de horários (cliques-duplos)
+        self.server_timestamp = lib_hit.get_server_timestamp(self.server_time)
+
+        # Dia no formato YYYY-MM-DD, usado no cálculo e na exportação das métricas
+        self.year_month_day = _intern('%d-%02d-%02d' % (self.server_time.year, self.server_time.month, self.server_time.day))
+
+        # Fatia de data e hora no formato YYYY-M-D|H, usada no ID de sessão
+        self.date_slice = _intern(lib_counter.extract_slice(self.server_time))
 
         # Nome do navegador utilizado
-        self.browser_name = kargs.get('browserName', '').lower()
+        self.browser_name = _intern(kargs.get('browserName', '').lower())
 
         # Versão do navegador utilizado
-        self.browser_version = kargs.get('browserVersion', '').lower()
+        self.browser_version = _intern(kargs.get('browserVersion', '').lower())
 
         # URL da ação
         self.action_name = kargs.get('actionName', '')
@@ -37,6 +89,29 @@ class Hit:
         # Um boleano que indica se o Hit é válido
         self.valid = True
 
+        # Código da sessão, atribuído por HitManager.create_hit (ver HitManager.session_encoder)
+        self.session_id = None
+
+        # Atributos obtidos por HitManager.set_hit_attrs
+        self.collection = ''
+        self.pid = ''
+        self.acronym = ''
+        self.format = ''
+        self.lang = ''
+        self.script = ''
+        self.issn = ''
+        self.fragment = ''
+        self.content_type = None
+        self.hit_type = None
+        self.yop = ''
+
+    def intern_attrs(self):
+        """
+        Compartilha, entre Hits, as strings de atributos com valores repetidos
+        """
+        for k in self.INTERNED_ATTRS:
+            setattr(self, k, _intern(getattr(self, k)))
+
     def _is_from_local_network(self):
         if not self.latitude or self.latitude.lower() in {'', 'null'}:
             return True
@@ -112,7 +187,20 @@ class HitManager:
     """
     Classe que gerencia objetos Hit
     """
-    def __init__(self, path_pdf_to_pid, issn_to_acronym, pid_to_format_lang, pid_to_yop, persist_on_database, flag_include_other_hit_types=False):
+    # Atributos de Hit que dependem apenas da coleção, da URL de ação e dos dicionários (armazenáveis em cache)
+    URL_ATTRS = ('action_name',
+                 'pid',
+                 'acronym',
+                 'format',
+                 'lang',
+                 'script',
+                 'issn',
+                 'content_type',
+                 'hit_type',
+                 'yop',
+                 'valid')
+
+    def __init__(self, path_pdf_to_pid, issn_to_acronym, pid_to_format_lang, pid_to_yop, persist_on_database, flag_include_other_hit_types=False, url_cache_size=0, counter_engine=COUNTER_ENGINE_OBJECT):
         self.hits = {'article': {}, 'issue': {}, 'journal': {}, 'platform': {}, 'others': {}}
 
         # Dicionários para tratamento de PID
@@ -131,6 +219,28 @@ class HitManager:
         # Utilizada para analisar corretude de lista de Hits e de Métricas
         self.persist_on_database = persist_on_database
 
+        # Cache LRU de atributos derivados da URL de ação, indexado por (coleção, action_name). Tamanho 0 desativa o cache
+        self.url_cache_size = url_cache_size
+        self.url_cache = OrderedDict()
+        self.url_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+        # Hits do IP corrente, por (grupo, sessão, chave). Permitem refazer a remoção de cliques duplos de uma chave
+        # cujos hits chegaram fora de ordem cronológica. Como o ID de sessão contém o IP, uma chave não recebe mais hits
+        # após a troca de IP (as pré-tabelas são ordenadas por IP)
+        self.current_ip = None
+        self.current_ip_hits = {}
+        self.unordered_keys = set()
+
+        # Motor de cálculo das métricas. No motor vetorizado, os hits são apenas acumulados em raw_hits,
+        # e a remoção de cliques duplos é feita por VectorCounterStat
+        self.counter_engine = counter_engine
+        self.raw_hits = []
+
+        # Codificadores de sessões e de chaves de métricas (por grupo) em inteiros. Os hits e as métricas de uma janela
+        # de cálculo são indexados pelos códigos, e os valores originais são obtidos apenas na exportação
+        self.session_encoder = Encoder()
+        self.key_encoders = {group: Encoder() for group in self.hits}
+
     def _generate_acronym_to_issn(self):
         """
         Obtém um dicionário Acrônimo:ISSN a partir de ISSN:Acrônimo
@@ -173,6 +283,11 @@ class HitManager:
 
             # Caso Hit seja rastreável (associável a um Periódico, Fascículo ou Artigo)
             if new_hit.is_trackable_hit(self.flag_include_other_hit_types):
+                new_hit.intern_attrs()
+                new_hit.session_id = self.session_encoder.encode((new_hit.ip,
+                                                                  new_hit.browser_name,
+                                                                  new_hit.browser_version,
+                                                                  new_hit.date_slice))
                 return new_hit
 
         # Caso Hit seja ou inválido ou não rastreável
@@ -180,42 +295,109 @@ class HitManager:
 
     def set_hit_attrs(self, hit, default_collection):
         """
-        Seta os atributos de um Hit usando dados do Hit Manager
+        Seta os atributos de um Hit usando dados do Hit Manager.
+        Os atributos derivados da URL de ação são obtidos do cache de URLs, quando possível
 
         @hit: um objeto Hit
         """
-        # Gera um ID de sessão
-        hit.session_id = lib_counter.generate_session_id(hit.ip,
-                                                         hit.browser_name,
-                                                         hit.browser_version,
-                                                         hit.server_time)
-
         # Obtém coleção ao qual o Hit pertence
         hit.collection = default_collection
 
+        if self.url_cache_size <= 0:
+            self._set_url_attrs(hit)
+            return
+
+        cache_key = (hit.collection, hit.action_name)
+        cached = self.url_cache.get(cache_key)
+
+        if cached is None:
+            self.url_cache_stats['misses'] += 1
+
+            url_format = self._set_url_attrs(hit)
+
+            # Em URLs clássicas, o ISSN pode depender de pid_to_issn, que muda ao longo do processamento
+            if url_format != 'classic' or lib_hit.is_journal_issn_in_pid(hit.pid):
+                self._add_to_url_cache(cache_key, url_format, hit)
+        else:
+            self.url_cache.move_to_end(cache_key)
+            self.url_cache_stats['hits'] += 1
+
+            url_format, attrs = cached
+            for k, v in zip(self.URL_ATTRS, attrs):
+                setattr(hit, k, v)
+
+            # Repete a atualização de pid_to_issn feita pelo cálculo original dos atributos
+            if url_format == 'pre':
+                if hit.pid:
+                    self._update_pid_to_issn(hit.pid, hit.issn)
+            elif url_format in {'ssp', 'new'}:
+                if hit.hit_type == at.HIT_TYPE_ARTICLE:
+                    self._update_pid_to_issn(hit.pid, hit.issn)
+
+    def _set_url_attrs(self, hit):
+        """
+        Seta os atributos de um Hit derivados da URL de ação
+
+        @hit: um objeto Hit
+        @return: o formato da URL de ação (pre, ssp, new ou classic)
+        """
         if hit.collection == 'pre':
             self._set_hit_attrs_preprint_url(hit)
+            return 'pre'
         elif hit.collection == 'ssp':
             self._set_hit_attrs_ssp_url(hit)
+            return 'ssp'
         else:
             if lib_hit.is_new_url_format(hit.action_name.lower()):
                 self._set_hit_attrs_new_url(hit)
+                return 'new'
             else:
                 self._set_hit_attrs_classic_url(hit)
+                return 'classic'
+
+    def _add_to_url_cache(self, cache_key, url_format, hit):
+        self.url_cache[cache_key] = (url_format, tuple(getattr(hit, k) for k in self.URL_ATTRS))
+
+        if len(self.url_cache) > self.url_cache_size:
+            self.url_cache.popitem(last=False)
+            self.url_cache_stats['evictions'] += 1
+
+    def get_url_cache_stats(self):
+        """
+        Obtém estatísticas de uso do cache de URLs
+
+        @return: dicionário com acertos, falhas, remoções, tamanho atual e taxa de acerto
+        """
+        stats = self.url_cache_stats.copy()
+        stats['size'] = len(self.url_cache)
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+
+        return stats
+
+    def _update_pid_to_issn(self, pid, issn):
+        if pid not in self.pid_to_issn:
+            if issn:
+                self.pid_to_issn[pid] = {issn}
+        else:
+            self.pid_to_issn[pid].add(issn)
+            if len(self.pid_to_issn[pid]) > 2:
+                logging.warning('PID %s está associado a mais de dois ISSNs: %s' % (pid, self.pid_to_issn[pid]))
 
     def _set_hit_attrs_new_url(self, hit):
-        hit.action_params = lib_hit.get_url_params_from_action_new_url(hit.action_name)
+        action_params = lib_hit.get_url_params_from_action_new_url(hit.action_name)
 
-        hit.pid = hit.action_params['pid']
-        hit.acronym = hit.action_params['acronym'].lower()
-        hit.format = hit.action_params['format'].lower()
-        hit.lang = hit.action_params['lang'].lower()
+        hit.pid = action_params['pid']
+        hit.acronym = action_params['acronym'].lower()
+        hit.format = action_params['format'].lower()
+        hit.lang = action_params['lang'].lower()
 
-        if hit.action_params['resource_ssm_path']:
-            hit.action_params.update(lib_hit.get_attrs_from_ssm_path(hit.action_params['resource_ssm_path']))
-            hit.issn = hit.action_params['issn'].upper()
-            hit.format = hit.action_params['format'].lower()
-            hit.pid = hit.action_params['pid']
+        if action_params['resource_ssm_path']:
+            action_params.update(lib_hit.get_attrs_from_ssm_path(action_params['resource_ssm_path']))
+            hit.issn = action_params['issn'].upper()
+            hit.format = action_params['format'].lower()
+            hit.pid = action_params['pid']
 
         if not hit.has_valid_format():
             hit.valid = False
@@ -230,16 +412,10 @@ class HitManager:
             # Dicionário de acrônimos não contém coleção nbr - os dados são idênticos ao da coleção scl
             collection_to_check = 'scl' if hit.collection == 'nbr' else hit.collection
 
-            if 'issn' not in hit.__dict__.keys() or not hit.issn:
+            if not hit.issn:
                 hit.issn = self.acronym_to_issn.get(collection_to_check, {}).get(hit.acronym, [''])[0].upper()
 
-            if hit.pid not in self.pid_to_issn:
-                if hit.issn:
-                    self.pid_to_issn[hit.pid] = {hit.issn}
-            else:
-                self.pid_to_issn[hit.pid].add(hit.issn)
-                if len(self.pid_to_issn[hit.pid]) > 2:
-                    logging.warning('PID %s está associado a mais de dois ISSNs: %s' % (hit.pid, self.pid_to_issn[hit.pid]))
+            self._update_pid_to_issn(hit.pid, hit.issn)
 
             hit.yop = lib_hit.get_year_of_publication_new_url(hit, self.pid_to_yop)
             if not hit.lang or not hit.has_valid_language():
@@ -249,13 +425,13 @@ class HitManager:
         hit.action_name = hit.action_name.lower()
 
         # Extrai parâmetros da URL de ação de um Hit
-        hit.action_params = lib_hit.get_url_params_from_action(hit.action_name)
+        action_params = lib_hit.get_url_params_from_action(hit.action_name)
 
         # Obtém dados a partir dos parâmetros extraídos (relacionados ao formato de URL clássica)
-        hit.pid = hit.action_params.get('pid', '').upper()
-        hit.lang = hit.action_params.get('tlng', '')
-        hit.script = hit.action_params.get('script', '')
-        hit.issn = hit.action_params.get('issn', '').upper()
+        hit.pid = action_params.get('pid', '').upper()
+        hit.lang = action_params.get('tlng', '')
+        hit.script = action_params.get('script', '')
+        hit.issn = action_params.get('issn', '').upper()
 
         # Obtém PID do Hit, caso parâmetro de URL não tenha conseguido obtê-lo
         if not hit.pid:
@@ -285,8 +461,7 @@ class HitManager:
 
         if hit.pid:
             hit.hit_type = lib_hit.ma.HIT_TYPE_ARTICLE
-            if hit.pid not in self.pid_to_issn:
-                self.pid_to_issn[hit.pid] = {hit.issn}
+            self._update_pid_to_issn(hit.pid, hit.issn)
         else:
             hit.hit_type = lib_hit.ma.HIT_TYPE_OTHERS
 
@@ -296,25 +471,19 @@ class HitManager:
         hit.yop = lib_hit.get_year_of_publication_preprints(hit, self.pid_to_yop)
 
     def _set_hit_attrs_ssp_url(self, hit):
-        hit.action_params = lib_hit.get_url_params_from_action_ssp_url(hit.action_name)
+        action_params = lib_hit.get_url_params_from_action_ssp_url(hit.action_name)
 
-        hit.acronym = hit.action_params['acronym'].lower()
-        hit.format = hit.action_params['format'].lower()
-        hit.lang = hit.action_params['lang'].lower()
+        hit.acronym = action_params['acronym'].lower()
+        hit.format = action_params['format'].lower()
+        hit.lang = action_params['lang'].lower()
         hit.content_type = lib_hit.get_content_type_ssp_url(hit)
         hit.hit_type = lib_hit.get_hit_type_ssp(hit.action_name.lower())
 
         if hit.hit_type == at.HIT_TYPE_ARTICLE:
-            hit.pid = lib_hit.get_ssp_pid(hit.action_params)
+            hit.pid = lib_hit.get_ssp_pid(action_params)
             hit.issn = self.acronym_to_issn.get('spa', {}).get(hit.acronym, [''])[0].upper()
 
-            if hit.pid not in self.pid_to_issn:
-                if hit.issn:
-                    self.pid_to_issn[hit.pid] = {hit.issn}
-            else:
-                self.pid_to_issn[hit.pid].add(hit.issn)
-                if len(self.pid_to_issn[hit.pid]) > 2:
-                    logging.warning('PID %s está associado a mais de dois ISSNs: %s' %(hit.pid, self.pid_to_issn[hit.pid]))
+            self._update_pid_to_issn(hit.pid, hit.issn)
 
             hit.yop = lib_hit.get_year_of_publication_ssp_pid(hit.pid)
             if not hit.lang or not hit.has_valid_language():
@@ -325,24 +494,64 @@ class HitManager:
         Limpa registros do HitManager
         """
         self.hits = {'article': {}, 'issue': {}, 'journal': {}, 'platform': {}, 'others': {}}
+        self.current_ip = None
+        self.current_ip_hits = {}
+        self.unordered_keys = set()
+        self.raw_hits = []
 
-    def add_hit(self, hit: Hit):
+        self.session_encoder.reset()
+        for key_encoder in self.key_encoders.values():
+            key_encoder.reset()
+
+    def get_session_id(self, session_code: int):
+        """
+        Obtém o ID de sessão, no formato IP|NAVEGADOR/VERSÃO|YYYY-MM-DD|H, a partir do código da sessão
+
+        @param session_code: código da sessão
+        @return: uma str que representa um ID de sessão
+        """
+        ip, browser_name, browser_version, date_slice = self.session_encoder.decode(session_code)
+        return lib_counter.generate_session_id_from_slice(ip, browser_name, browser_version, date_slice)
+
+    @staticmethod
+    def get_group_and_key(hit: Hit):
+        """
+        Obtém o grupo e a chave de agregação de um Hit
+
+        @param hit: um objeto Hit
+        @return: uma tupla (grupo, chave)
+        """
         if hit.hit_type == at.HIT_TYPE_ARTICLE:
-            key = (hit.pid, hit.format, hit.lang, hit.latitude, hit.longitude, hit.yop)
-            group = 'article'
+            return 'article', (hit.pid, hit.format, hit.lang, hit.latitude, hit.longitude, hit.yop)
         elif hit.hit_type == at.HIT_TYPE_ISSUE:
             issue_code = hit.pid
-            key = (hit.issn, issue_code, hit.latitude, hit.longitude)
-            group = 'issue'
+            return 'issue', (hit.issn, issue_code, hit.latitude, hit.longitude)
         elif hit.hit_type == at.HIT_TYPE_JOURNAL:
-            key = (hit.issn, hit.latitude, hit.longitude)
-            group = 'journal'
+            return 'journal', (hit.issn, hit.latitude, hit.longitude)
         elif hit.hit_type == at.HIT_TYPE_PLATFORM:
-            key = ('scielo', hit.latitude, hit.longitude)
-            group = 'platform'
+            return 'platform', ('scielo', hit.latitude, hit.longitude)
         else:
-            key = ('others', hit.latitude, hit.longitude)
-            group = 'others'
+            return 'others', ('others', hit.latitude, hit.longitude)
+
+    def add_hit(self, hit: Hit):
+        """
+        Adiciona um Hit, removendo cliques duplos de forma incremental.
+        Para cada (sessão, chave), o Hit é comparado apenas com o último Hit aceito. Caso seja um clique duplo, substitui
+        o Hit aceito; caso contrário, é acrescentado. Hits fora de ordem cronológica marcam a chave para ser reprocessada,
+        com ordenação, ao término do IP corrente
+
+        @param hit: um objeto Hit
+        """
+        if self.counter_engine == COUNTER_ENGINE_VECTOR:
+            self.raw_hits.append(hit)
+            return
+
+        if hit.ip != self.current_ip:
+            self._close_current_ip()
+            self.current_ip = hit.ip
+
+        group, key = self.get_group_and_key(hit)
+        key = self.key_encoders[group].encode(key)
 
         if hit.session_id not in self.hits[group]:
             self.hits[group][hit.session_id] = {}
@@ -350,31 +559,61 @@ class HitManager:
         if key not in self.hits[group][hit.session_id]:
             self.hits[group][hit.session_id][key] = []
 
-        self.hits[group][hit.session_id][key].append(hit)
+        hits = self.hits[group][hit.session_id][key]
+
+        ip_key = (group, hit.session_id, key)
+        if ip_key not in self.current_ip_hits:
+            self.current_ip_hits[ip_key] = list(hits)
+        self.current_ip_hits[ip_key].append(hit)
+
+        if ip_key in self.unordered_keys:
+            return
+
+        if not hits:
+            hits.append(hit)
+        elif hit.server_timestamp >= hits[-1].server_timestamp:
+            if lib_counter.is_double_click(group, hits[-1], hit):
+                hits[-1] = hit
+            else:
+                hits.append(hit)
+        else:
+            self.unordered_keys.add(ip_key)
+
+    def _close_current_ip(self):
+        """
+        Refaz, com ordenação, a remoção de cliques duplos das chaves do IP corrente que receberam hits fora de ordem
+        """
+        for group, session, key in self.unordered_keys:
+            sorted_hits = sorted(self.current_ip_hits[(group, session, key)], key=lambda x: x.server_timestamp)
+            self.hits[group][session][key] = self._remove_double_clicks_from_sorted_hits(group, sorted_hits)
+
+        self.current_ip_hits = {}
+        self.unordered_keys = set()
+
+    @staticmethod
+    def _remove_double_clicks_from_sorted_hits(group, sorted_hits):
+        """
+        Remove cliques duplos de uma lista de hits ordenada por tempo. Em cada par de hits consecutivos que configura
+        clique duplo, é mantido o hit mais recente
+
+        @param group: grupo de Hits (article | issue | journal | platform | others)
+        @param sorted_hits: lista de hits de uma mesma sessão e chave, ordenada por server_timestamp
+        @return: lista de hits sem cliques duplos
+        """
+        cleaned_hits = []
+
+        for past_hit, current_hit in zip(sorted_hits, sorted_hits[1:]):
+            if not lib_counter.is_double_click(group, past_hit, current_hit):
+                cleaned_hits.append(past_hit)
+
+        if sorted_hits:
+            cleaned_hits.append(sorted_hits[-1])
+
+        return cleaned_hits
 
     def remove_double_clicks(self):
         """
-        Remove cliques duplos. São comparados os hits dentro de uma sessão.
+        Conclui a remoção de cliques duplos. Os hits ordenados já foram tratados em add_hit; resta reprocessar as chaves
+        do IP corrente que receberam hits fora de ordem
         """
-        for group, session_key_hits in self.hits.items():
-            for session, key_hits in session_key_hits.items():
-                for key, hits in key_hits.items():
-                    cleaned_hits = []
-
-                    if len(hits) > 1:
-                        sorted_hits = sorted(hits, key=lambda x: x.server_time)
-
-                        for i in range(len(sorted_hits) - 1):
-                            past_hit = sorted_hits[i]
-                            current_hit = sorted_hits[i + 1]
-
-                            if not lib_counter.is_double_click(group, past_hit, current_hit):
-                                cleaned_hits.append(past_hit)
-                                if i + 2 == len(sorted_hits):
-                                    cleaned_hits.append(current_hit)
-                            elif i + 2 == len(sorted_hits):
-                                cleaned_hits.append(current_hit)
-                    else:
-                        cleaned_hits.extend(hits)
-
-                    key_hits[key] = cleaned_hits
+        self._close_current_ip()
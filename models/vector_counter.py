@@ -0,0 +1,228 @@
+from models.counter import CounterStat, COUNTER_ENGINES, COUNTER_ENGINE_VECTOR
+from models.hit import HitManager
+from utils import dicts
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Intervalo máximo, em segundos, entre dois hits equivalentes para que o segundo seja considerado clique duplo
+DOUBLE_CLICK_SECONDS = 30
+
+
+def check_counter_engine(counter_engine: str):
+    """
+    Verifica se um motor de métricas COUNTER pode ser utilizado no ambiente atual
+
+    @param counter_engine: motor de cálculo (um dos valores de COUNTER_ENGINES)
+    """
+    if counter_engine not in COUNTER_ENGINES:
+        raise ValueError('Motor de métricas COUNTER desconhecido: %s' % counter_engine)
+
+    if counter_engine == COUNTER_ENGINE_VECTOR and np is None:
+        raise ImportError('Motor vetorizado exige o pacote numpy')
+
+
+def _get_double_click_signature(group, hit):
+    """
+    Obtém os atributos comparados por lib_counter.is_double_click para identificar um clique duplo
+
+    @param group: grupo de Hits (article | issue | journal | platform | others)
+    @param hit: um objeto Hit
+    @return: tupla de atributos
+    """
+    if group == 'article':
+        return hit.pid, hit.format, hit.content_type, hit.lang
+    if group == 'issue' or group == 'journal':
+        return hit.issn, hit.pid, hit.content_type
+    return hit.content_type, hit.action_name
+
+
+def _encode(codes: dict, value):
+    """
+    Obtém o código inteiro de um valor, atribuindo um novo código (sequencial) a valores ainda não vistos
+    """
+    code = codes.get(value)
+    if code is None:
+        code = len(codes)
+        codes[value] = code
+    return code
+
+
+def _count_by_code(codes, mask):
+    """
+    Conta as ocorrências de cada código entre as posições selecionadas por mask
+
+    @return: dicionário código -> número de ocorrências
+    """
+    values, counts = np.unique(codes[mask], return_counts=True)
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+class VectorCounterStat(CounterStat):
+    """
+    Motor vetorizado de métricas COUNTER R5.
+    Os hits são carregados em arrays colunares de códigos inteiros (sessão e chave, assinatura de clique duplo,
+    content_type, dia) e de tempos em segundos. A remoção de cliques duplos é feita por ordenação e diferenças de tempo
+    entre hits consecutivos, e as métricas são obtidas por agrupamentos com numpy.unique.
+    O resultado, em self.metrics, tem a mesma estrutura de CounterStat.metrics, e os hits mantidos, em self.hits,
+    a mesma estrutura de HitManager.hits
+    """
+    def __init__(self):
+        if np is None:
+            raise ImportError('Motor vetorizado exige o pacote numpy')
+
+        super().__init__()
+
+        self.hits = {'article': {},
+                     'issue': {},
+                     'journal': {},
+                     'platform': {},
+                     'others': {}}
+
+    def calculate_metrics(self, hits: list, key_encoders: dict):
+        """
+        Remove cliques duplos e calcula métricas COUNTER de uma lista de hits, na ordem em que foram lidos
+
+        @param hits: lista de objetos Hit
+        @param key_encoders: dicionário grupo -> Encoder das chaves de métricas
+        """
+        group_to_hits = {}
+        for hit in hits:
+            group, key = HitManager.get_group_and_key(hit)
+            key = key_encoders[group].encode(key)
+            if group not in group_to_hits:
+                group_to_hits[group] = []
+            group_to_hits[group].append((hit, key))
+
+        for group, hits_and_keys in group_to_hits.items():
+            self._calculate_group(group, hits_and_keys)
+
+    def _calculate_group(self, group, hits_and_keys):
+        group_hit_type = dicts.group_to_hit_type[group]
+        group_item_requests = dicts.group_to_item_requests[group]
+        group_item_investigations = dicts.group_to_item_investigations[group]
+
+        session_key_codes = {}
+        key_codes = {}
+        signature_codes = {}
+        content_type_codes = {}
+        ymd_codes = {}
+
+        n_hits = len(hits_and_keys)
+        session_key_column = np.empty(n_hits, dtype=np.int64)
+        signature_column = np.empty(n_hits, dtype=np.int64)
+        content_type_column = np.empty(n_hits, dtype=np.int64)
+        ymd_column = np.empty(n_hits, dtype=np.int64)
+        valid_column = np.empty(n_hits, dtype=bool)
+        time_column = np.empty(n_hits, dtype=np.float64)
+
+        session_key_to_key_code = []
+
+        for i, (hit, key) in enumerate(hits_and_keys):
+            session_key = (hit.session_id, key)
+            if session_key not in session_key_codes:
+                session_key_codes[session_key] = len(session_key_codes)
+                session_key_to_key_code.append(_encode(key_codes, key))
+
+            session_key_column[i] = session_key_codes[session_key]
+            signature_column[i] = _encode(signature_codes, _get_double_click_signature(group, hit))
+            content_type_column[i] = _encode(content_type_codes, hit.content_type)
+            ymd_column[i] = _encode(ymd_codes, hit.year_month_day)
+            valid_column[i] = hit.hit_type == group_hit_type
+            time_column[i] = hit.server_timestamp
+
+        # Ordena por sessão e chave, tempo e ordem de leitura
+        order = np.lexsort((np.arange(n_hits), time_column, session_key_column))
+
+        sorted_session_key = session_key_column[order]
+        sorted_signature = signature_column[order]
+        sorted_time = time_column[order]
+
+        # Um hit é clique duplo do anterior quando o seguinte, na mesma sessão e chave, é equivalente e próximo no tempo.
+        # Nesse caso, é mantido apenas o hit mais recente
+        is_double_click = ((sorted_session_key[:-1] == sorted_session_key[1:]) &
+                           (sorted_signature[:-1] == sorted_signature[1:]) &
+                           (sorted_time[1:] - sorted_time[:-1] <= DOUBLE_CLICK_SECONDS))
+
+        keep = np.ones(n_hits, dtype=bool)
+        keep[:-1] = ~is_double_click
+        kept = order[keep]
+
+        self._set_kept_hits(group, hits_and_keys, kept)
+
+        # Métricas por (chave, dia). Acessos únicos são pares (sessão, content_type) distintos em um dia
+        content_types = list(content_type_codes)
+        is_request = np.array([ct in group_item_requests for ct in content_types], dtype=bool)
+        is_investigation = np.array([ct in group_item_investigations for ct in content_types], dtype=bool)
+
+        kept_session_key = session_key_column[kept]
+        kept_content_type = content_type_column[kept]
+        kept_ymd = ymd_column[kept]
+        kept_valid = valid_column[kept]
+
+        n_ymd = len(ymd_codes)
+        n_content_types = len(content_type_codes)
+
+        kept_key_ymd = np.array(session_key_to_key_code, dtype=np.int64)[kept_session_key] * n_ymd + kept_ymd
+        kept_session_key_ymd_content_type = (kept_session_key * n_ymd + kept_ymd) * n_content_types + kept_content_type
+
+        requests_mask = kept_valid & is_request[kept_content_type]
+        investigations_mask = kept_valid & is_investigation[kept_content_type]
+
+        metric_to_counts = {
+            'total_item_requests': _count_by_code(kept_key_ymd, requests_mask),
+            'total_item_investigations': _count_by_code(kept_key_ymd, investigations_mask),
+            'unique_item_requests': self._count_unique(kept_session_key_ymd_content_type, requests_mask, session_key_to_key_code, n_ymd, n_content_types),
+            'unique_item_investigations': self._count_unique(kept_session_key_ymd_content_type, investigations_mask, session_key_to_key_code, n_ymd, n_content_types),
+        }
+
+        keys = list(key_codes)
+        ymds = list(ymd_codes)
+
+        target = self.metrics[group]
+        for key in keys:
+            if key not in target:
+                target[key] = {}
+
+        for metric, counts in metric_to_counts.items():
+            for key_ymd, count in counts.items():
+                key_code, ymd_code = divmod(key_ymd, n_ymd)
+                key_metrics = target[keys[key_code]]
+
+                ymd = ymds[ymd_code]
+                if ymd not in key_metrics:
+                    key_metrics[ymd] = dicts.counter_item_metrics.copy()
+                key_metrics[ymd][metric] += count
+
+    @staticmethod
+    def _count_unique(session_key_ymd_content_type, mask, session_key_to_key_code, n_ymd, n_content_types):
+        """
+        Conta, por (chave, dia), o número de pares (sessão, content_type) distintos entre as posições selecionadas por mask
+        """
+        distinct = np.unique(session_key_ymd_content_type[mask])
+
+        session_key_ymd = distinct // n_content_types
+        session_key, ymd = np.divmod(session_key_ymd, n_ymd)
+        key_ymd = np.array(session_key_to_key_code, dtype=np.int64)[session_key] * n_ymd + ymd
+
+        return _count_by_code(key_ymd, np.ones(len(key_ymd), dtype=bool))
+
+    def _set_kept_hits(self, group, hits_and_keys, kept):
+        """
+        Organiza os hits mantidos na estrutura sessão -> chave -> [hits] de HitManager.hits
+        """
+        session_key_hits = self.hits[group]
+
+        for i in kept.tolist():
+            hit, key = hits_and_keys[i]
+
+            if hit.session_id not in session_key_hits:
+                session_key_hits[hit.session_id] = {}
+
+            if key not in session_key_hits[hit.session_id]:
+                session_key_hits[hit.session_id][key] = []
+
+            session_key_hits[hit.session_id][key].append(hit)
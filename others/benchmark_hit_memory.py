@@ -0,0 +1,50 @@
+import argparse
+import tracemalloc
+
+from libs import lib_pretable
+from models.hit import HitManager
+from proc.calculate_metrics import load_dictionaries
+
+
+parser = argparse.ArgumentParser('Mede a memória ocupada pelos Hits mantidos pelo HitManager até a execução das rotinas COUNTER')
+parser.add_argument('-p', '--pretable', dest='pretable', required=True, help='Caminho de uma pré-tabela')
+parser.add_argument('-d', '--dir_dictionaries', dest='dir_dictionaries', required=True, help='Diretório dos dicionários')
+parser.add_argument('-v', '--dict_date', dest='dict_date', required=True, help='Data, no formato YYYY-MM-DD, da versão dos dicionários')
+parser.add_argument('-c', '--collection', dest='collection', default='scl', help='Acrônimo da coleção')
+parser.add_argument('-n', '--max_rows', dest='max_rows', type=int, default=0, help='Número máximo de linhas lidas da pré-tabela')
+params = parser.parse_args()
+
+maps = load_dictionaries(params.dir_dictionaries, params.dict_date)
+hit_manager = HitManager(path_pdf_to_pid=maps['pdf-pid'],
+                         issn_to_acronym=maps['issn-acronym'],
+                         pid_to_format_lang=maps['pid-format-lang'],
+                         pid_to_yop=maps['pid-dates'],
+                         persist_on_database=False,
+                         url_cache_size=0)
+
+tracemalloc.start()
+memory_start, _ = tracemalloc.get_traced_memory()
+
+rows_counter = 0
+hits_counter = 0
+
+for row in lib_pretable.read_pretable(params.pretable):
+    rows_counter += 1
+    if params.max_rows and rows_counter > params.max_rows:
+        break
+
+    hit = hit_manager.create_hit(row, 'pretable', params.collection)
+    if hit:
+        hit_manager.add_hit(hit)
+        hits_counter += 1
+
+memory_end, memory_peak = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+
+memory_hits = memory_end - memory_start
+
+print('Linhas lidas: %d' % rows_counter)
+print('Hits mantidos: %d' % hits_counter)
+print('Memória ocupada: %.2f MB (pico de %.2f MB)' % (memory_hits / 1024 ** 2, (memory_peak - memory_start) / 1024 ** 2))
+if hits_counter:
+    print('Bytes por Hit: %.1f' % (memory_hits / hits_counter))
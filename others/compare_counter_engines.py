@@ -0,0 +1,73 @@
+import argparse
+import time
+
+from libs import lib_pretable
+from models.counter import CounterStat
+from models.hit import HitManager
+from models.vector_counter import VectorCounterStat
+from proc.calculate_metrics import load_dictionaries
+
+
+def get_kept_hits(hits):
+    kept_hits = set()
+    for group, session_key_hits in hits.items():
+        for session, key_hits in session_key_hits.items():
+            for key, hits_list in key_hits.items():
+                for hit in hits_list:
+                    kept_hits.add((group, key, id(hit)))
+    return kept_hits
+
+
+parser = argparse.ArgumentParser('Compara os motores de métricas COUNTER (object e vector) em uma mesma pré-tabela')
+parser.add_argument('-p', '--pretable', dest='pretable', required=True, help='Caminho de uma pré-tabela')
+parser.add_argument('-d', '--dir_dictionaries', dest='dir_dictionaries', required=True, help='Diretório dos dicionários')
+parser.add_argument('-v', '--dict_date', dest='dict_date', required=True, help='Data, no formato YYYY-MM-DD, da versão dos dicionários')
+parser.add_argument('-c', '--collection', dest='collection', default='scl', help='Acrônimo da coleção')
+parser.add_argument('-o', '--include_other_hit_types', dest='include_other_hit_types', action='store_true', default=False, help='Inclui Hits dos tipos HIT_TYPE_ISSUE, HIT_TYPE_JOURNAL e HIT_TYPE_PLATFORM')
+params = parser.parse_args()
+
+maps = load_dictionaries(params.dir_dictionaries, params.dict_date)
+hit_manager = HitManager(path_pdf_to_pid=maps['pdf-pid'],
+                         issn_to_acronym=maps['issn-acronym'],
+                         pid_to_format_lang=maps['pid-format-lang'],
+                         pid_to_yop=maps['pid-dates'],
+                         persist_on_database=False,
+                         flag_include_other_hit_types=params.include_other_hit_types)
+
+hits = []
+for row in lib_pretable.read_pretable(params.pretable):
+    hit = hit_manager.create_hit(row, 'pretable', params.collection)
+    if hit:
+        hits.append(hit)
+
+time_start = time.time()
+for hit in hits:
+    hit_manager.add_hit(hit)
+hit_manager.remove_double_clicks()
+cs = CounterStat()
+cs.calculate_metrics(hit_manager.hits)
+object_time = time.time() - time_start
+
+time_start = time.time()
+vcs = VectorCounterStat()
+vcs.calculate_metrics(hits, hit_manager.key_encoders)
+vector_time = time.time() - time_start
+
+print('Hits: %d' % len(hits))
+print('Motor object: %.2f segundos' % object_time)
+print('Motor vector: %.2f segundos' % vector_time)
+
+is_equal = True
+for group in cs.metrics:
+    if cs.metrics[group] != vcs.metrics[group]:
+        print('ERRO: Métricas do grupo %s diferem' % group)
+        is_equal = False
+
+if get_kept_hits(hit_manager.hits) != get_kept_hits(vcs.hits):
+    print('ERRO: Hits mantidos após a remoção de cliques duplos diferem')
+    is_equal = False
+
+if not is_equal:
+    exit(1)
+
+print('Motores produzem resultados idênticos')
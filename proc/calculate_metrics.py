@@ -1,30 +1,32 @@
 import argparse
-import csv
 import datetime
+import itertools
 import logging
+import multiprocessing
 import os
 import pickle
 import re
+import shutil
+import zlib
 
 from libs.lib_database import update_date_status, get_date_status
 from libs.lib_status import DATE_STATUS_PRETABLE, DATE_STATUS_COMPUTED
-from models.counter import CounterStat
+from models.counter import CounterStat, COUNTER_ENGINES, COUNTER_ENGINE_OBJECT, COUNTER_ENGINE_VECTOR
 from models.hit import HitManager
+from models.vector_counter import VectorCounterStat, check_counter_engine
 from socket import inet_ntoa
-from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from time import time
+from decimal import Decimal, InvalidOperation
 from utils import dicts
-from libs import lib_hit, lib_database
+from libs import lib_hit, lib_database, lib_file, lib_pretable, lib_r5hits
+from libs.lib_dimension_cache import DimensionCache
 from models.declarative import (
-    Article,
     ArticleMetric,
-    Localization,
-    ArticleFormat,
-    ArticleLanguage,
-    Journal,
-    JournalCollection,
+    IssueMetric,
+    JournalPageMetric,
+    PlatformMetric,
 )
 
 
@@ -36,6 +38,12 @@ MATOMO_ID_SITE = os.environ.get('MATOMO_ID_SITE', '1')
 MATOMO_URL = os.environ.get('MATOMO_URL', 'http://172.17.0.4')
 COMPUTING_TIMEDELTA = int(os.environ.get('COMPUTING_TIMEDELTA', '15'))
 COMPUTING_DAYS_N = int(os.environ.get('COMPUTING_DAYS_N', '30'))
+COMPUTING_SHARDS = int(os.environ.get('COMPUTING_SHARDS', '1'))
+COMPUTING_JOBS = int(os.environ.get('COMPUTING_JOBS', '1'))
+URL_CACHE_SIZE = int(os.environ.get('URL_CACHE_SIZE', '500000'))
+COUNTER_ENGINE = os.environ.get('COUNTER_ENGINE', COUNTER_ENGINE_OBJECT)
+R5_HITS_FORMAT = os.environ.get('R5_HITS_FORMAT', lib_r5hits.R5_HITS_FORMAT_CSV)
+R5_HITS_WRITE_BUFFER_SIZE = int(os.environ.get('R5_HITS_WRITE_BUFFER_SIZE', str(8 * 1024 * 1024)))
 MIN_YEAR = int(os.environ.get('MIN_YEAR', '1900'))
 LOGGING_LEVEL = os.environ.get('LOGGING_LEVEL', 'INFO')
 
@@ -44,11 +52,29 @@ DIR_DICTIONARIES = os.path.join(DIR_DATA, 'dictionaries')
 DIR_PRETABLES = os.environ.get('DIR_PRETABLES', os.path.join(DIR_DATA, 'pretables'))
 DIR_R5_HITS = os.environ.get('DIR_R5_HITS', os.path.join(DIR_DATA, 'r5/hits'))
 DIR_R5_METRICS = os.environ.get('DIR_R5_METRICS', os.path.join(DIR_DATA, 'r5/metrics'))
+DIR_R5_GROUP_METRICS = os.environ.get('DIR_R5_GROUP_METRICS', os.path.join(DIR_DATA, 'r5/group_metrics'))
 DIR_R5_LOGS = os.environ.get('DIR_R5_LOGS', os.path.join(DIR_DATA, 'r5/logs'))
+DIR_R5_SHARDS = os.environ.get('DIR_R5_SHARDS', os.path.join(DIR_DATA, 'r5/shards'))
+DIMENSION_CACHE_PATH = os.environ.get('DIMENSION_CACHE_PATH', os.path.join(DIR_DATA, 'r5/cache/dimensions.pickle'))
+
+# Número de linhas acumuladas por fragmento antes de gravá-las em disco
+SHARD_WRITE_BATCH_SIZE = 10000
+
+# Número de registros por comando de consulta ou inserção em lote no modo --persist_on_database
+DATABASE_BATCH_SIZE = int(os.environ.get('DATABASE_BATCH_SIZE', '1000'))
+
+# Precisão das colunas latitude e longitude de counter_localization
+LOCALIZATION_PRECISION = Decimal('0.000001')
 
 ENGINE = create_engine(MATOMO_DATABASE_STRING, pool_recycle=1800)
 SESSION_FACTORY = sessionmaker(bind=ENGINE)
 
+# HitManager utilizado pelos processos filhos. É herdado via fork, sem cópia dos dicionários
+_WORKER_HIT_MANAGER = None
+
+# Mapas de dimensões a IDs na base de dados, carregados sob demanda (ver _get_dimension_maps)
+_DIMENSION_MAPS = {}
+
 
 def load_dictionaries(dir_dictionaries, date):
     maps = {}
@@ -115,14 +141,22 @@ def get_pretables(db_session, max_day: datetime.datetime):
     """
     pretables = []
     if os.path.isdir(DIR_PRETABLES):
-        pretables.extend([os.path.join(os.path.abspath(DIR_PRETABLES), f) for f in _list_files(DIR_PRETABLES)])
+        pretables.extend([os.path.join(os.path.abspath(DIR_PRETABLES), f) for f in _list_files(DIR_PRETABLES) if lib_pretable.is_pretable(f)])
 
     all_computed_days_in_dir = [get_date_from_file_path(f) for f in set(_list_files(DIR_R5_HITS) + _list_files(DIR_R5_METRICS))]
 
     pretables_to_compute = []
+    pretables_dates = set()
 
     for pt in sorted(pretables):
         date_value = get_date_from_file_path(pt)
+
+        # Considera apenas uma pré-tabela por data, ainda que existam arquivos da mesma data em formatos distintos
+        if date_value in pretables_dates:
+            logging.warning('Há mais de uma pré-tabela para a data %s. O arquivo %s será ignorado' % (date_value, pt))
+            continue
+        pretables_dates.add(date_value)
+
         date_status = get_date_status(db_session, COLLECTION, date_value)
         
         if date_status:
@@ -151,74 +185,145 @@ def get_date_from_file_path(file_path: str):
         exit(1)
 
 
-def update_metrics(metric, data):
+def get_r5_hits_file_name(file_prefix: str, hits_format=None):
+    return 'r5-hits-' + file_prefix + lib_r5hits.get_r5_hits_extension(hits_format or R5_HITS_FORMAT)
+
+
+def get_r5_metrics_file_name(file_prefix: str):
+    return 'r5-metrics-' + file_prefix + '.csv'
+
+
+def get_r5_group_metrics_file_name(group: str, file_prefix: str):
+    return 'r5-' + group + '-metrics-' + file_prefix + '.csv'
+
+
+def get_tmp_file_path(dir_path: str, file_name: str):
     """
-    Atualiza valores de métricas COUNTER para um registro.
-    Caso registro seja novo, considera os valores no objeto data.
-    Caso registro já existe, faz soma valores atuais com valores novos
+    Obtém o caminho temporário de um arquivo de resultado. Os arquivos são gravados no subdiretório tmp e movidos
+    para dir_path apenas quando completos, de modo que uma execução interrompida não deixa arquivos parciais
 
-    @param metric: registro de Metric
-    @param data: dados a serem adicionados ou atribuídos ao registro
+    @param dir_path: diretório final do arquivo
+    @param file_name: nome do arquivo
+    @return: caminho do arquivo no subdiretório tmp de dir_path
     """
-    keys = ['total_item_investigations',
-            'total_item_requests',
-            'unique_item_investigations',
-            'unique_item_requests']
+    return os.path.join(dir_path, 'tmp', file_name)
 
-    for k in keys:
-        current_value = metric.__getattribute__(k)
-        if current_value:
-            metric.__setattr__(k, current_value + data[k])
-        else:
-            metric.__setattr__(k, data[k])
 
+def commit_tmp_file(dir_path: str, file_name: str):
+    """
+    Move, de forma atômica, um arquivo do subdiretório tmp para o diretório final, substituindo a versão anterior
+    """
+    tmp_path = get_tmp_file_path(dir_path, file_name)
+    if os.path.exists(tmp_path):
+        os.replace(tmp_path, os.path.join(dir_path, file_name))
 
-def export_article_hits_to_csv(hits: dict, file_prefix: str, pid_to_issn: dict):
-    file_full_path = os.path.join(DIR_R5_HITS, 'r5-hits-' + file_prefix + '.csv')
 
-    with open(file_full_path, 'a') as f:
-        for session, hits_data in hits.items():
-            for key, hits_list in hits_data.items():
-                pid, fmt, lang, lat, long, yop = key
-                issn = lib_hit.article_pid_to_journal_issn(pid, pid_to_issn)
+def discard_tmp_file(dir_path: str, file_name: str):
+    """
+    Remove um arquivo temporário deixado por uma execução interrompida
+    """
+    tmp_path = get_tmp_file_path(dir_path, file_name)
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
 
-                line_data = [pid, fmt, lang, lat, long, yop, issn]
 
-                for hit in hits_list:
-                    year = hit.server_time.year
-                    month = hit.server_time.month
-                    day = hit.server_time.day
-                    hour = hit.server_time.hour
-                    minute = hit.server_time.minute
-                    second = hit.server_time.second
+def _write_sorted_lines(dir_path: str, file_name: str, lines: list):
+    """
+    Grava linhas ordenadas em um arquivo temporário e o move para o diretório final
+    """
+    lines.sort()
 
-                    ymdhms = '-'.join([str(year),
-                                       str(month).zfill(2),
-                                       str(day).zfill(2),
-                                       str(hour).zfill(2),
-                                       str(minute).zfill(2),
-                                       str(second).zfill(2)])
+    with open(get_tmp_file_path(dir_path, file_name), 'w') as f:
+        f.write(''.join(lines))
 
-                    f.write('|'.join(line_data + [hit.session_id,
-                                                  ymdhms,
-                                                  hit.action_name]) + '\n')
+    commit_tmp_file(dir_path, file_name)
+
+
+def _format_metrics_line(key_fields: list, ymd: str, ymd_metrics: dict):
+    line_data = key_fields + [ymd,
+                              ymd_metrics['total_item_investigations'],
+                              ymd_metrics['total_item_requests'],
+                              ymd_metrics['unique_item_investigations'],
+                              ymd_metrics['unique_item_requests']]
+    return '|'.join([str(i) for i in line_data]) + '\n'
+
+
+def export_article_hits_to_csv(hit_manager: HitManager, file_full_path: str, hits_format=None):
+    """
+    Acrescenta os hits de artigos a um arquivo r5-hits, no formato hits_format (por padrão, R5_HITS_FORMAT).
+    O ID de sessão e os campos da chave são obtidos uma vez por sessão e chave, e a data e hora uma vez por timestamp
+
+    @param hit_manager: gerenciador de objetos Hit
+    @param file_full_path: caminho do arquivo
+    @param hits_format: formato do arquivo r5-hits
+    """
+    key_encoder = hit_manager.key_encoders['article']
+
+    with lib_r5hits.R5HitsWriter(file_full_path, hits_format or R5_HITS_FORMAT, R5_HITS_WRITE_BUFFER_SIZE) as writer:
+        for session, hits_data in hit_manager.hits['article'].items():
+            session_id = hit_manager.get_session_id(session)
+
+            rows = []
+            for key, hits_list in hits_data.items():
+                pid, fmt, lang, lat, long, yop = key_encoder.decode(key)
+                issn = lib_hit.article_pid_to_journal_issn(pid, hit_manager.pid_to_issn)
+
+                for hit in hits_list:
+                    rows.append((pid, fmt, lang, lat, long, yop, issn, session_id, writer.get_server_time(hit), hit.action_name))
+
+            writer.write_rows(rows)
 
 
 def export_article_metrics_to_csv(metrics: dict, file_prefix: str, pid_to_issn: dict):
-    file_full_path = os.path.join(DIR_R5_METRICS, 'r5-metrics-' + file_prefix + '.csv')
+    """
+    Grava as métricas de artigos de um dia no arquivo r5-metrics, ordenadas e com uma linha por chave e data.
+    O arquivo é substituído de forma atômica, portanto as métricas devem estar completas (somadas entre janelas)
 
-    with open(file_full_path, 'a') as f:
-        for key, article_data in metrics.items():
-            pid, fmt, lang, lat, long, yop = key
-            issn = lib_hit.article_pid_to_journal_issn(pid, pid_to_issn)
+    @param metrics: métricas COUNTER de artigos
+    @param file_prefix: um prefixo para ser usado no nome do arquivo
+    @param pid_to_issn: dicionário que mapeia PID de artigo a ISSNs
+    """
+    lines = []
+    for key, article_data in metrics.items():
+        pid, fmt, lang, lat, long, yop = key
+        issn = lib_hit.article_pid_to_journal_issn(pid, pid_to_issn)
+
+        for ymd, ymd_metrics in article_data.items():
+            lines.append(_format_metrics_line([pid, fmt, lang, lat, long, yop, issn], ymd, ymd_metrics))
 
-            for ymd in article_data:
-                line_data = [pid, fmt, lang, lat, long, yop, issn, ymd]
-                line_data.append(article_data[ymd]['total_item_investigations'])
-                line_data.append(article_data[ymd]['total_item_requests'])
-                line_data.append(article_data[ymd]['unique_item_investigations'])
-                line_data.append(article_data[ymd]['unique_item_requests'])
-                f.write('|'.join([str(i) for i in line_data]) + '\n')
+    _write_sorted_lines(DIR_R5_METRICS, get_r5_metrics_file_name(file_prefix), lines)
+
+
+def export_group_metrics_to_csv(metrics: dict, group: str, file_prefix: str):
+    """
+    Exporta métricas de fascículos, periódicos ou plataforma para arquivo CSV.
+    Cada linha contém os campos da chave do grupo, a data e as métricas, na mesma ordem do arquivo de artigos
+
+    @param metrics: métricas COUNTER do grupo
+    @param group: grupo de Hits (issue | journal | platform)
+    @param file_prefix: um prefixo para ser usado no nome do arquivo
+    """
+    lines = []
+    for key, group_data in metrics.items():
+        for ymd, ymd_metrics in group_data.items():
+            lines.append(_format_metrics_line(list(key), ymd, ymd_metrics))
+
+    _write_sorted_lines(DIR_R5_GROUP_METRICS, get_r5_group_metrics_file_name(group, file_prefix), lines)
+
+
+def export_metrics_to_csv(metrics: dict, file_prefix: str, pid_to_issn: dict):
+    """
+    Exporta métricas de todos os grupos para arquivos CSV
+
+    @param metrics: conjunto de métricas COUNTER
+    @param file_prefix: um prefixo para ser usado no nome dos arquivos
+    @param pid_to_issn: dicionário que mapeia PID de artigo a ISSNs
+    """
+    export_article_metrics_to_csv(metrics['article'], file_prefix, pid_to_issn)
+
+    for group in ('issue', 'journal', 'platform'):
+        if metrics.get(group):
+            export_group_metrics_to_csv(metrics[group], group, file_prefix)
 
 
 def export_metrics_to_matomo(metrics: dict, db_session, collection: str, pid_to_issn):
@@ -246,170 +351,197 @@ def export_metrics_to_matomo(metrics: dict, db_session, collection: str, pid_to_
             _export_others(metrics[group], db_session, collection)
 
 
+def _get_dimension_maps(db_session):
+    """
+    Obtém os mapas de periódicos, artigos, localizações, formatos e idiomas a seus IDs na base de dados.
+    Os mapas são carregados na primeira chamada, a partir do cache de dimensões em disco (completado com os registros
+    inseridos desde a sua gravação), e mantidos (e completados) durante toda a execução do processo
+    """
+    if not _DIMENSION_MAPS:
+        logging.info('Carregando mapas de periódicos, artigos, localizações, formatos e idiomas...')
+        dimension_cache = DimensionCache(DIMENSION_CACHE_PATH)
+        dimension_cache.load()
+        _DIMENSION_MAPS.update(dimension_cache.refresh(db_session))
+        dimension_cache.save()
+    return _DIMENSION_MAPS
+
+
+def _get_localization_value(value):
+    """
+    Converte latitude ou longitude para o valor armazenado na base de dados (DECIMAL(9, 6))
+    """
+    try:
+        return Decimal(value).quantize(LOCALIZATION_PRECISION)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
 def _export_article(metrics, db_session, collection, pid_to_issn):
-    for key, article_data in metrics.items():
+    """
+    Persiste métricas de artigos. Periódicos, artigos e localizações ausentes são inseridos em lote, e as métricas
+    são gravadas em lotes de INSERT ... ON DUPLICATE KEY UPDATE que somam os valores aos já existentes
+
+    @param metrics: métricas do grupo article
+    @param db_session: sessão com banco de dados
+    @param collection: acrônimo de coleção
+    @param pid_to_issn: dicionário que mapeia PID a ISSN
+    """
+    maps = _get_dimension_maps(db_session)
+
+    keys_attrs = []
+    for key in metrics:
         pid, data_format, lang, latitude, longitude, yop = key
+        keys_attrs.append((key,
+                           pid,
+                           data_format,
+                           lang,
+                           lib_hit.article_pid_to_journal_issn(pid, pid_to_issn),
+                           (_get_localization_value(latitude), _get_localization_value(longitude)),
+                           int(yop) if str(yop).isdigit() else None))
 
-        article_format_id = dicts.format_to_code.get(data_format, -1)
+    # Formatos e idiomas fora dos dicionários padrão
+    for data_format in lib_database.get_or_create_formats(db_session, maps['format'], [k[2] for k in keys_attrs if k[2] not in dicts.format_to_code], DATABASE_BATCH_SIZE):
+        logging.debug('Adicionado formato (ID: %s, NAME: %s)' % (maps['format'][data_format], data_format))
 
-        # Caso formato de artigo não esteja no dicionário padrão, tenta obter dado da tabela counter_article_format
-        if article_format_id == -1:
-            # Procura formato de artigo na base dados
-            try:
-                existing_article_format = lib_database.get_article_format(db_session=db_session, format_name=data_format)
-                article_format_id = existing_article_format.id
-            # Cria formato caso não exista na base de dados
-            except NoResultFound:
-                new_article_format = ArticleFormat()
-                new_article_format.format = data_format
+    for lang in lib_database.get_or_create_languages(db_session, maps['language'], [k[3] for k in keys_attrs if k[3] not in dicts.language_to_code], DATABASE_BATCH_SIZE):
+        logging.debug('Adicionado idioma (ID: %s, NAME: %s)' % (maps['language'][lang], lang))
 
-                db_session.add(new_article_format)
-                db_session.flush()
+    _fill_journals(db_session, maps, [k[4] for k in keys_attrs])
 
-                article_format_id = new_article_format.id
+    # Artigos. Os atributos de um novo artigo são obtidos da primeira chave em que o seu PID aparece
+    pid_to_attrs = {}
+    for key, pid, data_format, lang, issn, localization, yop in keys_attrs:
+        if pid not in pid_to_attrs:
+            pid_to_attrs[pid] = (issn, yop)
 
-                logging.debug('Adicionado formato (ID: %s, NAME: %s)' % (new_article_format.id,
-                                                                         new_article_format.format))
+    lib_database.get_or_create_articles(db_session, maps['pid'], pid_to_attrs, collection, maps['issn'], DATABASE_BATCH_SIZE)
 
-        article_language_id = dicts.language_to_code.get(lang, -1)
+    _fill_localizations(db_session, maps, [k[5] for k in keys_attrs])
 
-        # Caso idioma de artigo não esteja no dicionário padrão, tenta obter dado da tabela counter_article_language
-        if article_language_id == -1:
-            # Procura idioma na base de dados
-            try:
-                existing_article_language = lib_database.get_article_language(db_session=db_session,
-                                                                              language_name=lang)
-                article_language_id = existing_article_language.id
-            # Cria um novo idioma na base de dados, caso não exista
-            except NoResultFound:
-                new_article_language = ArticleLanguage()
-                new_article_language.language = lang
+    rows = {}
+    for key, pid, data_format, lang, issn, localization, yop in keys_attrs:
+        article_id = maps['pid'][(pid, collection)]
+        article_format_id = dicts.format_to_code.get(data_format) or maps['format'][data_format]
+        article_language_id = dicts.language_to_code.get(lang) or maps['language'][lang]
+        localization_id = maps['localization'][localization]
 
-                db_session.add(new_article_language)
-                db_session.flush()
+        _add_metrics_to_rows(rows, (article_id, article_format_id, article_language_id, localization_id), metrics[key])
 
-                article_language_id = new_article_language.id
+    _upsert_metrics_rows(db_session, ArticleMetric, ('idarticle', 'idformat', 'idlanguage', 'idlocalization'), rows)
+    db_session.commit()
 
-                logging.debug('Adicionado idioma (ID: %s, NAME: %s)' % (new_article_language.id,
-                                                                        new_article_language.language))
 
-        issn = lib_hit.article_pid_to_journal_issn(pid, pid_to_issn)
+def _fill_journals(db_session, maps, issns):
+    """
+    Completa o mapa de periódicos com os ISSNs informados, inserindo os periódicos (e respectivas coleções) ausentes
+    """
+    for i in lib_database.get_or_create_journals(db_session, maps['issn'], issns, COLLECTION, DATABASE_BATCH_SIZE):
+        logging.debug('Adicionado periódico (ISSN: %s)' % i)
+
+
+def _fill_localizations(db_session, maps, localizations):
+    """
+    Completa o mapa de localizações com os pares (latitude, longitude) informados, inserindo os ausentes
+    """
+    lib_database.get_or_create_localizations(db_session, maps['localization'], localizations, DATABASE_BATCH_SIZE)
+
+
+def _add_metrics_to_rows(rows, row_key, ymd_data):
+    """
+    Soma as métricas diárias de uma chave aos registros a serem persistidos
+
+    @param rows: dicionário que mapeia (valores das colunas-chave, data) a métricas
+    @param row_key: tupla com os valores das colunas-chave do registro
+    @param ymd_data: dicionário que mapeia data (YYYY-MM-DD) a métricas
+    """
+    for ymd, ymd_metrics in ymd_data.items():
+        ymd_key = row_key + (datetime.date.fromisoformat(ymd),)
+        if ymd_key not in rows:
+            rows[ymd_key] = dicts.counter_item_metrics.copy()
+
+        for k, v in ymd_metrics.items():
+            rows[ymd_key][k] += v
 
-        for ymd in article_data:
-            # Procura periódico na base de dados
-            try:
-                existing_journal = lib_database.get_journal(db_session=db_session, issn=issn)
-            # Cria um novo periódico caso não exista na base de dados
-            except NoResultFound:
-                new_journal = Journal()
-                new_journal.pid_issn = issn
-                new_journal.print_issn = ''
-                new_journal.online_issn = ''
-
-                db_session.add(new_journal)
-                db_session.flush()
-
-                existing_journal = new_journal
-
-                new_journal_collection = JournalCollection()
-                new_journal_collection.idjournal_jc = existing_journal.id
-                new_journal_collection.collection = COLLECTION
-                new_journal_collection.title = ''
-
-                db_session.add(new_journal_collection)
-                db_session.flush()
-
-                logging.debug('Adicionado periódico (ISSN: %s)' % new_journal.pid_issn)
-
-            # Procura artigo na base de dados
-            try:
-                existing_article = lib_database.get_article(db_session=db_session,
-                                                            pid=pid,
-                                                            collection=collection)
-            # Cria um novo artigo caso artigo não exista na base de dados
-            except NoResultFound:
-                new_article = Article()
-                new_article.collection = collection
-                new_article.idjournal_a = existing_journal.id
-                new_article.pid = pid
-                new_article.yop = yop
-
-                db_session.add(new_article)
-                db_session.flush()
-                existing_article = new_article
-
-            # Procura origem do acesso (latitude e longitude) na base de dados
-            try:
-                existing_localization = lib_database.get_localization(db_session=db_session,
-                                                                      latitude=latitude,
-                                                                      longitude=longitude)
-            # Cria uma nova localização
-            except NoResultFound:
-                new_localization = Localization()
-                new_localization.latitude = latitude
-                new_localization.longitude = longitude
-
-                db_session.add(new_localization)
-                db_session.flush()
-
-                existing_localization = new_localization
-
-            # Procura métrica na base de dados para atualizá-la
-            try:
-                existing_article_metric = lib_database.get_article_metric(db_session=db_session,
-                                                                          year_month_day=ymd,
-                                                                          article_id=existing_article.id,
-                                                                          article_format_id=article_format_id,
-                                                                          article_language_id=article_language_id,
-                                                                          localization_id=existing_localization.id)
-
-                update_metrics(existing_article_metric, article_data[ymd])
-                logging.debug('Atualizada métrica (ART_ID: %s, FMT_ID: %s, LANG_ID: %s, LOC_ID: %s, YMD: %s)' % (existing_article_metric.idarticle,
-                                                                                                                 existing_article_metric.idformat,
-                                                                                                                 existing_article_metric.idlanguage,
-                                                                                                                 existing_article_metric.idlocalization,
-                                                                                                                 existing_article_metric.year_month_day))
-            # Cria um novo registro de métrica, caso não exista na base de dados
-            except NoResultFound:
-                new_metric_article = ArticleMetric()
-                new_metric_article.idarticle = existing_article.id
-                new_metric_article.idformat = article_format_id
-                new_metric_article.idlanguage = article_language_id
-                new_metric_article.idlocalization = existing_localization.id
-                new_metric_article.year_month_day = ymd
-
-                update_metrics(new_metric_article, article_data[ymd])
-                db_session.add(new_metric_article)
-                logging.debug('Adicionada métrica (ART_ID: %s, FMT_ID: %s, LANG_ID: %s, LOC_ID: %s, YMD: %s)' % (new_metric_article.idarticle,
-                                                                                                                 new_metric_article.idformat,
-                                                                                                                 new_metric_article.idlanguage,
-                                                                                                                 new_metric_article.idlocalization,
-                                                                                                                 new_metric_article.year_month_day))
-    db_session.commit()
+
+def _upsert_metrics_rows(db_session, table_class, key_columns, rows):
+    """
+    Grava registros de métricas em lotes de DATABASE_BATCH_SIZE, somando os valores aos já existentes
+
+    @param db_session: sessão com banco de dados
+    @param table_class: classe que representa a tabela de métricas
+    @param key_columns: nomes das colunas-chave, na ordem das tuplas de rows (exceto year_month_day, a última)
+    @param rows: dicionário que mapeia (valores das colunas-chave, data) a métricas
+    """
+    columns = tuple(key_columns) + ('year_month_day',)
+    rows = [dict(zip(columns, k), **v) for k, v in rows.items()]
+
+    for i in range(0, len(rows), DATABASE_BATCH_SIZE):
+        lib_database.upsert_metrics(db_session, table_class, rows[i:i + DATABASE_BATCH_SIZE], list(dicts.counter_item_metrics))
 
 
 def _export_issue(metrics, db_session, collection):
+    """
+    Persiste métricas de fascículos (tabela counter_issue_metric)
+    """
+    maps = _get_dimension_maps(db_session)
+
+    keys_localizations = {key: (_get_localization_value(key[2]), _get_localization_value(key[3])) for key in metrics}
+
+    _fill_journals(db_session, maps, [key[0] for key in metrics])
+    _fill_localizations(db_session, maps, keys_localizations.values())
+
+    rows = {}
     for key, issue_data in metrics.items():
-        # ToDo
-        pass
+        issn, issue_code = key[0], key[1]
+        _add_metrics_to_rows(rows, (collection, maps['issn'][issn], issue_code, maps['localization'][keys_localizations[key]]), issue_data)
+
+    _upsert_metrics_rows(db_session, IssueMetric, ('collection', 'idjournal_cim', 'issue', 'idlocalization_cim'), rows)
+    db_session.commit()
 
 
 def _export_journal(metrics, db_session, collection):
+    """
+    Persiste métricas de acessos a páginas de periódicos (tabela counter_journal_page_metric)
+    """
+    maps = _get_dimension_maps(db_session)
+
+    keys_localizations = {key: (_get_localization_value(key[1]), _get_localization_value(key[2])) for key in metrics}
+
+    _fill_journals(db_session, maps, [key[0] for key in metrics])
+    _fill_localizations(db_session, maps, keys_localizations.values())
+
+    rows = {}
     for key, journal_data in metrics.items():
-        # ToDo
-        pass
+        _add_metrics_to_rows(rows, (collection, maps['issn'][key[0]], maps['localization'][keys_localizations[key]]), journal_data)
+
+    _upsert_metrics_rows(db_session, JournalPageMetric, ('collection', 'idjournal_cjpm', 'idlocalization_cjpm'), rows)
+    db_session.commit()
 
 
 def _export_platform(metrics, db_session, collection):
+    """
+    Persiste métricas de acessos à plataforma (tabela counter_platform_metric)
+    """
+    maps = _get_dimension_maps(db_session)
+
+    keys_localizations = {key: (_get_localization_value(key[1]), _get_localization_value(key[2])) for key in metrics}
+
+    _fill_localizations(db_session, maps, keys_localizations.values())
+
+    rows = {}
     for key, platform_data in metrics.items():
-        # ToDo
-        pass
+        _add_metrics_to_rows(rows, (collection, maps['localization'][keys_localizations[key]]), platform_data)
+
+    _upsert_metrics_rows(db_session, PlatformMetric, ('collection', 'idlocalization_cpm'), rows)
+    db_session.commit()
 
 
 def _export_others(metrics, db_session, collection):
-    for key, others_data in metrics.items():
-        # ToDo
-        pass
+    """
+    Hits do grupo others não possuem métricas COUNTER (não há tipo de Hit associado ao grupo em dicts.group_to_hit_type),
+    portanto não há o que persistir
+    """
+    pass
 
 
 def run(data, mode, hit_manager: HitManager, db_session, collection, result_file_prefix):
@@ -425,6 +557,13 @@ def run(data, mode, hit_manager: HitManager, db_session, collection, result_file
     @param collection: acrônimo de coleção
     @param result_file_prefix: um prefixo para ser usado no nome do arquivo com as métricas e hits
     """
+    # Os hits são acrescentados a um arquivo temporário, movido para DIR_R5_HITS ao final do dia
+    hits_file_name = get_r5_hits_file_name(result_file_prefix)
+    discard_tmp_file(DIR_R5_HITS, hits_file_name)
+
+    # Métricas do dia, somadas a cada execução das rotinas COUNTER e gravadas ao final
+    day_metrics = CounterStat().metrics
+
     # IP atual a ser contabilizado
     past_ip = ''
 
@@ -453,7 +592,8 @@ def run(data, mode, hit_manager: HitManager, db_session, collection, result_file
                 run_counter_routines(hit_manager=hit_manager,
                                      db_session=db_session,
                                      collection=collection,
-                                     file_prefix=result_file_prefix)
+                                     file_prefix=result_file_prefix,
+                                     day_metrics=day_metrics)
                 ip_counter = 0
 
             past_ip = current_ip
@@ -466,38 +606,363 @@ def run(data, mode, hit_manager: HitManager, db_session, collection, result_file
     run_counter_routines(hit_manager=hit_manager,
                          db_session=db_session,
                          collection=collection,
-                         file_prefix=result_file_prefix)
+                         file_prefix=result_file_prefix,
+                         day_metrics=day_metrics)
+
+    logging.info('Salvando métricas em disco...')
+    export_metrics_to_csv(day_metrics, result_file_prefix, hit_manager.pid_to_issn)
+    commit_tmp_file(DIR_R5_HITS, hits_file_name)
+
 
+def log_url_cache_stats(hit_manager: HitManager):
+    stats = hit_manager.get_url_cache_stats()
+    if stats['hits'] + stats['misses'] > 0:
+        logging.info('Cache de URLs: %d acertos, %d falhas, %d remoções, %d entradas (taxa de acerto de %.2f%%)' % (stats['hits'],
+                                                                                                                 stats['misses'],
+                                                                                                                 stats['evictions'],
+                                                                                                                 stats['size'],
+                                                                                                                 stats['hit_ratio'] * 100))
 
-def run_counter_routines(hit_manager: HitManager, db_session, collection, file_prefix):
+
+def compute_counter_metrics(hit_manager: HitManager):
+    """
+    Remove cliques-duplos e calcula as métricas COUNTER dos hits registrados no HitManager
+
+    @param hit_manager: gerenciador de objetos Hit
+    @return: um objeto CounterStat (ou VectorCounterStat, no motor vetorizado)
+    """
+    if hit_manager.counter_engine == COUNTER_ENGINE_VECTOR:
+        cs = VectorCounterStat()
+        cs.calculate_metrics(hit_manager.raw_hits, hit_manager.key_encoders)
+
+        # Hits mantidos após a remoção de cliques duplos, utilizados na exportação dos hits de artigos
+        hit_manager.hits = cs.hits
+    else:
+        hit_manager.remove_double_clicks()
+
+        cs = CounterStat()
+        cs.calculate_metrics(hit_manager.hits)
+
+    cs.decode_keys(hit_manager.key_encoders)
+
+    return cs
+
+
+def run_counter_routines(hit_manager: HitManager, db_session, collection, file_prefix, day_metrics: dict):
     """
     Executa métodos COUNTER para remover cliques-duplos, contar acessos por PID e extrair métricas.
-    Ao final, salva resultados (métricas) em base de dados
+    Ao final, salva resultados (métricas) em base de dados, acrescenta os hits ao arquivo temporário do dia e soma as
+    métricas às métricas do dia
 
     @param hit_manager: gerenciador de objetos Hit
     @param db_session: sessão com banco de dados
     @param collection: acrônimo de coleção
     @param file_prefix: um prefixo para ser usado no nome do arquivo com as métricas e hits
+    @param day_metrics: métricas acumuladas do dia, na estrutura de CounterStat.metrics
     """
-    hit_manager.remove_double_clicks()
-
-    cs = CounterStat()
-    cs.calculate_metrics(hit_manager.hits)
+    cs = compute_counter_metrics(hit_manager)
 
     if hit_manager.persist_on_database:
         logging.info('Salvando métricas na base de dados...')
         export_metrics_to_matomo(metrics=cs.metrics, db_session=db_session, collection=collection, pid_to_issn=hit_manager.pid_to_issn)
 
     logging.info('Salvando hits em disco...')
-    export_article_hits_to_csv(hit_manager.hits['article'], file_prefix, hit_manager.pid_to_issn)
+    export_article_hits_to_csv(hit_manager, get_tmp_file_path(DIR_R5_HITS, get_r5_hits_file_name(file_prefix)))
+
+    _merge_metrics(day_metrics, cs.metrics)
+
+    hit_manager.reset()
+
+
+def split_pretable_into_shards(pretable_path, dir_shards, n_shards):
+    """
+    Divide uma pré-tabela em n_shards fragmentos, de acordo com o hash do endereço IP.
+    Todas as linhas de um IP ficam no mesmo fragmento e a ordem relativa das linhas é preservada.
+    Também são registradas as janelas de cálculo do modo sequencial (trechos entre chamadas a run_counter_routines),
+    para que os fragmentos sejam calculados com as mesmas janelas
+
+    @param pretable_path: caminho da pré-tabela
+    @param dir_shards: diretório em que os fragmentos serão gravados
+    @param n_shards: número de fragmentos
+    @return: caminhos dos fragmentos, lista de pares [janela, número de linhas] de cada fragmento e número de janelas
+    """
+    shards_paths = [os.path.join(dir_shards, 'pretable-%d.tsv' % i) for i in range(n_shards)]
+    shards_windows = [[] for _ in range(n_shards)]
+    writers = [lib_pretable.PretableWriter(p) for p in shards_paths]
+    buffers = [[] for _ in range(n_shards)]
+
+    # Reproduz a contagem de IPs de run
+    window = 0
+    past_ip = ''
+    ip_counter = 0
+    line_counter = 0
+
+    for row in lib_pretable.read_pretable(pretable_path):
+        line_counter += 1
+        ip_counter += 1
+
+        current_ip = row.get('ip', '')
+
+        if line_counter == 1:
+            past_ip = current_ip
+
+        if past_ip != current_ip:
+            ip_counter += 1
+
+            if ip_counter >= MATOMO_DB_IP_COUNTER_LIMIT:
+                window += 1
+                ip_counter = 0
+
+            past_ip = current_ip
+
+        shard_index = zlib.crc32(current_ip.encode('utf-8')) % n_shards
+
+        shard_windows = shards_windows[shard_index]
+        if shard_windows and shard_windows[-1][0] == window:
+            shard_windows[-1][1] += 1
+        else:
+            shard_windows.append([window, 1])
+
+        buffers[shard_index].append(tuple(row[k] for k in lib_pretable.PRETABLE_HEADER))
+        if len(buffers[shard_index]) >= SHARD_WRITE_BATCH_SIZE:
+            writers[shard_index].write_rows(buffers[shard_index])
+            buffers[shard_index] = []
+
+    for w, b in zip(writers, buffers):
+        w.write_rows(b)
+        w.close()
+
+    return shards_paths, shards_windows, window + 1
+
+
+def _get_window_file_prefix(file_prefix, window):
+    return '%s-%d' % (file_prefix, window)
+
+
+def _get_window_metrics_file_name(window):
+    return 'metrics-%d.data' % window
+
+
+def _run_shard(shard_path, shard_windows, dir_shard_results, collection, result_file_prefix):
+    """
+    Calcula as métricas de um fragmento de pré-tabela, em um processo filho.
+    Para cada janela, são gravados os hits (em formato r5-hits) e as métricas (em formato pickle), acompanhadas
+    das alterações feitas no dicionário pid_to_issn durante a janela
+
+    @param shard_path: caminho do fragmento
+    @param shard_windows: lista de pares [janela, número de linhas] do fragmento
+    @param dir_shard_results: diretório de resultados do fragmento
+    @param collection: acrônimo de coleção
+    @param result_file_prefix: um prefixo para ser usado no nome do arquivo com os hits
+    """
+    if not os.path.exists(dir_shard_results):
+        os.makedirs(dir_shard_results)
+
+    hit_manager = _WORKER_HIT_MANAGER
+    hit_manager.reset()
+
+    known_pid_to_issn = {pid: set(issns) for pid, issns in hit_manager.pid_to_issn.items()}
+
+    data = lib_pretable.read_pretable(shard_path)
+
+    for window, n_rows in shard_windows:
+        for d in itertools.islice(data, n_rows):
+            hit = hit_manager.create_hit(d, 'pretable', collection)
+
+            if hit:
+                hit_manager.add_hit(hit)
+
+        cs = compute_counter_metrics(hit_manager)
+
+        # Os hits dos fragmentos são temporários e são regravados no formato final ao serem agrupados
+        shard_hits_path = os.path.join(dir_shard_results, get_r5_hits_file_name(_get_window_file_prefix(result_file_prefix, window), lib_r5hits.R5_HITS_FORMAT_CSV))
+        export_article_hits_to_csv(hit_manager, shard_hits_path, lib_r5hits.R5_HITS_FORMAT_CSV)
+
+        pid_to_issn_changes = {pid: set(issns) for pid, issns in hit_manager.pid_to_issn.items() if known_pid_to_issn.get(pid) != issns}
+        known_pid_to_issn.update(pid_to_issn_changes)
+
+        with open(os.path.join(dir_shard_results, _get_window_metrics_file_name(window)), 'wb') as f:
+            pickle.dump((cs.metrics, pid_to_issn_changes), f)
+
+        hit_manager.reset()
+
+    log_url_cache_stats(hit_manager)
+
+
+def _merge_metrics(target: dict, source: dict):
+    """
+    Soma as métricas de source em target. Como as sessões são definidas por IP, não há sessão presente em dois
+    fragmentos e as métricas únicas também podem ser somadas
+    """
+    for group, key_data in source.items():
+        for key, ymd_data in key_data.items():
+            if key not in target[group]:
+                target[group][key] = {}
+
+            for ymd, metric_values in ymd_data.items():
+                if ymd not in target[group][key]:
+                    target[group][key][ymd] = metric_values
+                else:
+                    for k, v in metric_values.items():
+                        target[group][key][ymd][k] += v
+
+
+def _merge_shard_hits(shard_hits_path, writer: lib_r5hits.R5HitsWriter, pid_to_issn: dict):
+    """
+    Copia os hits de um fragmento para o arquivo final, recalculando o ISSN com o dicionário pid_to_issn consolidado
+    """
+    rows = []
+    for row in lib_r5hits.read_r5_hits(shard_hits_path):
+        rows.append(row[:6] + (lib_hit.article_pid_to_journal_issn(row[0], pid_to_issn),) + row[7:])
+
+        if len(rows) >= SHARD_WRITE_BATCH_SIZE:
+            writer.write_rows(rows)
+            rows = []
+
+    writer.write_rows(rows)
+
+
+def run_in_shards(pretable_path, hit_manager: HitManager, db_session, collection, result_file_prefix, n_shards):
+    """
+    Calcula as métricas de uma pré-tabela em n_shards processos.
+    Como as sessões são definidas por IP, cada fragmento (conjunto de IPs) é processado de forma independente.
+    Os fragmentos são calculados nas mesmas janelas do modo sequencial e, ao final, as métricas de cada janela são
+    somadas e gravadas nos arquivos r5-hits e r5-metrics do dia, com resultado idêntico ao do modo sequencial.
+    O ISSN dos hits de artigo gravados em r5-hits é recalculado com o dicionário pid_to_issn consolidado. Já o ISSN
+    de hits de fascículo e de periódico de URLs clássicas é obtido, durante o cálculo, do pid_to_issn do fragmento,
+    que conhece apenas os IPs do próprio fragmento. Por isso, o modo não pode ser combinado com
+    flag_include_other_hit_types
+
+    @param pretable_path: caminho da pré-tabela
+    @param hit_manager: gerenciador de objetos Hit, herdado pelos processos filhos
+    @param db_session: sessão com banco de dados
+    @param collection: acrônimo de coleção
+    @param result_file_prefix: um prefixo para ser usado no nome do arquivo com as métricas e hits
+    @param n_shards: número de fragmentos (e de processos)
+    """
+    global _WORKER_HIT_MANAGER
+
+    dir_shards = os.path.join(DIR_R5_SHARDS, result_file_prefix)
+    if os.path.exists(dir_shards):
+        shutil.rmtree(dir_shards)
+    os.makedirs(dir_shards)
+
+    logging.info('Dividindo pré-tabela em %d fragmentos...' % n_shards)
+    shards_paths, shards_windows, n_windows = split_pretable_into_shards(pretable_path, dir_shards, n_shards)
+    dirs_shard_results = [os.path.join(dir_shards, str(i)) for i in range(n_shards)]
+
+    # Conexões abertas não devem ser compartilhadas com os processos filhos
+    ENGINE.dispose()
+    _WORKER_HIT_MANAGER = hit_manager
+
+    with multiprocessing.get_context('fork').Pool(n_shards) as pool:
+        pool.starmap(_run_shard, [(shards_paths[i],
+                                   shards_windows[i],
+                                   dirs_shard_results[i],
+                                   collection,
+                                   result_file_prefix) for i in range(n_shards)])
+
+    logging.info('Agrupando resultados dos fragmentos...')
+    hits_file_name = get_r5_hits_file_name(result_file_prefix)
+    discard_tmp_file(DIR_R5_HITS, hits_file_name)
+
+    day_metrics = CounterStat().metrics
+
+    for window in range(n_windows):
+        metrics = CounterStat().metrics
+
+        for d in dirs_shard_results:
+            window_metrics_path = os.path.join(d, _get_window_metrics_file_name(window))
+            if not os.path.exists(window_metrics_path):
+                continue
+
+            with open(window_metrics_path, 'rb') as f:
+                shard_metrics, pid_to_issn_changes = pickle.load(f)
+
+            _merge_metrics(metrics, shard_metrics)
+
+            for pid, issns in pid_to_issn_changes.items():
+                if pid not in hit_manager.pid_to_issn:
+                    hit_manager.pid_to_issn[pid] = set()
+                hit_manager.pid_to_issn[pid].update(issns)
+
+        if hit_manager.persist_on_database:
+            logging.info('Salvando métricas na base de dados...')
+            export_metrics_to_matomo(metrics=metrics, db_session=db_session, collection=collection, pid_to_issn=hit_manager.pid_to_issn)
+
+        logging.info('Salvando hits em disco...')
+        with lib_r5hits.R5HitsWriter(get_tmp_file_path(DIR_R5_HITS, hits_file_name), R5_HITS_FORMAT, R5_HITS_WRITE_BUFFER_SIZE) as writer:
+            for d in dirs_shard_results:
+                shard_hits_path = os.path.join(d, get_r5_hits_file_name(_get_window_file_prefix(result_file_prefix, window), lib_r5hits.R5_HITS_FORMAT_CSV))
+                if os.path.exists(shard_hits_path):
+                    _merge_shard_hits(shard_hits_path, writer, hit_manager.pid_to_issn)
+
+        _merge_metrics(day_metrics, metrics)
 
     logging.info('Salvando métricas em disco...')
-    export_article_metrics_to_csv(cs.metrics['article'], file_prefix, hit_manager.pid_to_issn)
+    export_metrics_to_csv(day_metrics, result_file_prefix, hit_manager.pid_to_issn)
+    commit_tmp_file(DIR_R5_HITS, hits_file_name)
+
+    shutil.rmtree(dir_shards)
 
+
+def compute_pretable(pretable_path, hit_manager: HitManager, collection, n_shards=1):
+    """
+    Calcula as métricas de uma pré-tabela e atualiza o status da data para DATE_STATUS_COMPUTED.
+    O dicionário pid_to_issn é reiniciado a cada pré-tabela, de modo que o resultado de um dia não depende dos dias
+    calculados antes (nem da ordem em que são calculados com --jobs)
+
+    @param pretable_path: caminho da pré-tabela
+    @param hit_manager: gerenciador de objetos Hit
+    @param collection: acrônimo de coleção
+    @param n_shards: número de fragmentos (e de processos) em que a pré-tabela é calculada
+    """
+    time_start = time()
+
+    logging.info('Extraindo dados do arquivo {}...'.format(pretable_path))
     hit_manager.reset()
+    hit_manager.pid_to_issn = {}
+
+    pretable_date_value = get_date_from_file_path(pretable_path)
+
+    if n_shards > 1:
+        run_in_shards(pretable_path=pretable_path,
+                      hit_manager=hit_manager,
+                      db_session=SESSION_FACTORY(),
+                      collection=collection,
+                      result_file_prefix=pretable_date_value,
+                      n_shards=n_shards)
+    else:
+        run(data=lib_pretable.read_pretable(pretable_path),
+            mode='pretable',
+            hit_manager=hit_manager,
+            db_session=SESSION_FACTORY(),
+            collection=collection,
+            result_file_prefix=pretable_date_value)
+
+    log_url_cache_stats(hit_manager)
+
+    logging.info('Atualizando tabela control_date_status para %s' % pretable_date_value)
+    update_date_status(SESSION_FACTORY(),
+                       COLLECTION,
+                       pretable_date_value,
+                       DATE_STATUS_COMPUTED)
+
+    time_end = time()
+    logging.info('Durou %.2f segundos' % (time_end - time_start))
+
+
+def _compute_pretable_in_worker(args):
+    """
+    Calcula as métricas de uma pré-tabela em um processo filho, com o HitManager herdado do processo principal
+    """
+    pretable_path, collection = args
+    compute_pretable(pretable_path, _WORKER_HIT_MANAGER, collection)
 
 
 def main():
+    global _WORKER_HIT_MANAGER, R5_HITS_FORMAT
+
     usage = 'Calcula métricas COUNTER R5 usando dados de acesso SciELO'
     parser = argparse.ArgumentParser(usage)
 
@@ -565,8 +1030,61 @@ def main():
         help='Data, no formato YYYY-MM-DD, da versão dos dicionários a serem utilizados'
     )
 
+    parser.add_argument(
+        '--shards',
+        dest='shards',
+        type=int,
+        default=COMPUTING_SHARDS,
+        help='Divide cada pré-tabela em fragmentos por hash de IP e calcula cada fragmento em um processo. '
+             'Disponível apenas no modo --use_pretables e não pode ser combinado com --include_other_hit_types'
+    )
+
+    parser.add_argument(
+        '--url_cache_size',
+        dest='url_cache_size',
+        type=int,
+        default=URL_CACHE_SIZE,
+        help='Número máximo de URLs de ação cujos atributos são mantidos em cache. Use 0 para desativar o cache'
+    )
+
+    parser.add_argument(
+        '--counter_engine',
+        dest='counter_engine',
+        choices=COUNTER_ENGINES,
+        default=COUNTER_ENGINE,
+        help='Motor de cálculo das métricas COUNTER: object (objetos Hit) ou vector (arrays numpy)'
+    )
+
+    parser.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        type=int,
+        default=COMPUTING_JOBS,
+        help='Número de pré-tabelas (dias) calculadas simultaneamente, cada uma em um processo. '
+             'Os dicionários são carregados uma única vez e compartilhados com os processos. '
+             'Disponível apenas no modo --use_pretables e não pode ser combinado com --shards'
+    )
+
+    parser.add_argument(
+        '--hits_format',
+        dest='hits_format',
+        choices=lib_r5hits.R5_HITS_FORMATS,
+        default=R5_HITS_FORMAT,
+        help='Formato de gravação dos arquivos r5-hits: CSV, CSV comprimido (gzip ou zstd) ou colunar (col)'
+    )
+
     params = parser.parse_args()
 
+    if params.jobs > 1 and params.shards > 1:
+        parser.error('--jobs e --shards não podem ser utilizados em conjunto')
+
+    if params.shards > 1 and params.include_other_hit_types:
+        parser.error('--shards e --include_other_hit_types não podem ser utilizados em conjunto')
+
+    R5_HITS_FORMAT = params.hits_format
+    lib_file.check_compression(lib_file.get_compression_from_path(lib_r5hits.get_r5_hits_extension(R5_HITS_FORMAT)))
+    check_counter_engine(params.counter_engine)
+
     if not os.path.exists(DIR_R5_LOGS):
         os.makedirs(DIR_R5_LOGS)
 
@@ -583,11 +1101,9 @@ def main():
                         datefmt='%d/%b/%Y %H:%M:%S',
                         handlers=[file_log, console_log])
 
-    if not os.path.exists(DIR_R5_METRICS):
-        os.makedirs(DIR_R5_METRICS)
-
-    if not os.path.exists(DIR_R5_HITS):
-        os.makedirs(DIR_R5_HITS)
+    for dir_results in (DIR_R5_METRICS, DIR_R5_GROUP_METRICS, DIR_R5_HITS):
+        if not os.path.exists(os.path.join(dir_results, 'tmp')):
+            os.makedirs(os.path.join(dir_results, 'tmp'))
 
     maps = load_dictionaries(DIR_DICTIONARIES, params.dict_date)
     
@@ -599,7 +1115,9 @@ def main():
                              pid_to_format_lang=maps['pid-format-lang'],
                              pid_to_yop=maps['pid-dates'],
                              persist_on_database=params.persist_on_database,
-                             flag_include_other_hit_types=params.include_other_hit_types)
+                             flag_include_other_hit_types=params.include_other_hit_types,
+                             url_cache_size=params.url_cache_size,
+                             counter_engine=params.counter_engine)
 
     if params.use_pretables:
         logging.info('Iniciado em modo pré-tabelas')
@@ -608,31 +1126,20 @@ def main():
 
         logging.info('Há %d pré-tabela(s) para ser(em) computada(s)' % len(pretables))
 
-        for pt in pretables:
-            time_start = time()
-
-            logging.info('Extraindo dados do arquivo {}...'.format(pt))
-            hit_manager.reset()
-
-            pretable_date_value = get_date_from_file_path(pt)
+        if params.jobs > 1:
+            # Conexões abertas não devem ser compartilhadas com os processos filhos
+            ENGINE.dispose()
+            _WORKER_HIT_MANAGER = hit_manager
 
-            with open(pt, errors='ignore') as data:
-                csv_data = csv.DictReader(data, delimiter='\t')
-                run(data=csv_data,
-                    mode='pretable',
-                    hit_manager=hit_manager,
-                    db_session=SESSION_FACTORY(),
-                    collection=params.collection,
-                    result_file_prefix=pretable_date_value)
-
-            logging.info('Atualizando tabela control_date_status para %s' % pretable_date_value)
-            update_date_status(SESSION_FACTORY(),
-                               COLLECTION,
-                               pretable_date_value,
-                               DATE_STATUS_COMPUTED)
-
-            time_end = time()
-            logging.info('Durou %.2f segundos' % (time_end - time_start))
+            with multiprocessing.get_context('fork').Pool(params.jobs) as pool:
+                for _ in pool.imap_unordered(_compute_pretable_in_worker, [(pt, params.collection) for pt in pretables]):
+                    pass
+        else:
+            for pt in pretables:
+                compute_pretable(pretable_path=pt,
+                                 hit_manager=hit_manager,
+                                 collection=params.collection,
+                                 n_shards=params.shards)
 
     if params.period:
         logging.info('Iniciado em modo de banco de dados')
@@ -1,32 +1,32 @@
 import argparse
-import csv
+import collections
 import datetime
+import itertools
 import logging
 import os
 import re
+import threading
 import time
 
-from sqlalchemy import create_engine
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, and_, exists
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.pool import QueuePool
 from decimal import Decimal
 from libs.lib_database import (
     update_date_status,
     get_date_status,
     update_date_metric_status,
     compute_date_metric_status,
-    get_missing_aggregations
+    get_missing_aggregations,
 )
 from libs.lib_status import DATE_STATUS_COMPLETED, DATE_STATUS_COMPUTED
 from proc.calculate_metrics import get_date_from_file_path
 from utils.regular_expressions import REGEX_ISSN, REGEX_ARTICLE_PID
 from libs import lib_database
+from libs.lib_dimension_cache import DimensionCache
 from models.declarative import (
-    Journal,
-    JournalCollection,
-    Localization,
-    ArticleFormat,
-    ArticleLanguage,
     Article,
     ArticleMetric,
     JournalMetric,
@@ -44,28 +44,91 @@ TABLES_TO_PERSIST = os.environ.get('TABLES_TO_PERSIST', 'counter_foreign,counter
 
 DIR_R5_METRICS = os.environ.get('DIR_R5_METRICS', '/app/data/r5')
 DIR_R5_METRICS_TO_REPAIR = os.path.join(DIR_R5_METRICS, 'to_repair')
+DIMENSION_CACHE_PATH = os.environ.get('DIMENSION_CACHE_PATH', '/app/data/r5/cache/dimensions.pickle')
 MAX_YEAR = datetime.datetime.now().year + 5
 
 ENGINE = create_engine(MATOMO_DATABASE_STRING, pool_recycle=1800)
 SESSION_FACTORY = sessionmaker(bind=ENGINE)
 SESSION_BULK_LIMIT = int(os.environ.get('SESSION_BULK_LIMIT', '500'))
+PERSIST_JOBS = int(os.environ.get('PERSIST_JOBS', '1'))
+PIPELINE_DEPTH = int(os.environ.get('PIPELINE_DEPTH', '0'))
+
+# Serializa a escrita dos dados de reparo pelas threads de gravação de tabelas
+REPAIRING_DATA_LOCK = threading.Lock()
+
+# Modos de carga das métricas agregadas na tabela temporária que é mesclada à tabela de destino: comandos INSERT
+# executados linha a linha (executemany), comandos INSERT com múltiplas linhas ou LOAD DATA LOCAL INFILE (MySQL)
+PERSIST_BACKEND_ORM = 'orm'
+PERSIST_BACKEND_CORE = 'core'
+PERSIST_BACKEND_LOAD_DATA = 'load_data'
+PERSIST_BACKENDS = (PERSIST_BACKEND_ORM, PERSIST_BACKEND_CORE, PERSIST_BACKEND_LOAD_DATA)
+PERSIST_BACKEND = os.environ.get('PERSIST_BACKEND', PERSIST_BACKEND_ORM)
+
+# Colunas de métricas, na ordem dos valores agregados
+METRICS_COLUMNS = ['total_item_investigations', 'total_item_requests', 'unique_item_investigations', 'unique_item_requests']
+
+# Tabelas de métricas agregadas: nome, chaves de agregação, classe e coluna de status em control_date_status
+AGGREGATION_TABLES = [
+    ('counter_article_metric', ['idarticle', 'idlanguage', 'idformat', 'idlocalization', 'year_month_day'], ArticleMetric, 'status_counter_article_metric'),
+    ('counter_journal_metric', ['idjournal_cjm', 'idlanguage_cjm', 'idformat_cjm', 'yop', 'year_month_day'], JournalMetric, 'status_counter_journal_metric'),
+    ('sushi_journal_yop_metric', ['idjournal_sjym', 'yop', 'year_month_day'], SushiJournalYOPMetric, 'status_sushi_journal_yop_metric'),
+    ('sushi_journal_metric', ['idjournal_sjm', 'year_month_day'], SushiJournalMetric, 'status_sushi_journal_metric'),
+    ('sushi_article_metric', ['idarticle_sam', 'year_month_day'], SushiArticleMetric, 'status_sushi_article_metric'),
+]
+
+# Mapeia cada chave de agregação ao valor resolvido de que depende. Chaves distintas podem compartilhar um valor
+KEY_TO_VALUE = {'collection': 'collection',
+                'idjournal_cjm': 'idjournal',
+                'idjournal_sjm': 'idjournal',
+                'idjournal_sjym': 'idjournal',
+                'idarticle': 'idarticle',
+                'idarticle_sam': 'idarticle',
+                'idlanguage': 'idlanguage',
+                'idlanguage_cjm': 'idlanguage',
+                'idformat': 'idformat',
+                'idformat_cjm': 'idformat',
+                'idlocalization': 'idlocalization',
+                'yop': 'yop',
+                'year_month_day': 'year_month_day'}
+
+
+# Campos de uma linha de arquivo r5-metrics
+R5_METRICS_HEADER = ['pid',
+                     'format_name',
+                     'language_name',
+                     'latitude',
+                     'longitude',
+                     'year_of_publication',
+                     'issn',
+                     'year_month_day',
+                     'total_item_investigations',
+                     'total_item_requests',
+                     'unique_item_investigations',
+                     'unique_item_requests']
 
 
 class R5Metrics:
-    def __init__(self, **kargs):
+    """
+    Linha de arquivo r5-metrics com os campos já convertidos.
+    Usa __slots__, pois um arquivo pode conter milhões de linhas
+    """
+    __slots__ = ['collection'] + R5_METRICS_HEADER
+
+    def __init__(self, pid, format_name, language_name, latitude, longitude, year_of_publication, issn, year_month_day,
+                 total_item_investigations, total_item_requests, unique_item_investigations, unique_item_requests):
         self.collection = COLLECTION
-        self.pid = kargs['pid']
-        self.format_name = kargs['format_name']
-        self.language_name = kargs['language_name'] if kargs['language_name'] else 'und'
-        self.latitude = Decimal(kargs['latitude']) if kargs['latitude'] != 'NULL' else kargs['latitude']
-        self.longitude = Decimal(kargs['longitude']) if kargs['longitude'] != 'NULL' else kargs['longitude']
-        self.year_of_publication = int(kargs['year_of_publication']) if kargs['year_of_publication'].isdigit() else kargs['year_of_publication']
-        self.issn = kargs['issn']
-        self.year_month_day = kargs['year_month_day']
-        self.total_item_investigations = int(kargs['total_item_investigations'])
-        self.total_item_requests = int(kargs['total_item_requests'])
-        self.unique_item_investigations = int(kargs['unique_item_investigations'])
-        self.unique_item_requests = int(kargs['unique_item_requests'])
+        self.pid = pid
+        self.format_name = format_name
+        self.language_name = language_name if language_name else 'und'
+        self.latitude = Decimal(latitude) if latitude not in {'NULL', ''} else latitude
+        self.longitude = Decimal(longitude) if longitude not in {'NULL', ''} else longitude
+        self.year_of_publication = int(year_of_publication) if year_of_publication.isdigit() else year_of_publication
+        self.issn = issn
+        self.year_month_day = datetime.date.fromisoformat(year_month_day)
+        self.total_item_investigations = int(total_item_investigations)
+        self.total_item_requests = int(total_item_requests)
+        self.unique_item_investigations = int(unique_item_investigations)
+        self.unique_item_requests = int(unique_item_requests)
 
     def is_valid_metric(self):
         # Ignora métrica que latitude é nula
@@ -99,437 +162,362 @@ class R5Metrics:
         return True
 
     def __str__(self):
-        return '|'.join([str(getattr(self, k)) for k in self.__dict__ if not k.startswith('_')])
+        return '|'.join([str(getattr(self, k)) for k in self.__slots__])
 
 
-def sum_metrics(m1, m2):
-    """
-    Retorna uma nova lista com a soma dos elementos de duas listas de métricas
-    :param m1: Lista de métricas 1
-    :param m2: Lista de métricas 2
-    :return: Lista em que cada elemento é a soma dos elementos das listas m1 e m2
-    """
-    return [m1[x] + m2[x] for x in range(4)]
-
-
-def mount_issn_map(session):
+def read_r5_metrics(path_file_r5_metrics):
     """
-    Cria mapa de ISSN chave para ISSN valor, com base na banco de dados COUNTER
-    :param session: Sessão de conexão com banco de dados COUNTER
-    :return: Um dicionário que mapeia ISSN-Valor a ISSN-Chave da tabela counter_journal
+    Lê, de forma incremental, um arquivo r5_metrics. Cada linha é convertida uma única vez e validada
+    :param path_file_r5_metrics: Caminho de arquivo r5_metrics
+    :return: Gerador de instâncias R5Metrics válidas
     """
-    issn_map = {}
+    with open(path_file_r5_metrics) as fi:
+        for line in fi:
+            fields = line.rstrip('\n').split('|')
+            if len(fields) != len(R5_METRICS_HEADER):
+                logging.debug('Linha ignorada: %s' % line.rstrip('\n'))
+                continue
 
-    for j in session.query(Journal):
-        issns = [i for i in [j.pid_issn,
-                 j.online_issn,
-                 j.print_issn] if i != '']
-        for i in issns:
-            if i not in issn_map:
-                issn_map[i] = j.id
+            r5 = R5Metrics(*fields)
+            if r5.is_valid_metric():
+                yield r5
             else:
-                if issn_map[i] != j.id:
-                    logging.error('Base de periódicos está inconsistente (%s -> %s,  %s -> %s)'
-                                  % (i, j.id, i, issn_map[i]))
-
-    return issn_map
-
-
-def mount_localization_map(session):
-    """
-    Cria mapa de (latitude, longitude) para ID de localização na base de dados
-    :param session: Sessão de conexão com banco de dados COUNTER
-    :return: Um dicionário que mapeia (latitude, longitude) a ID de localização
-    """
-    localization_map = {}
-
-    for m in session.query(Localization):
-        localization_map[(m.latitude, m.longitude)] = m.id
-    return localization_map
+                logging.debug('Métrica ignorada: %s' % r5.__str__())
 
 
-def mount_format_map(session):
+class R5MetricsReader:
     """
-    Cria mapa de nome de formato para ID de formato na base de dados
-    :param session: Sessão de conexão com banco de dados COUNTER
-    :return: Um dicionário que mapeia nome de formato a ID de formato
+    Iterável sobre as métricas válidas de um arquivo r5_metrics. Cada iteração relê o arquivo, de modo que as linhas
+    são percorridas sem que sejam mantidas em memória
     """
-    format_map = {}
-
-    for m in session.query(ArticleFormat):
-        format_code = m.id
-        format_name = m.format
-        format_map[format_name] = format_code
+    def __init__(self, path_file_r5_metrics):
+        self.path_file_r5_metrics = path_file_r5_metrics
 
-    return format_map
+    def __iter__(self):
+        return read_r5_metrics(self.path_file_r5_metrics)
 
 
-def mount_pid_map(session):
+def collect_new_dimensions(r5_metrics, maps, new_dimensions, pending_metrics=None):
     """
-    Cria mapa de PID e COLLECTION ACRONYM a ID na base de dados
-    :param session: Sessão de conexão com banco de dados COUNTER
-    :return: Um dicionário que mapeia PID e COLLECTION a ID
+    Percorre as métricas e registra em new_dimensions os valores de dimensões que não constam nos mapas.
+    Produz as métricas cujas dimensões já constam nos mapas, que podem ser agregadas durante a própria leitura do
+    arquivo; as demais são acumuladas em pending_metrics, para serem agregadas após a atualização das dimensões.
+    Assim, cada linha do arquivo é lida e convertida uma única vez, e apenas as linhas com dimensões novas são
+    mantidas em memória
+    :param r5_metrics: iterável de instâncias R5Metrics
+    :param maps: Dicionários que mapeiam insumos a seus respectivos IDs no banco de dados
+    :param new_dimensions: Dicionário, obtido de get_empty_new_dimensions, que recebe os ISSNs, localizações, formatos
+    e idiomas novos e os atributos (ISSN, ano de publicação) de cada novo PID
+    :param pending_metrics: Lista que recebe as métricas com dimensões novas. Caso seja None, essas métricas são
+    descartadas
+    :return: Gerador das métricas cujas dimensões constam nos mapas
     """
-    pid_map = {}
-
-    for m in session.query(Article):
-        article_id = m.id
-        article_pid = m.pid
-        article_collection = m.collection
-        pid_map[(article_pid, article_collection)] = article_id
+    for r in r5_metrics:
+        is_known = True
 
-    return pid_map
+        issn = re.match(REGEX_ISSN, r.issn).string
+        if issn not in maps['issn']:
+            is_known = False
+            if issn:
+                new_dimensions['issn'][issn] = None
 
+        localization = (r.latitude, r.longitude)
+        if localization not in maps['localization']:
+            is_known = False
+            new_dimensions['localization'][localization] = None
 
-def mount_language_map(session):
-    """
-    Cria mapa de nome de idioma para ID de idioma na base de dados
-    :param session: Sessão de conexão com banco de dados COUNTER
-    :return: Um dicionário que mapeia nome de idioma a ID de idioma
-    """
-    language_map = {}
+        if r.format_name not in maps['format']:
+            is_known = False
+            new_dimensions['format'][r.format_name] = None
 
-    for m in session.query(ArticleLanguage):
-        language_id = m.id
-        language_name = m.language
-        language_map[language_name] = language_id
+        if r.language_name not in maps['language']:
+            is_known = False
+            new_dimensions['language'][r.language_name] = None
 
-    return language_map
+        # Para cada novo PID, mantém apenas a última métrica em que aparece
+        if (r.pid, COLLECTION) not in maps['pid']:
+            is_known = False
+            new_dimensions['pid'][r.pid] = (r.issn, r.year_of_publication)
 
-
-def read_r5_metrics(path_file_r5_metrics):
-    """
-    Processa arquivo r5_metrics para uma lista de instâncias R5Metrics
-    :param path_file_r5_metrics: Caminho de arquivo r5_metrics
-    :return: Lista de instâncias R5Metrics
-    """
-    r5_metrics = []
-    with open(path_file_r5_metrics) as fi:
-        csv_reader = csv.DictReader(fi, delimiter='|', fieldnames=['pid',
-                                                                   'format_name',
-                                                                   'language_name',
-                                                                   'latitude',
-                                                                   'longitude',
-                                                                   'year_of_publication',
-                                                                   'issn',
-                                                                   'year_month_day',
-                                                                   'total_item_investigations',
-                                                                   'total_item_requests',
-                                                                   'unique_item_investigations',
-                                                                   'unique_item_requests'])
-        for row in csv_reader:
-            r5 = R5Metrics(**row)
-            if r5.is_valid_metric():
-                r5_metrics.append(R5Metrics(**row))
-            else:
-                logging.debug('Métrica ignorada: %s' % r5.__str__())
-
-    return r5_metrics
+        if is_known:
+            yield r
+        elif pending_metrics is not None:
+            pending_metrics.append(r)
 
 
-def update_issn_map(r5_metrics, issn_map):
+def get_empty_new_dimensions():
     """
-    Obtém ISSNs da lista de métricas calculadas
-    :param r5_metrics: lista de instâncias R5Metric
-    :param issn_map: Dicionário que mapeia ISSNs
-    :return: Um dicionário de ISSNs faltantes a serem inseridos na base de dados
+    Obtém um dicionário vazio de dimensões novas, a ser preenchido por collect_new_dimensions.
+    Os valores são chaves de dicionários, o que mantém a ordem em que aparecem no arquivo
     """
-    new_issns = set()
-    for r in r5_metrics:
-        issn = re.match(REGEX_ISSN, r.issn).string
-        if issn and issn not in issn_map:
-            issn_map[issn] = issn
-            new_issns.add(issn)
-    return new_issns
+    return {'issn': {}, 'localization': {}, 'format': {}, 'language': {}, 'pid': {}}
 
 
-def update_issn_table(issns, db_session):
+def update_issn_table(issns, db_session, issn_map):
     """
-    Atualiza banco de dados COUNTER com novos periódicos
+    Atualiza banco de dados COUNTER com novos periódicos, inseridos em lote, e completa o mapa de ISSNs com seus IDs
     :param issns: Lista de ISSNs que não constam no banco de dados
     :param db_session: Sessão de conexão com banco de dados
+    :param issn_map: Dicionário que mapeia ISSNs
     """
     logging.info('Há %d periódico(s) a ser(em) adicionado(s) no banco de dados' % len(issns))
-    for issn in issns:
-        new_journal = Journal()
-        new_journal.pid_issn = issn
-        new_journal.print_issn = ''
-        new_journal.online_issn = issn
-
-        db_session.add(new_journal)
-        db_session.flush()
-
-        new_journal_collection = JournalCollection()
-        new_journal_collection.idjournal_jc = new_journal.id
-        new_journal_collection.collection = COLLECTION
-        new_journal_collection.title = ''
-
-        db_session.add(new_journal_collection)
-        db_session.flush()
-
+    for issn in lib_database.get_or_create_journals(db_session, issn_map, sorted(issns), COLLECTION, SESSION_BULK_LIMIT, issn_as_online_issn=True):
         logging.info('Adicionado periódico %s' % issn)
     db_session.commit()
 
 
-def update_localization_table(r5_metrics, db_session, localization_map):
+def update_localization_table(localizations, db_session, localization_map):
     """
-    Atualiza banco de dados com novas localizações, isto é, pares (latitude, longitude)
-    :param r5_metrics: lista de instâncias R5Metric
+    Atualiza banco de dados com novas localizações, isto é, pares (latitude, longitude), inseridas em lote,
+    e completa o mapa de localizações com seus IDs
+    :param localizations: iterável de pares (latitude, longitude)
     :param db_session: Sessão de conexão com banco de dados
     :param localization_map: Dicionário que mapeia (latitude, longitude) a seu respectivo código no banco de dados
     """
-    all_localizations = set([(r.latitude, r.longitude) for r in r5_metrics])
-    new_localizations = all_localizations.difference(set(localization_map.keys()))
-
-    objects = []
-    for ngeo in new_localizations:
-        latitude, longitude = ngeo
-
-        new_localization = Localization()
-        new_localization.latitude = latitude
-        new_localization.longitude = longitude
-
-        localization_map[(latitude, longitude)] = None
-        objects.append(new_localization)
-
-    db_session.bulk_save_objects(objects)
+    lib_database.get_or_create_localizations(db_session, localization_map, localizations, SESSION_BULK_LIMIT)
     db_session.commit()
 
-    # Recarrega mapa de localização
-    if new_localizations:
-        return True
 
-
-def update_format_table(r5_metrics, db_session, format_map):
+def update_format_table(formats, db_session, format_map):
     """
     Atualiza banco de dados com novos formatos
-    :param r5_metrics: lista de instâncias R5Metric
+    :param formats: iterável de formatos
     :param db_session: Sessão de conexão com banco de dados
     :param format_map: Dicionário que mapeia formato a seu respectivo código no banco de dados
     """
-    all_formats = set([r.format_name for r in r5_metrics])
-    new_formats = all_formats.difference(set(format_map.keys()))
-
-    for nfmt in new_formats:
-        new_fmt = ArticleFormat()
-        new_fmt.format = nfmt
-
+    for nfmt in lib_database.get_or_create_formats(db_session, format_map, formats, SESSION_BULK_LIMIT):
         logging.info('Adicionado formato %s' % nfmt)
-        db_session.add(new_fmt)
-        db_session.commit()
-
-        format_map[new_fmt.format] = new_fmt.id
+    db_session.commit()
 
 
-def update_language_table(r5_metrics, db_session, language_map):
+def update_language_table(languages, db_session, language_map):
     """
     Atualiza banco de dados com novos idiomas
-    :param r5_metrics: lista de instâncias R5Metric
+    :param languages: iterável de idiomas
     :param db_session: Sessão de conexão com banco de dados
     :param language_map: Dicionário que mapeia idioma a seu respectivo código no banco de dados
     """
-    all_languages = set([r.language_name for r in r5_metrics])
-    new_languages = all_languages.difference(set(language_map.keys()))
-
-    for nlang in new_languages:
-        new_language = ArticleLanguage()
-        new_language.language = nlang
-
+    for nlang in lib_database.get_or_create_languages(db_session, language_map, languages, SESSION_BULK_LIMIT):
         logging.info('Adicionado idioma %s' % nlang)
-        db_session.add(new_language)
-        db_session.commit()
-
-        language_map[new_language.language] = new_language.id
+    db_session.commit()
 
 
-def update_article_table(r5_metrics, db_session, issn_map, pid_map):
+def update_article_table(pid_to_attrs, db_session, issn_map, pid_map):
     """
-    Atualiza banco de dados com novos artigos
-    :param r5_metrics: lista de instâncias R5Metric
+    Atualiza banco de dados com novos artigos, inseridos em lote, e completa o mapa de PIDs com seus IDs
+    :param pid_to_attrs: Dicionário que mapeia cada novo PID a (ISSN, ano de publicação)
     :param db_session: Sessão de conexão com banco de dados
     :param issn_map: Dicionário que mapeia ISSNs
     :param pid_map: Dicionário que mapeia PID e COLLECTION a código no banco de dados
     """
-    all_pids = set([(r.pid, COLLECTION) for r in r5_metrics])
-    new_pids = all_pids.difference(set(pid_map.keys()))
-
-    pid_to_r5 = {}
-    for r in r5_metrics:
-        if (r.pid, COLLECTION) in new_pids:
-            pid_to_r5[(r.pid, COLLECTION)] = r
-
-    objects = []
-    for k, v in pid_to_r5.items():
-        pid, col = k
-        if (pid, col) not in pid_map:
-            new_article = Article()
-            new_article.collection = COLLECTION
-            new_article.idjournal_a = issn_map[v.issn]
-            new_article.pid = v.pid
-            new_article.yop = v.year_of_publication
-
-            pid_map[(pid, col)] = None
-            objects.append(new_article)
-
-    db_session.bulk_save_objects(objects)
+    lib_database.get_or_create_articles(db_session, pid_map, pid_to_attrs, COLLECTION, issn_map, SESSION_BULK_LIMIT)
     db_session.commit()
 
-    # Recarrega mapa de PID e COLLECTION
-    if new_pids:
-        return True
-
 
 def persist_metrics(r5_metrics, db_session, maps, key_list, table_class, collection):
     """
     Adiciona métricas no banco de dados
-    :param r5_metrics: lista de instâncias R5Metric
+    :param r5_metrics: iterável de instâncias R5Metrics
     :param db_session: Sessão de conexão com banco de dados
     :param maps: Dicionários que mapeiam insumos a seus respectivos IDs no banco de dados
     :param key_list: Lista de chaves
     :param table_class: Classe que representa a tabela a ser persistida
     :param collection: acrônimo da coleção
     """
-    # Retorna Trua caso não existam dados a serem gravados
-    if len(r5_metrics) == 0:
-        return True
-
-    objects = []
-
     # Obtém um dicionário de métricas agregadas pelos valores associados a chave de key_list
     aggregated_metrics = _aggregate_by_keylist(r5_metrics, key_list, maps)
 
-    # Data das métricas
-    year_month_day = r5_metrics[0].year_month_day
+    return persist_aggregated_metrics(aggregated_metrics, db_session, key_list, table_class, collection)
+
+
+def persist_aggregated_metrics(aggregated_metrics, db_session, key_list, table_class, collection, backend=PERSIST_BACKEND, year_month_day=None):
+    """
+    Adiciona no banco de dados métricas previamente agregadas, de forma transacional e idempotente.
+    As métricas são carregadas em uma tabela temporária, que substitui, na mesma transação, os registros da coleção no
+    dia das métricas. Assim, a carga de uma tabela em um dia é aplicada por inteiro ou não é aplicada, e pode ser
+    repetida (inclusive após o recálculo do dia) sem a remoção prévia dos registros
+    :param aggregated_metrics: Dicionário que mapeia chaves de agregação (na ordem de key_list) a métricas
+    :param db_session: Sessão de conexão com banco de dados
+    :param key_list: Lista de chaves
+    :param table_class: Classe que representa a tabela a ser persistida
+    :param collection: acrônimo da coleção
+    :param backend: modo de carga da tabela temporária (um dos valores de PERSIST_BACKENDS)
+    :param year_month_day: dia (datetime.date) cujos registros são substituídos. Caso seja None, é o dia da primeira
+    métrica, e nada é gravado quando não há métricas
+    """
+    if year_month_day is None:
+        # Retorna True caso não existam dados a serem gravados
+        if len(aggregated_metrics) == 0:
+            return True
+
+        # Data das métricas
+        year_month_day = next(iter(aggregated_metrics))[key_list.index('year_month_day')]
 
-    # Obtém último ID
     try:
-        last_id = lib_database.get_last_id(db_session, table_class)
-        next_id = 1 + last_id if last_id else 1
+        _persist_aggregated_metrics_in_staging(aggregated_metrics, db_session, key_list, table_class, collection, backend, year_month_day)
     except OperationalError:
+        db_session.rollback()
         _dump_repairing_data(year_month_day, key_list)
         return False
 
-    # Transforma dicionário de métricas em itens persistíveis no banco de dados
-    for k, v in aggregated_metrics.items():
-        row = {}
-        tii, tir, uii, uir = v
-        row.update({'id': next_id,
-                    'total_item_investigations': tii,
-                    'total_item_requests': tir,
-                    'unique_item_investigations': uii,
-                    'unique_item_requests': uir})
-
-        # É métrica agregada para artigo
-        if table_class.__tablename__ == 'counter_article_metric':
-            idarticle, idlanguage, idformat, idlocalization, year_month_day = k
-            row.update({'idarticle': idarticle,
-                        'idlanguage': idlanguage,
-                        'idformat': idformat,
-                        'idlocalization': idlocalization,
-                        'year_month_day': year_month_day})
-
-        # É métrica agregada para periódico
-        elif table_class.__tablename__ == 'counter_journal_metric':
-            idjournal_cjm, idlanguage_cjm, idformat_cjm, yop, year_month_day = k
-            row.update({'idjournal_cjm': idjournal_cjm,
-                        'idlanguage_cjm': idlanguage_cjm,
-                        'idformat_cjm': idformat_cjm,
-                        'yop': yop,
-                        'year_month_day': year_month_day,
-                        'collection': collection})
-
-        # É métrica agregada para periódico e ano de publicação na tabela SUSHI
-        elif table_class.__tablename__ == 'sushi_journal_yop_metric':
-            idjournal_sjym, yop, year_month_day = k
-            row.update({'idjournal_sjym': idjournal_sjym,
-                        'yop': yop,
-                        'year_month_day': year_month_day,
-                        'collection': collection})
-
-        # É métrica agregada para periódico na tabela SUSHI
-        elif table_class.__tablename__ == 'sushi_journal_metric':
-            idjournal_sjm, year_month_day = k
-            row.update({'idjournal_sjm': idjournal_sjm,
-                        'year_month_day': year_month_day,
-                        'collection': collection})
-
-        # É métrica agregada para artigo na tabela SUSHI
-        elif table_class.__tablename__ == 'sushi_article_metric':
-            idarticle_sam, year_month_day = k
-            row.update({'idarticle_sam': idarticle_sam,
-                        'year_month_day': year_month_day})
-
-        objects.append(row)
-        next_id += 1
-
-        if len(objects) >= SESSION_BULK_LIMIT:
-            try:
-                db_session.bulk_insert_mappings(table_class, objects)
-                db_session.commit()
-                objects = []
-            except OperationalError:
-                _dump_repairing_data(year_month_day, key_list)
-                return False
+    return True
+
+
+def _persist_aggregated_metrics_in_staging(aggregated_metrics, db_session, key_list, table_class, collection, backend, year_month_day):
+    """
+    Carrega métricas agregadas em uma tabela temporária, que substitui os registros da coleção no dia na tabela de
+    destino, em uma única transação.
+    As colunas de chave têm os mesmos nomes das chaves de agregação; tabelas com coluna collection a recebem também
+    """
+    has_collection = 'collection' in table_class.__table__.c
+    columns = list(key_list) + (['collection'] if has_collection else []) + METRICS_COLUMNS
+    extra_values = (collection,) if has_collection else ()
+
+    rows = (k + extra_values + tuple(v) for k, v in aggregated_metrics.items())
+
+    staging_table = lib_database.create_staging_table(db_session, table_class, columns)
+
+    if backend == PERSIST_BACKEND_LOAD_DATA:
+        lib_database.load_data_local_infile(db_session, staging_table, columns, rows)
+    else:
+        for batch in iter(lambda: list(itertools.islice(rows, SESSION_BULK_LIMIT)), []):
+            if backend == PERSIST_BACKEND_CORE:
+                lib_database.insert_rows(db_session, staging_table, columns, batch)
+            else:
+                db_session.execute(staging_table.insert(), [dict(zip(columns, r)) for r in batch])
+
+    lib_database.merge_staging_table(db_session,
+                                     table_class,
+                                     staging_table,
+                                     METRICS_COLUMNS,
+                                     _get_load_unit_condition(year_month_day, key_list, table_class, collection))
+
+    # A tabela temporária é removida antes do commit, pois a conexão retorna ao pool
+    lib_database.drop_staging_table(db_session, staging_table)
+    db_session.commit()
+
+
+def _get_load_unit_condition(year_month_day, key_list, table_class, collection):
+    """
+    Obtém a condição que seleciona, na tabela de destino, os registros da coleção em um dia.
+    Tabelas de métricas de artigos não têm coluna collection; nelas, a coleção é a do artigo
+    """
+    table = table_class.__table__
+
+    if 'collection' in table.c:
+        collection_condition = table.c.collection == collection
+    else:
+        article_column = table.c[[k for k in key_list if KEY_TO_VALUE[k] == 'idarticle'][0]]
+        collection_condition = exists().where(and_(Article.id == article_column, Article.collection == collection))
+
+    return and_(table.c.year_month_day == year_month_day, collection_condition)
+
+
+def persist_aggregation_table(aggregated_metrics, aggregation_table, year_month_day, backend=PERSIST_BACKEND):
+    """
+    Grava as métricas agregadas de uma tabela em uma sessão (e conexão) própria e registra, em seguida, o status da
+    tabela em control_date_status. Uma falha é encaminhada aos dados de reparo e não interrompe as demais tabelas,
+    o que permite que várias tabelas sejam gravadas simultaneamente
+    :param aggregated_metrics: Dicionário que mapeia chaves de agregação (na ordem de key_list) a métricas
+    :param aggregation_table: Tupla (nome da tabela, lista de chaves, classe da tabela, coluna de status) de AGGREGATION_TABLES
+    :param year_month_day: data das métricas
+    :param backend: modo de gravação (um dos valores de PERSIST_BACKENDS)
+    :return: True caso as métricas tenham sido gravadas e False caso contrário
+    """
+    table_name, key_list, table_class, status_column = aggregation_table
+    time_start = time.time()
+
+    db_session = SESSION_FACTORY()
     try:
-        db_session.bulk_insert_mappings(table_class, objects)
-        db_session.commit()
-    except OperationalError:
+        status = persist_aggregated_metrics(aggregated_metrics, db_session, key_list, table_class, COLLECTION, backend, datetime.date.fromisoformat(year_month_day))
+    except SQLAlchemyError as e:
+        logging.error('Falha ao gravar tabela %s: %s' % (table_name, e))
+        db_session.rollback()
         _dump_repairing_data(year_month_day, key_list)
-        return False
+        status = False
+    finally:
+        db_session.close()
 
-    return True
+    db_session = SESSION_FACTORY()
+    try:
+        update_date_metric_status(db_session, COLLECTION, year_month_day, status_column, status)
+    finally:
+        db_session.close()
+
+    logging.info('Tabela %s gravada em %.2f segundos (status: %s)' % (table_name, time.time() - time_start, status))
+    return status
 
 
 def _aggregate_by_keylist(r5_metrics, key_list, maps):
     """
     Agrega métricas de acordo com uma lista de chaves de agregação
 
-    :param r5_metrics: Lista de métricas do tipo R5Metric
+    :param r5_metrics: Iterável de métricas do tipo R5Metrics
     :param key_list:  Lista de chaves agregadoras
     :param maps: Dicionários que mapeiam insumos a seus respectivos IDs no banco de dados
     :return: Um dicionário que mapeia as métricas a suas respectivas chaves
     """
-    aggregated_metrics = {}
+    return _aggregate_by_keylists(r5_metrics, [key_list], maps)[0]
+
+
+def _aggregate_by_keylists(r5_metrics, key_lists, maps, aggregations=None):
+    """
+    Agrega métricas, em uma única passagem, de acordo com várias listas de chaves de agregação.
+    Para cada métrica, os IDs necessários às chaves são obtidos uma única vez, em uma tupla de valores resolvidos
+
+    :param r5_metrics: Iterável de métricas do tipo R5Metrics
+    :param key_lists: Lista de listas de chaves agregadoras
+    :param maps: Dicionários que mapeiam insumos a seus respectivos IDs no banco de dados
+    :param aggregations: Agregações (uma por lista de chaves) a serem completadas. Caso seja None, são criadas
+    :return: Uma lista de dicionários (um por lista de chaves) que mapeiam as métricas a suas respectivas chaves
+    """
+    value_getters = {'collection': lambda r: COLLECTION,
+                     'idjournal': lambda r: maps['issn'][r.issn],
+                     'idarticle': lambda r: maps['pid'][(r.pid, COLLECTION)],
+                     'idlanguage': lambda r: maps['language'][r.language_name],
+                     'idformat': lambda r: maps['format'][r.format_name],
+                     'idlocalization': lambda r: maps['localization'][(r.latitude, r.longitude)],
+                     'yop': lambda r: r.year_of_publication,
+                     'year_month_day': lambda r: r.year_month_day}
+
+    # Resolve apenas os valores utilizados por alguma das listas de chaves
+    values = sorted({KEY_TO_VALUE[k] for key_list in key_lists for k in key_list})
+    getters = [value_getters[v] for v in values]
+    key_lists_indexes = [[values.index(KEY_TO_VALUE[k]) for k in key_list] for key_list in key_lists]
+
+    if aggregations is None:
+        aggregations = [{} for _ in key_lists]
 
     for r in r5_metrics:
-        attrs = {'collection': COLLECTION,
-                 'idjournal_cjm': maps['issn'][r.issn],
-                 'idjournal_sjm': maps['issn'][r.issn],
-                 'idjournal_sjym': maps['issn'][r.issn],
-                 'idarticle': maps['pid'][(r.pid, COLLECTION)],
-                 'idarticle_sam': maps['pid'][(r.pid, COLLECTION)],
-                 'idlanguage': maps['language'][r.language_name],
-                 'idlanguage_cjm': maps['language'][r.language_name],
-                 'idformat': maps['format'][r.format_name],
-                 'idformat_cjm': maps['format'][r.format_name],
-                 'idlocalization': maps['localization'][(r.latitude, r.longitude)],
-                 'yop': r.year_of_publication,
-                 'year_month_day': r.year_month_day}
-
-        # Monta chave de agregação de métricas
-        key = tuple(attrs[k] for k in key_list)
-
-        # Adiciona métricas no dicionário
-        if key not in aggregated_metrics:
-            aggregated_metrics[key] = [r.total_item_investigations,
-                                       r.total_item_requests,
-                                       r.unique_item_investigations,
-                                       r.unique_item_requests]
-        else:
-            # Caso key já esteja no dicionário de métricas, faz a somatória dos valores
-            aggregated_metrics[key] = sum_metrics(aggregated_metrics[key], [r.total_item_investigations,
-                                                                            r.total_item_requests,
-                                                                            r.unique_item_investigations,
-                                                                            r.unique_item_requests])
-    return aggregated_metrics
+        resolved = [g(r) for g in getters]
+        metrics = (r.total_item_investigations,
+                   r.total_item_requests,
+                   r.unique_item_investigations,
+                   r.unique_item_requests)
+
+        for aggregated_metrics, indexes in zip(aggregations, key_lists_indexes):
+            # Monta chave de agregação de métricas
+            key = tuple([resolved[i] for i in indexes])
+
+            # Adiciona métricas no dicionário ou, caso key já esteja no dicionário, faz a somatória dos valores
+            key_metrics = aggregated_metrics.get(key)
+            if key_metrics is None:
+                aggregated_metrics[key] = list(metrics)
+            else:
+                for i in range(4):
+                    key_metrics[i] += metrics[i]
+
+    return aggregations
 
 
 def _dump_repairing_data(year_month_day, keys):
     logging.error('It was not possible to persist metrics. Dumping repairing data %s' % year_month_day)
     repair_file_path = os.path.join(DIR_R5_METRICS_TO_REPAIR,
                                     COLLECTION + '.csv')
-    with open(repair_file_path, 'a') as file:
-        file.write('\t'.join([year_month_day] + keys) + '\n')
+    # Tabelas podem ser gravadas simultaneamente, em threads distintas
+    with REPAIRING_DATA_LOCK:
+        with open(repair_file_path, 'a') as file:
+            file.write('\t'.join([str(year_month_day)] + keys) + '\n')
 
 
 def check_repairing_files():
@@ -568,19 +556,11 @@ def check_repairing_files():
 
                 table = keys_to_table.get(keys, '')
 
+                # A gravação de cada tabela é transacional e idempotente. Uma carga que falhou não foi aplicada, e
+                # basta marcá-la como pendente para que seja repetida, sem remover os registros da data
                 if table:
-                    if table in {'sushi_journal_metric', 'sushi_journal_yop_metric', 'counter_journal_metric'}:
-                        raw_query = 'DELETE FROM {0} WHERE collection = "{1}" AND year_month_day = "{2}";'.format(table, collection, date)
-                    elif table == 'sushi_article_metric':
-                        raw_query = 'DELETE FROM {0} WHERE year_month_day = "{1}" AND idarticle_sam IN (SELECT DISTINCT id FROM counter_article WHERE collection = "{2}");'.format(table, date, collection)
-                    elif table == 'counter_article_metric':
-                        raw_query = 'DELETE FROM {0} WHERE year_month_day = "{1}" AND idarticle IN (SELECT DISTINCT id FROM counter_article WHERE collection = "{2}");'.format(table, date, collection)
-
                     try:
-                        logging.info('Executing query to fix (%s, %s, %s)...' % (collection, table, date))
-                        ENGINE.execute(raw_query)
-
-                        logging.info('Fixing control_date_status table...')
+                        logging.info('Fixing control_date_status table (%s, %s, %s)...' % (collection, table, date))
                         raw_query_cds = 'UPDATE control_date_status SET status_{0} = 0, status = 4 WHERE collection = "{1}" and date = "{2}";'.format(table, collection, date)
                         ENGINE.execute(raw_query_cds)
                     except:
@@ -614,18 +594,163 @@ def get_files_to_persist(dir_r5_metrics, db_session):
     return files_to_persist
 
 
-def need_to_update_memory_data(target_tables):
-    for t in ['counter_article_metric',
-              'counter_journal_metric',
-              'sushi_article_metric',
-              'sushi_journal_metric',
-              'sushi_journal_yop_metric']:
-        if t in target_tables:
-            return True
-    return False
+def read_file_to_persist(path_file_r5_metrics, params, materialize=False):
+    """
+    Etapa de leitura: obtém a data, as tabelas a serem persistidas e as métricas de um arquivo r5-metrics
+    :param path_file_r5_metrics: caminho do arquivo r5-metrics
+    :param params: parâmetros de linha de comando
+    :param materialize: lê e converte o arquivo uma única vez, em uma lista. Caso contrário, o arquivo é relido a cada
+    iteração
+    :return: uma tupla (data, lista de tabelas, métricas)
+    """
+    logging.info('Processando arquivo %s' % path_file_r5_metrics)
+    f_date = get_date_from_file_path(path_file_r5_metrics)
+
+    # Lê arquivo r5
+    logging.info('Convertendo arquivo para R5Metric...')
+    r5_metrics = R5MetricsReader(path_file_r5_metrics)
+    if materialize:
+        r5_metrics = list(r5_metrics)
+
+    # Obtém os nomes das tabelas a serem persistidas
+    if params.auto:
+        target_tables = ['counter_foreign']
+        target_tables.extend(get_missing_aggregations(SESSION_FACTORY(), COLLECTION, f_date))
+    else:
+        target_tables = params.tables.split(',')
+
+    logging.info('Tabelas a serem persistidas em %s: (%s)' % (f_date, ','.join(target_tables)))
+
+    return f_date, target_tables, r5_metrics
+
+
+def prepare_file_to_persist(r5_metrics, target_tables, maps, params):
+    """
+    Etapa de preparação: atualiza as tabelas de periódicos, localizações, formatos, idiomas e artigos e agrega as
+    métricas de um arquivo. Deve ser executada na ordem dos arquivos, pois completa os mapas de dimensões.
+    As métricas são percorridas uma única vez: as dimensões novas são coletadas durante a agregação, e apenas as
+    métricas que dependem delas são agregadas depois da atualização das tabelas
+    :param r5_metrics: iterável de instâncias R5Metrics
+    :param target_tables: tabelas a serem persistidas
+    :param maps: Dicionários que mapeiam insumos a seus respectivos IDs no banco de dados
+    :param params: parâmetros de linha de comando
+    :return: uma tupla (tabelas de agregação, lista de métricas agregadas de cada tabela)
+    """
+    aggregation_tables = [t for t in AGGREGATION_TABLES if t[0] in target_tables]
+    if params.ignore_counter_metric_tables:
+        aggregation_tables = [t for t in aggregation_tables if t[0] not in {'counter_article_metric', 'counter_journal_metric'}]
+    key_lists = [t[1] for t in aggregation_tables]
+
+    if aggregation_tables:
+        logging.info('Agregando métricas para %s...' % ','.join([t[0] for t in aggregation_tables]))
+
+    if 'counter_foreign' not in target_tables:
+        aggregations = _aggregate_by_keylists(r5_metrics, key_lists, maps) if aggregation_tables else []
+        return aggregation_tables, aggregations
+
+    # Obtém as dimensões que não existem no banco de dados e agrega as métricas que não dependem delas
+    logging.info('Obtendo ISSNs, localizações, formatos, idiomas e artigos...')
+    new_dimensions = get_empty_new_dimensions()
+    pending_metrics = [] if aggregation_tables else None
+    aggregations = _aggregate_by_keylists(collect_new_dimensions(r5_metrics, maps, new_dimensions, pending_metrics), key_lists, maps)
+
+    # Atualiza banco de dados com ISSNs não encontrados
+    if new_dimensions['issn']:
+        logging.info('Atualizando lista de ISSNs...')
+        update_issn_table(new_dimensions['issn'], SESSION_FACTORY(), maps['issn'])
+
+    # Atualiza lista de pares (Latitude, Longitude) no banco de dados
+    logging.info('Atualizando lista de pares (latitude, longitude)...')
+    update_localization_table(new_dimensions['localization'], SESSION_FACTORY(), maps['localization'])
+
+    # Atualiza formatos de artigo no banco de dados
+    logging.info('Atualizando formatos...')
+    update_format_table(new_dimensions['format'], SESSION_FACTORY(), maps['format'])
+
+    # Atualiza idiomas de artigo no banco de dados
+    logging.info('Atualizando idiomas...')
+    update_language_table(new_dimensions['language'], SESSION_FACTORY(), maps['language'])
+
+    # Atualiza artigos no banco de dados
+    logging.info('Atualizando artigos...')
+    update_article_table(new_dimensions['pid'], SESSION_FACTORY(), maps['issn'], maps['pid'])
+
+    if pending_metrics:
+        logging.info('Agregando %d métrica(s) com dimensões novas...' % len(pending_metrics))
+        _aggregate_by_keylists(pending_metrics, key_lists, maps, aggregations)
+
+    return aggregation_tables, aggregations
+
+
+def persist_file(f_date, aggregation_tables, aggregations, params):
+    """
+    Etapa de gravação: grava as métricas agregadas de um arquivo e atualiza o status da data
+    :param f_date: data das métricas
+    :param aggregation_tables: tabelas de agregação, como em AGGREGATION_TABLES
+    :param aggregations: lista de métricas agregadas de cada tabela
+    :param params: parâmetros de linha de comando
+    """
+    if aggregation_tables:
+        # Cada tabela é gravada por uma thread, com conexão própria, que registra o seu status ao terminar
+        logging.info('Adicionando métricas agregadas de %s...' % f_date)
+        with ThreadPoolExecutor(max_workers=max(1, params.jobs)) as executor:
+            list(executor.map(lambda t, a: persist_aggregation_table(a, t, f_date, params.persist_backend), aggregation_tables, aggregations))
+
+    date_status_value = compute_date_metric_status(SESSION_FACTORY(),
+                                                   COLLECTION,
+                                                   f_date)
+
+    if date_status_value == DATE_STATUS_COMPLETED:
+        logging.info('Atualizando tabela control_date_status para %s' % f_date)
+        update_date_status(SESSION_FACTORY(),
+                           COLLECTION,
+                           f_date,
+                           DATE_STATUS_COMPLETED)
+    else:
+        logging.info('Data %s ainda contém agregações a serem calculadas' % f_date)
+
+
+def persist_files_in_pipeline(files_r5, maps, params):
+    """
+    Persiste arquivos r5-metrics em três etapas sobrepostas: a leitura dos próximos arquivos (em uma thread), a
+    preparação do arquivo corrente (na thread principal) e a gravação dos arquivos anteriores (em outra thread).
+    Cada etapa processa os arquivos na ordem, e no máximo params.pipeline_depth arquivos aguardam em cada fila entre
+    etapas, o que limita a memória utilizada. Uma falha em qualquer etapa interrompe o processamento
+    :param files_r5: lista ordenada de caminhos de arquivos r5-metrics
+    :param maps: Dicionários que mapeiam insumos a seus respectivos IDs no banco de dados
+    :param params: parâmetros de linha de comando
+    """
+    files_iter = iter(files_r5)
+
+    with ThreadPoolExecutor(max_workers=1) as reader, ThreadPoolExecutor(max_workers=1) as writer:
+        reads = collections.deque([reader.submit(read_file_to_persist, f, params, True) for f in itertools.islice(files_iter, params.pipeline_depth)])
+        writes = collections.deque()
+
+        while reads:
+            time_start = time.time()
+            f_date, target_tables, r5_metrics = reads.popleft().result()
+
+            next_file = next(files_iter, None)
+            if next_file:
+                reads.append(reader.submit(read_file_to_persist, next_file, params, True))
+
+            aggregation_tables, aggregations = prepare_file_to_persist(r5_metrics, target_tables, maps, params)
+            del r5_metrics
+
+            # Aguarda a gravação dos arquivos mais antigos, caso a fila de gravação esteja cheia
+            while len(writes) >= params.pipeline_depth:
+                writes.popleft().result()
+
+            writes.append(writer.submit(persist_file, f_date, aggregation_tables, aggregations, params))
+            logging.info('Preparação de %s concluída em %.2f segundos' % (f_date, time.time() - time_start))
+
+        while writes:
+            writes.popleft().result()
 
 
 def main():
+    global ENGINE, SESSION_FACTORY
+
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
@@ -668,8 +793,51 @@ def main():
         help='Não persiste dados nas tabelas counter_article_metric e counter_journal_metric'
     )
 
+    parser.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        type=int,
+        default=PERSIST_JOBS,
+        help='Número de tabelas de métricas agregadas gravadas simultaneamente, cada uma em uma thread e conexão próprias'
+    )
+
+    parser.add_argument(
+        '--persist_backend',
+        dest='persist_backend',
+        choices=PERSIST_BACKENDS,
+        default=PERSIST_BACKEND,
+        help='Modo de carga das métricas agregadas na tabela temporária: orm (padrão, INSERT linha a linha), '
+             'core (INSERT com múltiplas linhas) ou load_data (LOAD DATA LOCAL INFILE, apenas MySQL)'
+    )
+
+    parser.add_argument(
+        '-p', '--pipeline_depth',
+        dest='pipeline_depth',
+        type=int,
+        default=PIPELINE_DEPTH,
+        help='Processa os arquivos em pipeline, sobrepondo a leitura e a agregação de um arquivo à gravação dos '
+             'anteriores, com até pipeline_depth arquivos em espera entre etapas. O valor 0 (padrão) processa os '
+             'arquivos um a um'
+    )
+
     params = parser.parse_args()
 
+    if params.persist_backend == PERSIST_BACKEND_LOAD_DATA and ENGINE.dialect.name != 'mysql':
+        parser.error('--persist_backend load_data não suportado para o banco de dados %s' % ENGINE.dialect.name)
+
+    engine_args = {}
+    if params.persist_backend == PERSIST_BACKEND_LOAD_DATA:
+        # Permite o envio de arquivos locais ao servidor MySQL
+        engine_args['connect_args'] = {'local_infile': 1}
+
+    if isinstance(ENGINE.pool, QueuePool) and params.jobs > ENGINE.pool.size():
+        # Garante uma conexão do pool para cada tabela gravada simultaneamente
+        engine_args['pool_size'] = params.jobs
+
+    if engine_args:
+        ENGINE = create_engine(MATOMO_DATABASE_STRING, pool_recycle=1800, **engine_args)
+        SESSION_FACTORY = sessionmaker(bind=ENGINE)
+
     if not os.path.exists(DIR_R5_METRICS_TO_REPAIR):
         os.makedirs(DIR_R5_METRICS_TO_REPAIR)
 
@@ -680,114 +848,31 @@ def main():
     logging.info('Checking repairing files...')
     check_repairing_files()
 
-    # Obtém dicionários que mapeia ISSN a ISSN-Chave, Idioma a ID e Formato a ID
-    issn_map = mount_issn_map(SESSION_FACTORY())
-    localization_map = mount_localization_map(SESSION_FACTORY())
-    language_map = mount_language_map(SESSION_FACTORY())
-    format_map = mount_format_map(SESSION_FACTORY())
-    pid_map = mount_pid_map(SESSION_FACTORY())
+    # Obtém dicionários que mapeia ISSN a ISSN-Chave, Idioma a ID e Formato a ID.
+    # Os mapas são lidos do cache em disco e completados apenas com os registros inseridos desde a última execução
+    logging.info('Carregando cache de dimensões...')
+    dimension_cache = DimensionCache(DIMENSION_CACHE_PATH)
+    dimension_cache.load()
+    maps = dimension_cache.refresh(SESSION_FACTORY())
+    dimension_cache.save()
 
     # Obtém lista de arquivos r5_metrics a serem lidos
     files_r5 = sorted(get_files_to_persist(params.dir_r5_metrics, SESSION_FACTORY()))
     logging.info('Há %d arquivo(s) para ser(em) processado(s)' % len(files_r5))
 
-    for f in files_r5:
-        time_start = time.time()
-        logging.info('Processando arquivo %s' % f)
-
-        f_date = get_date_from_file_path(f)
-
-        # Lê arquivo r5
-        logging.info('Convertendo arquivo para R5Metric...')
-        r5_metrics = read_r5_metrics(f)
-
-        # Obtém os nomes das tabelas a serem persistidas
-        if params.auto:
-            target_tables = ['counter_foreign']
-            target_tables.extend(get_missing_aggregations(SESSION_FACTORY(), COLLECTION, f_date))
-        else:
-            target_tables = params.tables.split(',')
-
-        logging.info('Tabelas a serem persistidas: (%s)' % ','.join(target_tables))
-
-        # Obtém lista de ISSNs que não existem no banco de dados
-        if 'counter_foreign' in target_tables:
-            logging.info('Obtendo ISSNs...')
-            new_issns = update_issn_map(r5_metrics, issn_map)
-
-            # Atualiza banco de dados com ISSNs não encontrados
-            if new_issns:
-                logging.info('Atualizando lista de ISSNs...')
-                update_issn_table(new_issns, SESSION_FACTORY())
-                issn_map = mount_issn_map(SESSION_FACTORY())
-
-            # Atualiza lista de pares (Latitude, Longitude) no banco de dados
-            logging.info('Atualizando lista de pares (latitude, longitude)...')
-            exist_new_localizations = update_localization_table(r5_metrics, SESSION_FACTORY(), localization_map)
-
-            if exist_new_localizations and need_to_update_memory_data(target_tables):
-                logging.info('Recarregando dados de localização')
-                localization_map = mount_localization_map(SESSION_FACTORY())
-
-            # Atualiza formatos de artigo no banco de dados
-            logging.info('Atualizando formatos...')
-            update_format_table(r5_metrics, SESSION_FACTORY(), format_map)
-
-            # Atualiza idiomas de artigo no banco de dados
-            logging.info('Atualizando idiomas...')
-            update_language_table(r5_metrics, SESSION_FACTORY(), language_map)
-
-            # Atualiza artigos no banco de dados
-            logging.info('Atualizando artigos...')
-            exist_new_pids = update_article_table(r5_metrics, SESSION_FACTORY(), issn_map, pid_map)
-
-            if exist_new_pids and need_to_update_memory_data(target_tables):
-                logging.info('Recarregando dados de PID e COLLECTION')
-                pid_map = mount_pid_map(SESSION_FACTORY())
-
-        maps = {'pid': pid_map, 'language': language_map, 'format': format_map, 'localization': localization_map, 'issn': issn_map}
-
-        if 'counter_article_metric' in target_tables and not params.ignore_counter_metric_tables:
-            logging.info('Adicionando métricas agregadas para counter_article...')
-            keys_counter_article = ['idarticle', 'idlanguage', 'idformat', 'idlocalization', 'year_month_day']
-            cam_status = persist_metrics(r5_metrics, SESSION_FACTORY(), maps, keys_counter_article, ArticleMetric, COLLECTION)
-            update_date_metric_status(SESSION_FACTORY(), COLLECTION, f_date, 'status_counter_article_metric', cam_status)
-
-        if 'counter_journal_metric' in target_tables and not params.ignore_counter_metric_tables:
-            logging.info('Adicionando métricas agregadas para counter_journal...')
-            keys_counter_journal = ['idjournal_cjm', 'idlanguage_cjm', 'idformat_cjm', 'yop', 'year_month_day']
-            cjm_status = persist_metrics(r5_metrics, SESSION_FACTORY(), maps, keys_counter_journal, JournalMetric, COLLECTION)
-            update_date_metric_status(SESSION_FACTORY(), COLLECTION, f_date, 'status_counter_journal_metric', cjm_status)
-
-        if 'sushi_journal_yop_metric' in target_tables:
-            logging.info('Adicionando métricas agregadas para sushi_journal_yop...')
-            keys_sushi_journal_yop = ['idjournal_sjym', 'yop', 'year_month_day']
-            sjym_status = persist_metrics(r5_metrics, SESSION_FACTORY(), maps, keys_sushi_journal_yop, SushiJournalYOPMetric, COLLECTION)
-            update_date_metric_status(SESSION_FACTORY(), COLLECTION, f_date, 'status_sushi_journal_yop_metric', sjym_status)
-
-        if 'sushi_journal_metric' in target_tables:
-            logging.info('Adicionando métricas agregadas para sushi_journal...')
-            keys_sushi_journal = ['idjournal_sjm', 'year_month_day']
-            sjm_status = persist_metrics(r5_metrics, SESSION_FACTORY(), maps, keys_sushi_journal, SushiJournalMetric, COLLECTION)
-            update_date_metric_status(SESSION_FACTORY(), COLLECTION, f_date, 'status_sushi_journal_metric', sjm_status)
-
-        if 'sushi_article_metric' in target_tables:
-            logging.info('Adicionando métricas agregadas para sushi_article...')
-            keys_sushi_article = ['idarticle_sam', 'year_month_day']
-            sam_status = persist_metrics(r5_metrics, SESSION_FACTORY(), maps, keys_sushi_article, SushiArticleMetric, COLLECTION)
-            update_date_metric_status(SESSION_FACTORY(), COLLECTION, f_date, 'status_sushi_article_metric', sam_status)
-
-        date_status_value = compute_date_metric_status(SESSION_FACTORY(),
-                                                       COLLECTION,
-                                                       f_date)
-
-        if date_status_value == DATE_STATUS_COMPLETED:
-            logging.info('Atualizando tabela control_date_status para %s' % f_date)
-            update_date_status(SESSION_FACTORY(),
-                               COLLECTION,
-                               f_date,
-                               DATE_STATUS_COMPLETED)
-        else:
-            logging.info('Data %s ainda contém agregações a serem calculadas' % f_date)
-
-        logging.info('Tempo total: %.2f segundos' % (time.time() - time_start))
+    if params.pipeline_depth > 0:
+        logging.info('Processando arquivos em pipeline (profundidade %d)' % params.pipeline_depth)
+        persist_files_in_pipeline(files_r5, maps, params)
+    else:
+        for f in files_r5:
+            time_start = time.time()
+
+            f_date, target_tables, r5_metrics = read_file_to_persist(f, params)
+            aggregation_tables, aggregations = prepare_file_to_persist(r5_metrics, target_tables, maps, params)
+            persist_file(f_date, aggregation_tables, aggregations, params)
+
+            logging.info('Tempo total: %.2f segundos' % (time.time() - time_start))
+
+    # Os mapas já contêm os registros inseridos. A atualização apenas avança os últimos IDs lidos antes da gravação
+    dimension_cache.refresh(SESSION_FACTORY())
+    dimension_cache.save()
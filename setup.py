@@ -24,6 +24,11 @@ install_requires = [
     'xylose==1.35.4',
 ]
 
+extras_require = {
+    'zstd': ['zstandard'],
+    'vector': ['numpy'],
+}
+
 
 setup(
     name="scielo-usage-counter",
@@ -37,6 +42,7 @@ setup(
     maintainer_email='rafael.pezzuto@gmail.com',
     packages=find_packages(),
     install_requires=install_requires,
+    extras_require=extras_require,
     entry_points="""
     [console_scripts]
     initialize_database=proc.initialize_database:main